@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+X API / Discord のローカル代替サーバーを使ったエンドツーエンドのベンチマーク
+
+実際の fetch_and_forward を代替サーバーに向けて実行し、ツイート数ごと（既定: 10 / 100 / 1000件）に
+スループット（tweets/sec）・Webhook呼び出し数・1ツイートあたりの配信遅延（p50 / p99）・実行時間を計測する。
+結果は results/e2e.jsonl に追記し、同じ設定の前回の結果との差分を表示する。
+
+DISCORD_PACK_MODE や DELIVERY_MAX_WORKERS などのボットの設定は、通常どおり環境変数で指定する。
+
+使い方:
+    python benchmarks/e2e.py [--bursts 10 100 1000] [--x-latency 0.05] [--discord-latency 0.02]
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_servers import FakeDiscordServer, FakeXServer
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT / "src"
+RESULTS_FILE = Path(__file__).resolve().parent / "results" / "e2e.jsonl"
+# レート制限（429）で延期された場合に再実行する上限回数
+MAX_RUNS_PER_BURST = 100
+# 結果に記録するボットの設定
+RECORDED_SETTINGS = (
+    "DISCORD_PACK_MODE",
+    "DISCORD_STRICT_ORDER",
+    "DELIVERY_MAX_WORKERS",
+    "HTTP_POOL_SIZE",
+    "DEDUP_MAX_IDS",
+)
+
+
+def percentile(values, pct):
+    """最近傍法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def configure_environment(x_server, discord_server, state_dir, max_tweets, page_size):
+    """ボットを代替サーバーと一時ディレクトリに向ける（config の読み込み前に呼ぶ）"""
+    os.environ.update(
+        {
+            "X_BEARER_TOKEN": "benchmark",
+            "DISCORD_WEBHOOK_URL": discord_server.webhook_url,
+            "QUERY": "#浅井恋乃未",
+            "QUERIES": "",
+            "QUERIES_FILE": "",
+            "X_SEARCH_URL": x_server.search_url,
+            "SINCE_ID_FILE": str(Path(state_dir) / "since_id.txt"),
+            "STATE_DIR": str(state_dir),
+            "X_MAX_TWEETS": str(max_tweets),
+            "X_MAX_PAGES": str(math.ceil(max_tweets / page_size) + 1),
+        }
+    )
+    os.environ.setdefault("OUTBOX_DIR", str(state_dir))
+    os.environ.pop("K_SERVICE", None)
+
+
+def reset_state(state_dir):
+    """前回のバーストの since_id・配信済みID・アウトボックスを消去する"""
+    for path in Path(state_dir).iterdir():
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+
+def run_burst(bot, x_server, discord_server, state_dir, count):
+    """count 件のツイートを1回の実行（429 で延期された場合は再実行）で転送し、計測結果を返す"""
+    reset_state(state_dir)
+    # 前回の実行の後に count 件が投稿された状況にする（since_id がない初回実行は最新の1ページのみ取得するため）
+    since_id = bot.snowflake.id_for_time(time.time() - 60)
+    bot.save_since_id(since_id)
+    x_server.load_burst(count, start_id=int(since_id) + 1)
+    discord_server.reset()
+
+    start = time.perf_counter()
+    runs = 0
+    for runs in range(1, MAX_RUNS_PER_BURST + 1):  # noqa: B007
+        # 代替サーバーの429は再開時刻が現在時刻のため、延期されてもすぐに再実行できる
+        if bot.fetch_and_forward()["status"] != "deferred":
+            break
+    wall = time.perf_counter() - start
+
+    delivered_ids = [tweet_id for tweet_id, _received_at in discord_server.delivered]
+    latencies = [received_at - start for _tweet_id, received_at in discord_server.delivered]
+    expected = {tweet["id"] for tweet in x_server.tweets}
+    return {
+        "tweets": count,
+        "delivered": len(set(delivered_ids) & expected),
+        "duplicates": len(delivered_ids) - len(set(delivered_ids)),
+        "runs": runs,
+        "wall_ms": round(wall * 1000, 1),
+        "tweets_per_sec": round(len(delivered_ids) / wall, 1) if wall else None,
+        "webhook_calls": discord_server.calls,
+        "discord_429": discord_server.rate_limited,
+        "x_requests": x_server.requests,
+        "x_429": x_server.rate_limited,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def git_commit():
+    """計測したコミット（取得できない場合は None）"""
+    try:
+        proc = subprocess.run(  # noqa: S603  # nosec B603 B607
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+
+def load_previous(output, settings):
+    """同じ設定で計測した前回の結果"""
+    if not output.exists():
+        return None
+    previous = None
+    for line in output.read_text(encoding="utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("settings") == settings:
+            previous = record
+    return previous
+
+
+def report(results, previous, threshold):
+    """結果を表示し、前回よりスループットが threshold 以上下がったバーストがあれば True を返す"""
+    previous_by_size = {r["tweets"]: r for r in (previous or {}).get("results", [])}
+    regressed = False
+    sys.stdout.write(
+        f"\n{'tweets':>7} {'tweets/s':>9} {'wall ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'webhooks':>9} {'X reqs':>7} {'429 X/D':>8}\n"
+    )
+    for r in results:
+        line = (
+            f"{r['tweets']:>7} {r['tweets_per_sec']:>9} {r['wall_ms']:>9} {r['latency_p50_ms']:>8} "
+            f"{r['latency_p99_ms']:>8} {r['webhook_calls']:>9} {r['x_requests']:>7} {r['x_429']:>4}/{r['discord_429']:<3}"
+        )
+        before = previous_by_size.get(r["tweets"])
+        if before and before.get("tweets_per_sec") and r["tweets_per_sec"] is not None:
+            change = r["tweets_per_sec"] / before["tweets_per_sec"] - 1
+            line += f"  前回比 {change:+.0%}"
+            if change < -threshold:
+                line += " REGRESSION"
+                regressed = True
+        if r["delivered"] != r["tweets"] or r["duplicates"]:
+            line += f"  配信漏れ {r['tweets'] - r['delivered']}件 / 重複 {r['duplicates']}件"
+            regressed = True
+        sys.stdout.write(line + "\n")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル代替サーバーを使ったエンドツーエンドのベンチマーク")
+    parser.add_argument("--bursts", type=int, nargs="+", default=[10, 100, 1000], help="1回の実行で転送するツイート数")
+    parser.add_argument("--x-latency", type=float, default=0.05, help="X API の応答遅延（秒）")
+    parser.add_argument("--x-page-size", type=int, default=100, help="X API の1ページの件数")
+    parser.add_argument("--x-429-rate", type=float, default=0.0, help="X API が429を返す確率（0〜1）")
+    parser.add_argument("--discord-latency", type=float, default=0.02, help="Discord の応答遅延（秒）")
+    parser.add_argument("--discord-limit", type=int, default=0, help="Discord のウィンドウあたりの上限件数（0 で無制限）")
+    parser.add_argument("--discord-window", type=float, default=1.0, help="Discord のレート制限ウィンドウ（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="429 の発生に使う乱数のシード")
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE, help="結果を追記するJSON Linesファイル")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回帰とみなすスループットの低下率")
+    parser.add_argument("--fail-on-regression", action="store_true", help="回帰があれば終了コード1で終了する")
+    parser.add_argument("--log-level", default="WARNING", help="ボットのログレベル")
+    args = parser.parse_args()
+
+    x_server = FakeXServer(args.x_latency, args.x_page_size, args.x_429_rate, args.seed).start()
+    discord_server = FakeDiscordServer(args.discord_latency, args.discord_limit, args.discord_window).start()
+    state_dir = tempfile.mkdtemp(prefix="asai-x-bot-bench-")
+    try:
+        configure_environment(x_server, discord_server, state_dir, max(args.bursts), args.x_page_size)
+        sys.path.insert(0, str(SRC_DIR))
+        bot = importlib.import_module("main")
+        config = importlib.import_module("config")
+        logging.getLogger().setLevel(args.log_level.upper())
+
+        results = [run_burst(bot, x_server, discord_server, state_dir, count) for count in args.bursts]
+    finally:
+        x_server.stop()
+        discord_server.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    settings = {
+        "x_latency": args.x_latency,
+        "x_page_size": args.x_page_size,
+        "x_429_rate": args.x_429_rate,
+        "discord_latency": args.discord_latency,
+        "discord_limit": args.discord_limit,
+        "discord_window": args.discord_window,
+        "bot": {name: getattr(config, name) for name in RECORDED_SETTINGS},
+        # アウトボックスの場所は実行ごとの一時ディレクトリのため、有効かどうかのみ記録する
+        "outbox": bool(config.OUTBOX_DIR),
+    }
+    regressed = report(results, load_previous(args.output, settings), args.threshold)
+
+    record = {
+        "timestamp": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "settings": settings,
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.write(f"\n結果を {args.output} に保存しました\n")
+
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
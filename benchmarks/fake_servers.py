@@ -0,0 +1,232 @@
+"""
+ベンチマーク用の X API / Discord Webhook のローカル代替サーバー
+
+実際のネットワークや API 枠を使わずに、ボット全体（取得 → 整形 → 配信）を計測するために使う。
+レイテンシ・ページサイズ・429 応答・Discord のレート制限ヘッダーを設定できる。
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 2024-01-01 00:00:00 UTC 頃のツイートID（ベンチマーク用のIDはここから連番で振る）
+BASE_TWEET_ID = 1741996800000000000
+TWEET_URL_PATTERN = re.compile(r"/status/(\d+)")
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    """アクセスログを出力しないハンドラー"""
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FakeServer:
+    """バックグラウンドスレッドで動くローカルHTTPサーバー"""
+
+    handler_class: type[BaseHTTPRequestHandler]
+
+    def __init__(self):
+        handler = type("Handler", (self.handler_class,), {"fake": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _XHandler(_QuietHandler):
+    fake: "FakeXServer"
+
+    def do_GET(self):
+        fake = self.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        with fake.lock:
+            fake.requests += 1
+            if fake.rate_limit_rate and fake.random.random() < fake.rate_limit_rate:
+                fake.rate_limited += 1
+                self._send_json(
+                    429,
+                    {"title": "Too Many Requests", "errors": [{"code": 88, "message": "Rate limit exceeded"}]},
+                    {"x-rate-limit-limit": 450, "x-rate-limit-remaining": 0, "x-rate-limit-reset": int(time.time())},
+                )
+                return
+            tweets = fake.tweets
+
+        params = parse_qs(urlsplit(self.path).query)
+        since_id = int(params.get("since_id", ["0"])[0])
+        offset = int(params.get("next_token", ["0"])[0])
+        page_size = min(int(params.get("max_results", ["100"])[0]), fake.page_size)
+
+        matched = [tw for tw in tweets if int(tw["id"]) > since_id]
+        page = matched[offset : offset + page_size]
+        payload = {"meta": {"result_count": len(page)}}
+        if page:
+            payload["data"] = page
+            payload["includes"] = {"users": fake.users_for(page)}
+            payload["meta"]["newest_id"] = page[0]["id"]
+            payload["meta"]["oldest_id"] = page[-1]["id"]
+        if offset + page_size < len(matched):
+            payload["meta"]["next_token"] = str(offset + page_size)
+        self._send_json(200, payload, {"x-rate-limit-limit": 450, "x-rate-limit-remaining": 449})
+
+
+class FakeXServer(_FakeServer):
+    """
+    X API の search/recent の代替
+
+    Args:
+        latency: 1リクエストあたりの応答遅延（秒）
+        page_size: 1ページの最大件数（max_results との小さい方）
+        rate_limit_rate: 429 を返す確率（0〜1）
+        seed: 429 の発生に使う乱数のシード
+    """
+
+    handler_class = _XHandler
+
+    def __init__(self, latency=0.0, page_size=100, rate_limit_rate=0.0, seed=0):
+        super().__init__()
+        self.latency = latency
+        self.page_size = page_size
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)  # noqa: S311  # nosec B311
+        self.tweets: list[dict] = []
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def search_url(self):
+        return f"{self.base_url}/2/tweets/search/recent"
+
+    def load_burst(self, count, start_id=BASE_TWEET_ID, authors=20):
+        """新しい順に count 件のツイートを用意し、リクエスト数を数え直す"""
+        with self.lock:
+            self.tweets = [
+                {
+                    "id": str(start_id + i),
+                    "author_id": str(i % authors),
+                    "text": f"ベンチマーク用のツイート {i} #浅井恋乃未",
+                    "created_at": "2024-01-01T00:00:00.000Z",
+                    "lang": "ja",
+                }
+                for i in reversed(range(count))
+            ]
+            self.requests = 0
+            self.rate_limited = 0
+
+    @staticmethod
+    def users_for(tweets):
+        """ツイートの投稿者の includes.users"""
+        author_ids = sorted({tw["author_id"] for tw in tweets}, key=int)
+        return [{"id": a, "username": f"bench_user{a}", "name": f"Bench User {a}"} for a in author_ids]
+
+
+class _DiscordHandler(_QuietHandler):
+    fake: "FakeDiscordServer"
+
+    def do_POST(self):
+        fake = self.fake
+        length = int(self.headers.get("Content-Length", "0"))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        with fake.lock:
+            fake.calls += 1
+            headers = {}
+            if fake.limit:
+                now = time.monotonic()
+                if now >= fake.window_reset:
+                    fake.window_reset = now + fake.window
+                    fake.window_count = 0
+                reset_after = max(fake.window_reset - now, 0.0)
+                if fake.window_count >= fake.limit:
+                    fake.rate_limited += 1
+                    self._send_json(
+                        429, {"message": "You are being rate limited.", "retry_after": reset_after, "global": False}
+                    )
+                    return
+                fake.window_count += 1
+                headers = {
+                    "X-RateLimit-Bucket": "bench-bucket",
+                    "X-RateLimit-Limit": fake.limit,
+                    "X-RateLimit-Remaining": fake.limit - fake.window_count,
+                    "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+                }
+            received_at = time.perf_counter()
+            for tweet_id in _tweet_ids(payload):
+                fake.delivered.append((tweet_id, received_at))
+
+        self.send_response(204)
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+
+
+def _tweet_ids(payload):
+    """Webhook のペイロードに含まれるツイートID（content / embeds のURLから取り出す）"""
+    texts = [payload.get("content") or ""]
+    texts += [embed.get("url", "") for embed in payload.get("embeds", [])]
+    return [match for text in texts for match in TWEET_URL_PATTERN.findall(text)]
+
+
+class FakeDiscordServer(_FakeServer):
+    """
+    Discord Webhook の代替
+
+    Args:
+        latency: 1リクエストあたりの応答遅延（秒）
+        limit: window 秒あたりに受け付ける件数（0 の場合はレート制限なし）
+        window: レート制限のウィンドウ（秒）
+    """
+
+    handler_class = _DiscordHandler
+
+    def __init__(self, latency=0.0, limit=0, window=1.0):
+        super().__init__()
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.window_reset = 0.0
+        self.window_count = 0
+        self.reset()
+
+    @property
+    def webhook_url(self):
+        return f"{self.base_url}/api/webhooks/0/benchmark"
+
+    def reset(self):
+        """受信記録を消去する"""
+        with self.lock:
+            self.calls = 0
+            self.rate_limited = 0
+            # (ツイートID, 受信時刻(perf_counter))
+            self.delivered: list[tuple[str, float]] = []
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+起動時のインポート時間を計測するベンチマーク
+
+`python -X importtime` でエントリーポイント（server / run）のインポート時間を計測し、
+import_budget.json の予算（インポート時間の上限・起動時に読み込んではならないモジュール）と比較する。
+Cloud Run はゼロスケールのため、ここで増えた時間はそのままコールドスタートの遅延になる。
+
+使い方:
+    python benchmarks/import_time.py [--runs 5] [--top 15]
+"""
+
+import argparse
+import json
+import os
+import subprocess  # nosec B404
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT / "src"
+BUDGET_FILE = Path(__file__).resolve().parent / "import_budget.json"
+
+
+def measure(module):
+    """1回分のインポート時間を計測し、(モジュール名 -> (自身のμs, 累積μs)) と読み込まれたモジュールを返す"""
+    code = f"import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "K_SERVICE": os.environ.get("K_SERVICE", "import-benchmark")}
+    proc = subprocess.run(  # noqa: S603  # nosec B603
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時のインポート時間を計測")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数（最小値を採用）")
+    parser.add_argument("--top", type=int, default=15, help="表示する上位モジュール数")
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_FILE.read_text(encoding="utf-8"))
+    failed = False
+
+    for module, spec in budget["entrypoints"].items():
+        best_timings = None
+        loaded: list[str] = []
+        for _ in range(args.runs):
+            timings, loaded = measure(module)
+            if best_timings is None or timings[module][1] < best_timings[module][1]:
+                best_timings = timings
+
+        assert best_timings is not None
+        total_ms = best_timings[module][1] / 1000
+        status = "OK" if total_ms <= spec["budget_ms"] else "OVER BUDGET"
+        failed |= status != "OK"
+        sys.stdout.write(f"\n== {module}: {total_ms:.1f} ms (budget {spec['budget_ms']} ms) {status}\n")
+
+        top = sorted(best_timings.items(), key=lambda item: item[1][1], reverse=True)[: args.top]
+        for name, (self_us, cumulative_us) in top:
+            sys.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}\n")
+
+        forbidden = [
+            name
+            for name in loaded
+            for prefix in budget["forbidden_modules"]
+            if name == prefix or name.startswith(f"{prefix}.")
+        ]
+        if forbidden:
+            failed = True
+            sys.stdout.write(f"  起動時に読み込まれてはいけないモジュール: {', '.join(sorted(set(forbidden)))}\n")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
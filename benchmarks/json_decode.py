@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+X API のレスポンスのデコードと索引作成のマイクロベンチマーク
+
+100件のツイートを含む検索結果のページについて、従来の処理（標準ライブラリの json でデコードし、
+build_index で includes.users の索引を作る）と、x_decode.decode_page を使用できるデコーダーごとに比較する。
+実際の X API のレスポンスを保存したファイルを --page で指定でき、指定しない場合は
+analytics プロファイル相当のフィールドを含むページを生成して使う。
+
+使い方:
+    python benchmarks/json_decode.py [--page recorded.json ...] [--iterations 2000]
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from pathlib import Path
+
+from fake_servers import BASE_TWEET_ID
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT / "src"
+
+
+def sample_page(count=100, authors=20):
+    """analytics プロファイル相当のフィールドを含む count 件のページ（本文）"""
+    tweets = []
+    media = []
+    for i in reversed(range(count)):
+        tweet = {
+            "id": str(BASE_TWEET_ID + i),
+            "author_id": str(i % authors),
+            "text": f"ベンチマーク用のツイート {i} #浅井恋乃未 https://t.co/{i:010d}",
+            "created_at": "2024-01-01T00:00:00.000Z",
+            "lang": "ja",
+            "public_metrics": {"retweet_count": i, "reply_count": 1, "like_count": i * 3, "quote_count": 0},
+            "edit_history_tweet_ids": [str(BASE_TWEET_ID + i)],
+        }
+        if i % 3 == 0:
+            tweet["attachments"] = {"media_keys": [f"3_{i}"]}
+            media.append({"media_key": f"3_{i}", "type": "photo", "url": f"https://pbs.twimg.com/media/{i}.jpg"})
+        tweets.append(tweet)
+    users = [
+        {
+            "id": str(a),
+            "username": f"bench_user{a}",
+            "name": f"Bench User {a}",
+            "profile_image_url": f"https://pbs.twimg.com/profile_images/{a}/normal.jpg",
+        }
+        for a in range(authors)
+    ]
+    payload = {
+        "data": tweets,
+        "includes": {"users": users, "media": media},
+        "meta": {"newest_id": tweets[0]["id"], "oldest_id": tweets[-1]["id"], "result_count": count},
+    }
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def measure(func, pages, iterations):
+    """1ページあたりの所要時間（マイクロ秒、最小のラウンドの値）"""
+    best = None
+    rounds = 5
+    per_round = max(1, iterations // rounds)
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(per_round):
+            for content in pages:
+                func(content)
+        elapsed = (time.perf_counter() - start) / (per_round * len(pages))
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="X API のレスポンスのデコードと索引作成を計測")
+    parser.add_argument("--page", action="append", type=Path, help="保存した X API のレスポンス（複数指定可）")
+    parser.add_argument("--iterations", type=int, default=2000, help="1ページあたりの計測回数")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC_DIR))
+    utils = importlib.import_module("utils")
+    x_decode = importlib.import_module("x_decode")
+
+    def baseline(content):
+        """従来の処理（標準ライブラリでデコードし、ユーザーの索引を作る）"""
+        payload = json.loads(content)
+        return payload.get("data", []), utils.build_index(payload.get("includes", {}).get("users", []))
+
+    pages = [path.read_bytes() for path in args.page] if args.page else [sample_page()]
+    size = sum(len(content) for content in pages) / len(pages)
+    sys.stdout.write(
+        f"ページ数: {len(pages)} / 平均サイズ: {size / 1024:.1f} KiB / デコーダー: {', '.join(x_decode.DECODERS)}\n"
+    )
+
+    base = measure(baseline, pages, args.iterations)
+    results = [("stdlib + build_index（従来）", base)]
+    for name, decode in x_decode.DECODERS.items():
+        micros = measure(lambda content, decode=decode: x_decode.decode_page(content, decode), pages, args.iterations)
+        results.append((f"decode_page（{name}）", micros))
+
+    for label, micros in results:
+        throughput = size / (micros / 1_000_000) / 1024 / 1024
+        sys.stdout.write(f"{label:32} {micros:9.1f} µs/ページ  {throughput:8.1f} MiB/s  x{base / micros:.2f}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -111,6 +111,8 @@ echo -e "${GREEN}Cloud Runサービスアカウントに権限を付与しまし
 
 # 6. Cloud Run サービスのデプロイ
 echo -e "\n${YELLOW}6. Cloud Runサービスのデプロイ...${NC}"
+# 実行中もGET（ヘルスチェック・メトリクス）や重複したPOSTを同じインスタンスで受けられるよう、同時リクエスト数を4にする
+# （ボットの実行はサーバー内で1つにまとめるため、インスタンスは1つのまま）
 gcloud run deploy "$SERVICE_NAME" \
     --image "$IMAGE_NAME" \
     --platform managed \
@@ -119,7 +121,7 @@ gcloud run deploy "$SERVICE_NAME" \
     --memory 512Mi \
     --cpu 1 \
     --timeout 900 \
-    --concurrency 1 \
+    --concurrency 4 \
     --max-instances 1 \
     --set-env-vars "QUERY=(#浅井恋乃未) (from:sakurazaka46 OR from:sakura_joqr OR from:anan_mag OR from:Lemino_official OR from:BLTTV OR from:shonen_sunday)" \
     --set-env-vars "SINCE_ID_FILE=/tmp/data/since_id.txt" \
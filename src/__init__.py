@@ -8,7 +8,7 @@ from .config import validate_env_vars
 from .discord_client import discord_post, get_tweet_url
 from .main import fetch_and_forward, main
 from .utils import build_index, load_since_id, save_since_id
-from .x_api_client import fetch_tweets
+from .x_api_client import fetch_tweets, iter_tweet_pages
 
 __version__ = "2.0.0"
 __all__ = [
@@ -19,6 +19,7 @@ __all__ = [
     "save_since_id",
     "build_index",
     "fetch_tweets",
+    "iter_tweet_pages",
     "discord_post",
     "get_tweet_url",
 ]
@@ -1,31 +1,46 @@
 import logging
 import os
 
-from dotenv import load_dotenv
-
-# ログ設定
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
-logger = logging.getLogger(__name__)
+from logging_config import configure_logging
+
+# .env を読み込み（Cloud Run では環境変数が直接渡されるため読み込まない）
+if not os.getenv("K_SERVICE"):
+    from dotenv import load_dotenv
 
-# .env を読み込み
-logger.info("環境変数の読み込みを開始")
-load_dotenv()
+    load_dotenv()
+
+# ログ設定（Cloud Run では Cloud Logging 用の構造化ログ）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if os.getenv("K_SERVICE") else "text").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# ログをキュー経由で別スレッドから書き出す
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+# ツイートごとのログを出力する割合（1: すべて、0.1: 10件に1件、0: 出力しない）
+LOG_ITEM_SAMPLE_RATE = float(os.getenv("LOG_ITEM_SAMPLE_RATE", "1"))
+configure_logging(LOG_FORMAT, LOG_LEVEL, LOG_ASYNC, LOG_ITEM_SAMPLE_RATE)
+logger = logging.getLogger(__name__)
 
 # 値を取得
 X_BEARER_TOKEN = os.getenv("X_BEARER_TOKEN")
 WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
 QUERY = os.getenv("QUERY")
 
+# 複数クエリの設定（JSON文字列またはJSONファイル）。未設定の場合は QUERY / DISCORD_WEBHOOK_URL の1件のみ
+QUERIES = os.getenv("QUERIES")
+QUERIES_FILE = os.getenv("QUERIES_FILE")
+# 1クエリあたりの最大文字数（X API のプランにより 512 / 1024 / 4096）
+QUERY_MAX_LENGTH = int(os.getenv("QUERY_MAX_LENGTH", "512"))
+# QUERIES 未設定時のクエリ名（since_id は従来の保存先を使う）
+DEFAULT_QUERY_NAME = "default"
+
 
 # 環境変数の検証
 def validate_env_vars():
     if not X_BEARER_TOKEN:
         logger.error("X_BEARER_TOKEN が設定されていません")
         return False
+    if QUERIES or QUERIES_FILE:
+        # 各クエリの検証は queries.load_query_specs で行う
+        return True
     if not WEBHOOK_URL:
         logger.error("DISCORD_WEBHOOK_URL が設定されていません")
         return False
@@ -37,11 +52,133 @@ def validate_env_vars():
 
 # 設定値
 STATE_FILE = os.getenv("SINCE_ID_FILE", "since_id.txt")
-SEARCH_URL = "https://api.x.com/2/tweets/search/recent"
+# since_id 以外の状態（JSON）を保存するディレクトリ（ローカル用）
+STATE_DIR = os.getenv("STATE_DIR", os.path.dirname(STATE_FILE) or ".")
+# 配信アウトボックス（取得済み・未配信のツイートのログ）を置くディレクトリ（空の場合は無効）
+# Cloud Run のローカルディスクはインスタンスとともに消えるため、既定では無効
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "" if os.getenv("K_SERVICE") else STATE_DIR)
+# 重複転送を防ぐために記憶する配信済みツイートIDの件数（クエリごと、0 で無効）
+DEDUP_MAX_IDS = int(os.getenv("DEDUP_MAX_IDS", "1000"))
+# 検索APIのURL（ベンチマークなどでローカルの代替サーバーに向ける場合のみ変更）
+SEARCH_URL = os.getenv("X_SEARCH_URL", "https://api.x.com/2/tweets/search/recent")
+# true の場合は検索の前に件数APIで since_id 以降のツイート数を確認し、0件なら検索しない
+X_COUNTS_PRECHECK = os.getenv("X_COUNTS_PRECHECK", "false").lower() == "true"
+COUNTS_URL = os.getenv("X_COUNTS_URL", "https://api.x.com/2/tweets/counts/recent")
+
+# フィルタードストリーム（ストリームモード）の設定
+STREAM_URL = os.getenv("X_STREAM_URL", "https://api.x.com/2/tweets/search/stream")
+STREAM_RULES_URL = os.getenv("X_STREAM_RULES_URL", f"{STREAM_URL}/rules")
+# true の場合は server.py がHTTPサーバーと並行してストリームモードで常時転送する
+STREAM_ENABLED = os.getenv("STREAM_ENABLED", "false").lower() == "true"
+# この秒数データもキープアライブも届かなければ切断とみなして再接続する（X は約20秒ごとにキープアライブを送る）
+STREAM_STALL_TIMEOUT = float(os.getenv("STREAM_STALL_TIMEOUT", "90"))
+# 受け取ったツイートをまとめて配信するまでの待ち時間（秒）と1回にまとめる最大件数
+STREAM_BATCH_WAIT = float(os.getenv("STREAM_BATCH_WAIT", "1"))
+STREAM_BATCH_MAX = int(os.getenv("STREAM_BATCH_MAX", "50"))
+# true の場合は接続・再接続のたびに search/recent で切断中のツイートを取得する
+STREAM_CATCH_UP = os.getenv("STREAM_CATCH_UP", "true").lower() == "true"
+
+# ページネーション上限（大量のツイートでメモリやAPI枠を使い切らないための上限）
+X_MAX_PAGES = int(os.getenv("X_MAX_PAGES", "10"))
+X_MAX_TWEETS = int(os.getenv("X_MAX_TWEETS", "500"))
+
+# X API の呼び出し枠・読み取り予算（実行・クエリをまたいで状態に保存する）
+# 検索APIのレート制限（ウィンドウあたりの呼び出し回数とウィンドウの秒数。プランに合わせて設定）
+X_RATE_LIMIT = int(os.getenv("X_RATE_LIMIT", "450"))
+X_RATE_LIMIT_WINDOW = float(os.getenv("X_RATE_LIMIT_WINDOW", "900"))
+# 1か月（UTC）に読み取るツイート数の上限（0 で無制限）
+X_MONTHLY_TWEET_BUDGET = int(os.getenv("X_MONTHLY_TWEET_BUDGET", "0"))
+# 予算の残りがこの割合を下回ったら、1回の実行で取得するページを1ページに抑える
+X_BUDGET_LOW_WATERMARK = float(os.getenv("X_BUDGET_LOW_WATERMARK", "0.1"))
+
+# HTTP接続設定（ホストごとのKeep-Aliveセッションで共有）
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+X_API_TIMEOUT = float(os.getenv("X_API_TIMEOUT", "30"))
+DISCORD_TIMEOUT = float(os.getenv("DISCORD_TIMEOUT", "15"))
+
+# X API から取得するフィールドのプロファイル（auto / minimal / embed / analytics）
+# 出力に使うフィールドのみ要求して、1ページあたりのレスポンスサイズと解析時間を減らす
+# auto: DISCORD_PACK_MODE が embeds の場合は embed、それ以外は minimal
+X_FIELD_PROFILE = os.getenv("X_FIELD_PROFILE", "auto").lower()
+FIELD_PROFILES = {
+    # ツイートURLのみ（id・text は常に返るため、投稿者の username を引くための author_id のみ）
+    "minimal": {
+        "tweet.fields": "author_id",
+        "expansions": "author_id",
+    },
+    # embed 表示（投稿日時・エンゲージメント数・表示名・アイコン・添付メディア）
+    "embed": {
+        "tweet.fields": "created_at,public_metrics,author_id",
+        "user.fields": "name,username,profile_image_url",
+        "media.fields": "url,preview_image_url,type",
+        "expansions": "author_id,attachments.media_keys",
+    },
+    # 分析用（言語・エンゲージメント数を含むすべて）
+    "analytics": {
+        "tweet.fields": "created_at,lang,public_metrics,author_id",
+        "user.fields": "name,username,profile_image_url",
+        "media.fields": "url,preview_image_url,type",
+        "expansions": "author_id,attachments.media_keys",
+    },
+}
+
+# X API のレスポンスの JSON デコーダー（auto / orjson / msgspec / stdlib）
+# auto: orjson・msgspec がインストールされていれば使い、なければ標準ライブラリの json
+X_JSON_DECODER = os.getenv("X_JSON_DECODER", "auto").lower()
+
+# Discord配信設定
+DELIVERY_MAX_WORKERS = int(os.getenv("DELIVERY_MAX_WORKERS", "4"))
+# 同時に取得・転送するクエリ数
+QUERY_MAX_WORKERS = int(os.getenv("QUERY_MAX_WORKERS", "4"))
+# true の場合は同じWebhookへの投稿を1件ずつ順番に送り、表示順（古い順）を保証する
+DISCORD_STRICT_ORDER = os.getenv("DISCORD_STRICT_ORDER", "true").lower() == "true"
+DISCORD_MAX_RATE_LIMIT_RETRIES = int(os.getenv("DISCORD_MAX_RATE_LIMIT_RETRIES", "3"))
+# 複数ツイートを1回のWebhook呼び出しにまとめるモード（off / content / embeds）
+DISCORD_PACK_MODE = os.getenv("DISCORD_PACK_MODE", "off").lower()
+# DISCORD_PACK_MODE=embeds の embed の形式
+# rich: 投稿者・本文・投稿日時・エンゲージメント数・画像を includes から組み立てる / simple: ユーザー名と本文のみ
+DISCORD_EMBED_STYLE = os.getenv("DISCORD_EMBED_STYLE", "rich").lower()
+
+# メディアキャッシュ設定（embed の画像をダウンロードして Discord に添付する）
+# 画像を保存するディレクトリ（空の場合は無効で、embed は X のメディアURLを参照する）
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "")
+# 保存するファイルの合計サイズの上限（バイト）と保持する秒数
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+MEDIA_CACHE_MAX_AGE = float(os.getenv("MEDIA_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# 添付する1ファイルの上限（Discord の Webhook の添付ファイルの上限、超える場合はURLのまま投稿）
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))
+# 画像をダウンロードする共有のスレッド数とタイムアウト秒数
+MEDIA_MAX_WORKERS = int(os.getenv("MEDIA_MAX_WORKERS", "4"))
+MEDIA_TIMEOUT = float(os.getenv("MEDIA_TIMEOUT", "30"))
+
+# HTTPサーバー設定
+# 実行中のPOSTに後続のPOSTが合流して結果を待つ秒数（0の場合は即座に202を返す）
+TRIGGER_JOIN_TIMEOUT = float(os.getenv("TRIGGER_JOIN_TIMEOUT", "0"))
+
+# 内蔵スケジューラー設定（run.py --loop、または SCHEDULER_ENABLED=true の server.py）
+# true の場合は server.py がツイートの到着ペースに合わせた間隔で自分で定期実行する
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() == "true"
+# 実行間隔の下限・上限（秒）
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "60"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "3600"))
+# 1回の実行で転送したいツイート数の目安（到着ペース × 間隔 がこの件数になるように間隔を決める）
+POLL_TARGET_TWEETS = float(os.getenv("POLL_TARGET_TWEETS", "5"))
+# レート制限の残り回数のうち、手動実行などのために使わずに残しておく回数
+POLL_RATE_LIMIT_RESERVE = int(os.getenv("POLL_RATE_LIMIT_RESERVE", "5"))
 
 # Secret Manager設定
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", os.getenv("GCP_PROJECT"))
 SINCE_ID_SECRET_NAME = "asai-x-bot-since-id"  # nosec B105: Secret Manager resource name, not a credential
+# Secret Manager の値をプロセス内にキャッシュし、ウォームインスタンスでは再読み込みしない
+# （複数インスタンスから同じシークレットを更新する構成では false にする）
+SECRET_CACHE_ENABLED = os.getenv("SECRET_CACHE_ENABLED", "true").lower() == "true"
+# シークレットの古いバージョンの整理（保持数が0以下の場合は整理しない）
+SECRET_VERSION_RETENTION = int(os.getenv("SECRET_VERSION_RETENTION", "10"))
+SECRET_VERSION_PRUNE_ACTION = os.getenv("SECRET_VERSION_PRUNE_ACTION", "destroy").lower()  # destroy / disable
+SECRET_COMPACTION_INTERVAL = float(os.getenv("SECRET_COMPACTION_INTERVAL", "3600"))
+# since_id 以外の状態は "{STATE_SECRET_PREFIX}-{状態名}" のシークレットに保存
+STATE_SECRET_PREFIX = "asai-x-bot-state"  # nosec B105: Secret Manager resource name, not a credential
 
 
 # X API用のヘッダーとパラメータ
@@ -49,12 +186,19 @@ def get_x_api_headers():
     return {"Authorization": f"Bearer {X_BEARER_TOKEN}"}
 
 
+def get_field_profile():
+    """使用するフィールドのプロファイル名（auto の場合は DISCORD_PACK_MODE から決める）"""
+    if X_FIELD_PROFILE == "auto":
+        return "embed" if DISCORD_PACK_MODE == "embeds" else "minimal"
+    if X_FIELD_PROFILE not in FIELD_PROFILES:
+        logger.warning(f"X_FIELD_PROFILE が不正なため analytics を使います: {X_FIELD_PROFILE}")
+        return "analytics"
+    return X_FIELD_PROFILE
+
+
 def get_x_api_params():
     return {
         "query": QUERY,
-        "max_results": 50,  # 10〜100
-        "tweet.fields": "created_at,lang,public_metrics,author_id",
-        "user.fields": "name,username,profile_image_url",
-        "media.fields": "url,preview_image_url,type",
-        "expansions": "author_id,attachments.media_keys",
+        "max_results": 100,  # 10〜100
+        **FIELD_PROFILES[get_field_profile()],
     }
@@ -0,0 +1,50 @@
+"""
+配信済みツイートIDの重複排除
+
+since_id が7日制限で無効になった場合などに同じツイートを再転送しないよう、
+最近配信したツイートIDを件数上限つきで記憶する。
+リングバッファ（古い順）と集合を併用し、判定・追加は O(1)、メモリは上限件数で一定。
+"""
+
+import threading
+from collections import deque
+
+from config import DEDUP_MAX_IDS
+
+
+class DeliveredIds:
+    """最近配信したツイートIDの集合（上限を超えると古いものから忘れる）"""
+
+    def __init__(self, tweet_ids=(), max_size=None):
+        self.max_size = DEDUP_MAX_IDS if max_size is None else max_size
+        self._ring: deque[str] = deque()
+        self._ids: set[str] = set()
+        self._lock = threading.Lock()
+        self.changed = False
+        self.add(tweet_ids)
+        self.changed = False
+
+    def __contains__(self, tweet_id):
+        return tweet_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, tweet_ids):
+        """配信したツイートIDを記憶する"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for tweet_id in tweet_ids:
+                if tweet_id in self._ids:
+                    continue
+                if len(self._ring) >= self.max_size:
+                    self._ids.discard(self._ring.popleft())
+                self._ring.append(tweet_id)
+                self._ids.add(tweet_id)
+                self.changed = True
+
+    def to_list(self):
+        """記憶しているツイートIDを古い順に返す（保存用）"""
+        with self._lock:
+            return list(self._ring)
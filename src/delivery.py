@@ -0,0 +1,111 @@
+"""
+Discordへの配信エンジン
+
+Webhookごとの配信レーンを並行に実行しつつ、各レーン内では古い順に1件ずつ送る。
+配信結果から「先頭から途切れずに配信できた最後のツイートID」を求め、
+since_id はそこまでしか進めない。
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from config import DELIVERY_MAX_WORKERS, DISCORD_STRICT_ORDER
+from logging_config import PER_ITEM
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeliveryItem:
+    """1回のWebhook呼び出しで配信するメッセージ"""
+
+    tweet_ids: list[str]
+    message: dict
+    webhook_url: str | None = None
+    label: str = ""
+
+
+@dataclass
+class DeliveryResult:
+    """配信結果"""
+
+    delivered: int = 0
+    failed: int = 0
+    committed_id: str | None = None
+    errors: list[Exception] = field(default_factory=list)
+
+    @property
+    def error(self):
+        """最初に発生したエラー（古い順）"""
+        return self.errors[0] if self.errors else None
+
+
+def _build_lanes(items, strict_order):
+    """配信レーンを構築する（順序保証時はWebhookごと、それ以外は1件ごと）"""
+    lanes: dict = {}
+    for index, item in enumerate(items):
+        key = item.webhook_url if strict_order else index
+        lanes.setdefault(key, []).append(index)
+    return list(lanes.values())
+
+
+def deliver(items, post, max_workers=None, strict_order=None, on_delivered=None):
+    """
+    メッセージを並行に配信し、順序どおりにコミットできる位置を返す
+
+    Args:
+        items: 古い順に並んだ DeliveryItem のリスト
+        post: 1件を送信する関数（discord_post と同じ引数を受け取る）
+        max_workers: 同時に実行するレーン数（省略時は DELIVERY_MAX_WORKERS）
+        strict_order: 同じWebhook内で送信順を保証するか（省略時は DISCORD_STRICT_ORDER）
+        on_delivered: 1件の配信に成功するたびに DeliveryItem を渡して呼ぶ関数
+
+    Returns:
+        DeliveryResult: 配信結果
+    """
+    max_workers = DELIVERY_MAX_WORKERS if max_workers is None else max_workers
+    strict_order = DISCORD_STRICT_ORDER if strict_order is None else strict_order
+
+    result = DeliveryResult()
+    if not items:
+        return result
+
+    statuses: list[bool | None] = [None] * len(items)
+    errors: dict[int, Exception] = {}
+
+    def run_lane(indices):
+        for position, index in enumerate(indices):
+            item = items[index]
+            logger.info("配信 %d/%d を処理中: %s", index + 1, len(items), item.label, extra=PER_ITEM)
+            try:
+                post(webhook_url=item.webhook_url, **item.message)
+                statuses[index] = True
+            except Exception as e:
+                statuses[index] = False
+                errors[index] = e
+                if strict_order:
+                    # 後続を送ると表示順が崩れるため、このレーンはここで打ち切る
+                    logger.warning(f"配信に失敗したため同じWebhookへの後続 {len(indices) - position - 1} 件を保留します")
+                    return
+                continue
+            if on_delivered:
+                on_delivered(item)
+
+    lanes = _build_lanes(items, strict_order)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(lanes)))) as executor:
+        # ログの相関IDを各レーンに引き継ぐ
+        futures = [executor.submit(contextvars.copy_context().run, run_lane, lane) for lane in lanes]
+        for future in futures:
+            future.result()
+
+    for item, status in zip(items, statuses, strict=True):
+        if not status:
+            break
+        result.committed_id = item.tweet_ids[-1]
+
+    result.delivered = sum(1 for status in statuses if status)
+    result.failed = len(errors)
+    result.errors = [errors[index] for index in sorted(errors)]
+    return result
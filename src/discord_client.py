@@ -1,30 +1,257 @@
+import html
+import json
 import logging
+import threading
+import time
 from typing import cast
 
-import requests
-
-from config import WEBHOOK_URL
+import media_cache
+import metrics
+import transport
+from config import DISCORD_MAX_RATE_LIMIT_RETRIES, DISCORD_PACK_MODE, DISCORD_TIMEOUT, WEBHOOK_URL
+from logging_config import PER_ITEM
 
 logger = logging.getLogger(__name__)
 
+# Discord Webhook の上限
+DISCORD_CONTENT_LIMIT = 2000
+DISCORD_MAX_EMBEDS = 10
+DISCORD_EMBED_DESCRIPTION_LIMIT = 4096
+DISCORD_EMBED_AUTHOR_LIMIT = 256
+
+# embed の左端の色（X のブランドカラー）
+EMBED_COLOR = 0x1D9BF0
+# embed に表示するエンゲージメント数（public_metrics のキー, 表示名）
+EMBED_METRICS = (("reply_count", "返信"), ("retweet_count", "リポスト"), ("like_count", "いいね"))
+
+
+class RateLimiter:
+    """Discord の X-RateLimit-* ヘッダーに基づくバケット単位のレート制限"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ルート（Webhook URL）-> バケットID
+        self._route_buckets: dict[str, str] = {}
+        # バケットID -> [残りリクエスト数, リセット時刻(monotonic)]
+        self._buckets: dict[str, list] = {}
+
+    def acquire(self, route):
+        """バケットに空きができるまで待機し、1リクエスト分の枠を確保する"""
+        while True:
+            with self._lock:
+                bucket = self._route_buckets.get(route, route)
+                state = self._buckets.get(bucket)
+                now = time.monotonic()
+                if state is None or state[1] <= now:
+                    self._buckets.pop(bucket, None)
+                    return
+                if state[0] > 0:
+                    state[0] -= 1
+                    return
+                wait = state[1] - now
+            logger.info(f"Discordのレート制限のため {wait:.2f} 秒待機します")
+            time.sleep(wait)
+
+    def update(self, route, headers):
+        """レスポンスヘッダーからバケットの状態を更新する"""
+        bucket = headers.get("X-RateLimit-Bucket")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+
+        with self._lock:
+            if bucket:
+                self._route_buckets[route] = bucket
+            else:
+                bucket = self._route_buckets.get(route, route)
+            if remaining is None or reset_after is None:
+                return
+            try:
+                self._buckets[bucket] = [int(remaining), time.monotonic() + float(reset_after)]
+            except (TypeError, ValueError):
+                logger.warning(f"レート制限ヘッダーの解析に失敗: remaining={remaining}, reset_after={reset_after}")
+
+
+rate_limiter = RateLimiter()
 
-def discord_post(content=None, embed=None):
+
+def _get_retry_after(r):
+    """429レスポンスから待機秒数を取得する"""
+    try:
+        return float(r.json()["retry_after"])
+    except Exception:
+        return float(r.headers.get("Retry-After", 1))
+
+
+def _request_kwargs(payload, files):
+    """Webhook へのリクエストの本文（添付ファイルがある場合は multipart/form-data）"""
+    if not files:
+        return {"json": payload}
+    payload = {**payload, "attachments": [{"id": i, "filename": file[0]} for i, file in enumerate(files)]}
+    return {
+        "data": {"payload_json": json.dumps(payload, ensure_ascii=False)},
+        "files": {f"files[{i}]": file for i, file in enumerate(files)},
+    }
+
+
+def discord_post(content=None, embed=None, webhook_url=None, embeds=None):
     payload = {}
     if content:
         payload["content"] = content
     if embed:
         payload["embeds"] = [embed]
+    if embeds:
+        payload["embeds"] = payload.get("embeds", []) + list(embeds)
 
+    url = cast(str, webhook_url or WEBHOOK_URL)
     try:
-        logger.info("Discordに投稿中...")
-        r = requests.post(cast(str, WEBHOOK_URL), json=payload, timeout=15)
+        logger.info("Discordに投稿中...", extra=PER_ITEM)
+        cache = media_cache.get_cache()
+        files = []
+        if cache is not None and payload.get("embeds"):
+            # 添付ファイルへの置き換えで呼び出し元の embed（アウトボックスの再送に使う）を変えないようにコピーする
+            payload["embeds"] = [dict(embed) for embed in payload["embeds"]]
+            files = media_cache.attach(payload["embeds"], cache)
+        request_kwargs = _request_kwargs(payload, files)
+        # 添付ファイルの Discord のURLを記録するため、投稿したメッセージを返してもらう
+        post_url = f"{url}{'&' if '?' in url else '?'}wait=true" if files else url
+        for attempt in range(DISCORD_MAX_RATE_LIMIT_RETRIES + 1):
+            rate_limiter.acquire(url)
+            with metrics.discord_post_seconds.time():
+                r = transport.request("POST", post_url, timeout=DISCORD_TIMEOUT, **request_kwargs)
+            metrics.discord_posts.inc(status=r.status_code)
+            rate_limiter.update(url, r.headers)
+            if r.status_code != 429:
+                break
+            metrics.rate_limited.inc(api="discord")
+            if attempt == DISCORD_MAX_RATE_LIMIT_RETRIES:
+                break
+            retry_after = _get_retry_after(r)
+            logger.warning(f"Discordのレート制限に達しました (HTTP 429)。{retry_after} 秒後にリトライします")
+            time.sleep(retry_after)
         r.raise_for_status()
-        logger.info("Discordへの投稿が完了しました")
+        if files:
+            media_cache.record_uploads(r.json(), cache)
+        logger.info("Discordへの投稿が完了しました", extra=PER_ITEM)
+        return r
     except Exception:
         logger.exception("Discordへの投稿に失敗しました")
         raise
 
 
+def pack_messages(messages, mode=None):
+    """
+    複数のメッセージを少ないWebhook呼び出しにまとめる（順序は維持）
+
+    Args:
+        messages: (ツイートID, discord_post の引数) のリスト（古い順）
+        mode: off / content / embeds（省略時は DISCORD_PACK_MODE）
+            - content: content を改行区切りで2000文字以内にまとめる
+            - embeds: embed を1回あたり最大10件にまとめる
+
+    Returns:
+        list: (ツイートIDのリスト, discord_post の引数) のリスト
+    """
+    mode = DISCORD_PACK_MODE if mode is None else mode
+    if mode not in ("content", "embeds"):
+        return [([tweet_id], message) for tweet_id, message in messages]
+
+    packed = []
+    tweet_ids: list[str] = []
+    parts: list = []
+    size = 0
+
+    def flush():
+        nonlocal tweet_ids, parts, size
+        if parts:
+            message = {"content": "\n".join(parts)} if mode == "content" else {"embeds": parts}
+            packed.append((tweet_ids, message))
+        tweet_ids, parts, size = [], [], 0
+
+    for tweet_id, message in messages:
+        part = message.get("content") if mode == "content" else message.get("embed")
+        if not part:
+            # まとめられないメッセージは単独で送る
+            flush()
+            packed.append(([tweet_id], message))
+            continue
+
+        if mode == "content":
+            added = len(part) + (1 if parts else 0)
+            if parts and size + added > DISCORD_CONTENT_LIMIT:
+                flush()
+                added = len(part)
+            size += added
+        elif len(parts) >= DISCORD_MAX_EMBEDS:
+            flush()
+
+        tweet_ids.append(tweet_id)
+        parts.append(part)
+    flush()
+
+    logger.info(f"{len(messages)}件のメッセージを{len(packed)}回のWebhook呼び出しにまとめました")
+    return packed
+
+
+def build_simple_embed(tweet, username, tweet_url):
+    """ツイートの簡易的なembedを生成する"""
+    return {
+        "title": f"@{username}",
+        "url": tweet_url,
+        "description": tweet.get("text", ""),
+    }
+
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def build_rich_embed(tweet, users_idx, media_idx):
+    """
+    includes のユーザー・メディアからツイートを表示する embed を生成する
+
+    投稿者（表示名・アイコン）・本文・投稿日時・エンゲージメント数・最初の画像を含めるため、
+    Discord がツイートURLを展開（unfurl）しなくても投稿直後から表示が完成している。
+    フィールドのプロファイルで要求していない項目は省略する。
+
+    Args:
+        tweet: ツイート
+        users_idx: ユーザーID -> ユーザー
+        media_idx: media_key -> メディア
+    """
+    author = users_idx.get(tweet.get("author_id"), {})
+    username = author.get("username", "unknown")
+    tweet_url = get_tweet_url(tweet, users_idx)
+    name = f"{author['name']} (@{username})" if author.get("name") else f"@{username}"
+
+    # 投稿者名のリンクからツイートを開けるようにする
+    embed = {
+        "author": {"name": _truncate(name, DISCORD_EMBED_AUTHOR_LIMIT), "url": tweet_url},
+        "url": tweet_url,
+        # X API は本文の & < > を文字参照（&amp; など）で返すため、元の文字に戻してから切り詰める
+        "description": _truncate(html.unescape(tweet.get("text", "")), DISCORD_EMBED_DESCRIPTION_LIMIT),
+        "color": EMBED_COLOR,
+    }
+    if author.get("profile_image_url"):
+        embed["author"]["icon_url"] = author["profile_image_url"]
+    if tweet.get("created_at"):
+        embed["timestamp"] = tweet["created_at"]
+
+    public_metrics = tweet.get("public_metrics")
+    if public_metrics:
+        embed["fields"] = [
+            {"name": label, "value": str(public_metrics.get(key, 0)), "inline": True} for key, label in EMBED_METRICS
+        ]
+
+    # 写真は url、動画・GIF はサムネイル（preview_image_url）を表示する
+    for media_key in tweet.get("attachments", {}).get("media_keys", []):
+        media = media_idx.get(media_key, {})
+        image_url = media.get("url") or media.get("preview_image_url")
+        if image_url:
+            embed["image"] = {"url": image_url}
+            break
+    return embed
+
+
 def get_tweet_url(tweet, users_idx):
     """ツイートのURLを生成する"""
     author = users_idx.get(tweet["author_id"], {})
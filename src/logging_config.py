@@ -0,0 +1,147 @@
+"""
+ログ出力の設定
+
+- text: 従来どおりの1行テキスト（ローカル実行向け）
+- json: Cloud Logging が解釈できる1行1件の構造化ログ（severity / message / run_id など）
+
+ログはキュー経由で別スレッドから書き出し、メッセージの整形も書き出し側のスレッドで行う。
+ツイートごとに出るログ（extra=PER_ITEM）は LOG_ITEM_SAMPLE_RATE の割合だけ出力し、
+大量のツイートを転送するときもログのコストが増えないようにする。
+"""
+
+import atexit
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import uuid
+from contextlib import contextmanager
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+TEXT_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+# ツイートやリクエストごとに繰り返し出るログに付ける extra
+PER_ITEM = {"per_item": True}
+
+# 実行ごとの相関ID・処理中のクエリ名（スレッドプールには contextvars.copy_context() で引き継ぐ）
+run_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("run_id", default=None)
+query_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("query", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+@contextmanager
+def run_context(run_id=None):
+    """1回の実行の相関IDを設定する"""
+    token = run_id_var.set(run_id or uuid.uuid4().hex[:12])
+    try:
+        yield run_id_var.get()
+    finally:
+        run_id_var.reset(token)
+
+
+@contextmanager
+def query_context(name):
+    """処理中のクエリ名を設定する"""
+    token = query_var.set(name)
+    try:
+        yield
+    finally:
+        query_var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """ログを出したスレッドの相関ID・クエリ名をレコードに付ける"""
+
+    def filter(self, record):
+        record.run_id = run_id_var.get()
+        record.query = query_var.get()
+        return True
+
+
+class ItemSamplingFilter(logging.Filter):
+    """ツイートごとのログを一定の割合だけ通す（1 / sample_rate 件に1件）"""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.interval = 0 if sample_rate <= 0 else max(1, round(1 / sample_rate))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, "per_item", False) or record.levelno >= logging.WARNING:
+            return True
+        if self.interval == 0:
+            return False
+        return next(self._counter) % self.interval == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Cloud Logging の構造化ログ形式（1行1件のJSON）"""
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.UTC).isoformat(),
+            "logger": record.name,
+        }
+        for key in ("run_id", "query"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            # Error Reporting がスタックトレースを認識できるようにメッセージに含める
+            entry["message"] += "\n" + self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """メッセージを整形せずにキューへ渡すハンドラー（整形は書き出し側のスレッドで行う）"""
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(log_format="text", level="INFO", async_output=True, item_sample_rate=1.0):
+    """
+    ルートロガーを設定する（既にハンドラーがある場合は logging.basicConfig と同様に何もしない）
+
+    Args:
+        log_format: text / json
+        level: ログレベル
+        async_output: キュー経由で別スレッドから書き出すか
+        item_sample_rate: ツイートごとのログを出力する割合（0〜1）
+    """
+    global _listener  # noqa: PLW0603
+
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT, TEXT_DATEFMT))
+
+    handler: logging.Handler = output
+    if async_output:
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+    # 相関IDはログを出したスレッドで付ける必要があるため、キューに入れる前のハンドラーに付ける
+    handler.addFilter(ContextFilter())
+    handler.addFilter(ItemSamplingFilter(item_sample_rate))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def stop_logging():
+    """キューに残っているログをすべて書き出して停止する"""
+    global _listener  # noqa: PLW0603
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
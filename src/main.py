@@ -1,51 +1,638 @@
+import contextvars
 import logging
+import math
+import queue
+import signal
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from config import validate_env_vars
-from discord_client import discord_post, get_tweet_url
-from utils import build_index, load_since_id, save_since_id
-from x_api_client import fetch_tweets
+import metrics
+import snowflake
+from config import (
+    DEDUP_MAX_IDS,
+    DISCORD_EMBED_STYLE,
+    DISCORD_PACK_MODE,
+    OUTBOX_DIR,
+    QUERY_MAX_WORKERS,
+    STREAM_BATCH_MAX,
+    STREAM_BATCH_WAIT,
+    STREAM_CATCH_UP,
+    X_COUNTS_PRECHECK,
+    X_MAX_PAGES,
+    X_MAX_TWEETS,
+    validate_env_vars,
+)
+from dedup import DeliveredIds
+from delivery import DeliveryItem, deliver
+from discord_client import build_rich_embed, build_simple_embed, discord_post, get_tweet_url, pack_messages
+from logging_config import query_context, run_context
+from media_cache import prefetch
+from outbox import Outbox
+from queries import load_query_specs
+from quota import get_manager
+from scheduler import run_scheduler
+from utils import (
+    is_since_id_valid,
+    load_backfill,
+    load_deferred_until,
+    load_delivered_ids,
+    load_quota_state,
+    load_since_id,
+    save_backfill,
+    save_deferred_until,
+    save_delivered_ids,
+    save_quota_state,
+    save_since_id,
+)
+from x_api_client import RateLimitError, count_recent_tweets, get_rate_limit_status, iter_tweet_pages
+from x_decode import index_page
+from x_stream import build_rules, run_stream, sync_rules
 
 logger = logging.getLogger(__name__)
 
+# ストリームの配信キューの目印（接続・再接続したので切断中のツイートを取得する / 停止する）
+_CATCH_UP = object()
+_STOP = object()
+# 切断中のツイートの取得に失敗した場合に、次に取得し直すまでの秒数
+_CATCH_UP_RETRY_INTERVAL = 60
+
+# クエリごとの配信のロック（POST・スケジューラー・ストリームの配信が同じアウトボックス・配信済みIDを同時に更新しないようにする）
+_delivery_locks: dict = {}
+_delivery_locks_lock = threading.Lock()
+
+
+def _delivery_lock(name):
+    """クエリの配信のロック"""
+    with _delivery_locks_lock:
+        return _delivery_locks.setdefault(name, threading.Lock())
+
+
+def _uses_rich_embeds():
+    """includes から組み立てた embed で投稿するかどうか"""
+    return DISCORD_PACK_MODE == "embeds" and DISCORD_EMBED_STYLE == "rich"
+
+
+def _resolve_entry(tweet, users_idx, media_idx):
+    """
+    ページの includes から1件のツイートの転送に必要な情報を取り出す
+
+    Returns:
+        tuple: (ツイート, ユーザー名, ツイートURL, embed)。embed は includes から組み立てる場合のみ
+    """
+    username = users_idx.get(tweet.get("author_id"), {}).get("username", "unknown")
+    embed = build_rich_embed(tweet, users_idx, media_idx) if _uses_rich_embeds() else None
+    return tweet, username, get_tweet_url(tweet, users_idx), embed
+
+
+def _build_message(tweet, username, tweet_url, embed=None):
+    """1件のツイートから discord_post の引数を組み立てる"""
+    if DISCORD_PACK_MODE == "embeds":
+        return {"embed": embed or build_simple_embed(tweet, username, tweet_url)}
+    return {"content": tweet_url}
+
+
+def _deferred(deferred_until, forwarded=0):
+    """レート制限による延期を表す実行結果"""
+    return {"status": "deferred", "forwarded": forwarded, "deferred_until": deferred_until}
+
+
+def _is_delivered(tweet_ids, delivered):
+    """すべてのツイートが配信済みかどうか"""
+    return all(tweet_id in delivered for tweet_id in tweet_ids)
+
+
+def _open_outbox(spec):
+    """クエリの配信アウトボックスを開く（無効な場合は None）"""
+    return Outbox(spec.name, directory=OUTBOX_DIR) if OUTBOX_DIR else None
+
+
+def _open_delivered(spec):
+    """クエリの配信済みツイートIDを読み込む"""
+    tweet_ids = load_delivered_ids(spec.name) if DEDUP_MAX_IDS > 0 else []
+    return DeliveredIds(tweet_ids, max_size=DEDUP_MAX_IDS)
+
+
+def _deliver(spec, items, outbox, delivered):
+    """
+    配信しながら、配信済みツイートIDとアウトボックスの完了を記録する
+
+    Returns:
+        DeliveryResult: 配信結果
+    """
+
+    def on_delivered(item):
+        metrics.tweets_forwarded.inc(len(item.tweet_ids), query=spec.name)
+        delivered.add(item.tweet_ids)
+        if outbox is not None:
+            outbox.ack(item)
+
+    # 投稿の順番を待つ間に embed の画像のダウンロードを進めておく
+    prefetch([item.message for item in items])
+    try:
+        return deliver(items, post=discord_post, on_delivered=on_delivered)
+    finally:
+        # 一部が失敗しても、配信できた分は次回の重複判定に使う
+        if delivered.changed:
+            save_delivered_ids(delivered.to_list(), spec.name)
+
+
+def _drain_outbox(spec, outbox, delivered=None):
+    """
+    前回の実行で配信できなかったアウトボックスの残りを X API を呼ばずに配信する
+
+    Returns:
+        int: 配信した件数
+    """
+    if outbox is None:
+        return 0
+    items = outbox.pending()
+    if not items:
+        return 0
+
+    delivered = _open_delivered(spec) if delivered is None else delivered
+    logger.info(f"[{spec.name}] 前回の未配信分 {len(items)}件をアウトボックスから配信中...")
+    result = _deliver(spec, [item for item in items if not _is_delivered(item.tweet_ids, delivered)], outbox, delivered)
+    if result.error:
+        logger.error(f"[{spec.name}] 未配信分 {result.failed}件の配信に失敗しました（配信済み: {result.delivered}件）")
+        raise result.error
+    outbox.clear()
+    return result.delivered
+
+
+def _build_items(spec, entries):
+    """
+    ツイートを古い順に並べ、まとめて投稿する単位の配信アイテムにする
+
+    Args:
+        entries: (ツイート, ユーザー名, ツイートURL, embed) のリスト
+
+    Returns:
+        list[DeliveryItem]: 配信アイテム
+    """
+    # 古い順に送る（Discordの読みやすさ配慮）
+    # IDは桁数が異なりうるため、文字列ではなく数値として比較する
+    entries = sorted(entries, key=lambda entry: snowflake.sort_key(entry[0]["id"]))
+
+    labels = {tw["id"]: f"@{username}" for tw, username, _url, _embed in entries}
+    messages = [(tw["id"], _build_message(tw, username, tweet_url, embed)) for tw, username, tweet_url, embed in entries]
+    return [
+        DeliveryItem(
+            tweet_ids=tweet_ids,
+            message=message,
+            webhook_url=spec.webhook_url,
+            label=" ".join(labels[i] for i in tweet_ids),
+        )
+        for tweet_ids, message in pack_messages(messages, mode=DISCORD_PACK_MODE)
+    ]
+
+
+def _plan_pages(spec, query, since_id, until_id=None):
+    """
+    件数APIで新しいツイート数を確認し、取得するページ数を決める（X_COUNTS_PRECHECK が有効な場合のみ）
+
+    Returns:
+        int | None: 取得する最大ページ数（0 の場合は検索しない、None の場合は X_MAX_PAGES）
+    """
+    if not X_COUNTS_PRECHECK or not since_id:
+        return None
+    count = count_recent_tweets(query, since_id, **({"until_id": until_id} if until_id else {}))
+    if count is None:
+        return None
+    if count == 0:
+        logger.info(f"[{spec.name}] 新しいツイートがないため検索をスキップします")
+        return 0
+    if X_MAX_TWEETS and count > X_MAX_TWEETS:
+        logger.warning(f"[{spec.name}] 新しいツイート {count}件のうち、取得上限の {X_MAX_TWEETS}件のみ取得します")
+    # 確認してから検索するまでに増えた分のために1ページ余分に取得できるようにする
+    return min(X_MAX_PAGES, math.ceil(count / 100) + 1)
+
+
+def _fetch_new_tweets(spec, since_id, until_id=None):
+    """
+    X APIからページ単位でツイートを取得する
+
+    includes はページごとに解決して捨てるため、保持するのは転送に必要な情報のみ。
+    分割されたクエリの結果はツイートIDで重複を除いてまとめる。
+
+    Returns:
+        tuple: (ツイートID -> (ツイート, ユーザー名, ツイートURL, embed),
+                取得上限で打ち切った場合はこのIDより古いツイートが未取得、打ち切っていなければ None)
+
+    Raises:
+        RateLimitError: レート制限に達した場合
+    """
+    found = {}
+    truncated_at = None
+    for query in spec.queries:
+        max_pages = _plan_pages(spec, query, since_id, until_id)
+        if max_pages == 0:
+            continue
+        if not since_id:
+            # 初回実行・since_id の期限切れでは前回の実行との間がないため、最新の1ページのみ取得する
+            # （ページを辿ると過去7日分を上限まで転送してしまう）
+            max_pages = 1
+        options = {} if max_pages is None else {"max_pages": max_pages}
+        if until_id:
+            options["until_id"] = until_id
+        fetched = []
+        truncated = False
+        for page in iter_tweet_pages(since_id, query=query, **options):
+            # ユーザー・メディアの索引はデコード時に作られている
+            logger.info(f"[{spec.name}] ページ内のツイート数: {len(page.tweets)} / ユーザー数: {len(page.users)}")
+            for tw in page.tweets:
+                fetched.append(tw["id"])
+                if tw["id"] not in found:
+                    found[tw["id"]] = _resolve_entry(tw, page.users, page.media)
+            truncated = truncated or page.truncated
+        if truncated and fetched:
+            # 分割されたクエリごとの未取得の範囲をすべて含むように、最も新しい境界を使う
+            truncated_at = snowflake.max_id(filter(None, (truncated_at, snowflake.min_id(fetched))))
+    return found, truncated_at
+
+
+def _load_backfill(spec):
+    """前回までに取得上限で取得しなかった範囲を読み込む（7日を過ぎて検索できない範囲は破棄する）"""
+    window = load_backfill(spec.name)
+    if window and not is_since_id_valid(window["since_id"]):
+        logger.warning(f"[{spec.name}] 取得しなかった範囲が検索できる期間を過ぎたため破棄します: {window}")
+        save_backfill(None, spec.name)
+        return None
+    return window
+
+
+def _save_backfill(spec, previous, window):
+    """取得しなかった範囲が変わった場合のみ保存する"""
+    if window != previous:
+        save_backfill(window, spec.name)
+
+
+def _fetch_pending(spec):
+    """
+    まだ取得していないツイートを取得し、取得上限で取得しなかった範囲を決める
+
+    前回の取得上限で取得しなかった範囲があれば、新しいツイートより先にその範囲を取得する
+    （その間は since_id を進めず、範囲を取得し終えてから新しいツイートの取得に戻る）。
+
+    Returns:
+        tuple: (取得したツイート, 今回取得した未取得の範囲（なければ None）, 次回取得する範囲（なければ None）)
+
+    Raises:
+        RateLimitError: レート制限に達した場合
+    """
+    backfill = _load_backfill(spec)
+    if backfill:
+        logger.info(f"[{spec.name}] 取得上限で取得しなかったツイートを先に取得します: {backfill}")
+        since_id = backfill["since_id"]
+        found, truncated_at = _fetch_new_tweets(spec, since_id, backfill["until_id"])
+    else:
+        since_id = load_since_id(spec.name)
+        found, truncated_at = _fetch_new_tweets(spec, since_id)
+
+    window = None
+    if truncated_at:
+        metrics.x_api_walks_truncated.inc(query=spec.name)
+        if since_id:
+            window = {"since_id": since_id, "until_id": truncated_at}
+            logger.warning(f"[{spec.name}] 取得上限のため {truncated_at} より古いツイートは次回取得します")
+        else:
+            logger.warning(f"[{spec.name}] 初回実行のため、取得上限を超えた古いツイートは取得しません")
+    if backfill is None:
+        # since_id を進める前に保存し、途中で終了しても未取得の範囲を失わないようにする
+        _save_backfill(spec, backfill, window)
+    return found, backfill, window
+
+
+def _advance(spec, backfill, window, newest):
+    """取得済みの位置を進める（未取得の範囲を取得した場合は範囲を、それ以外は since_id を newest に更新する）"""
+    if backfill is not None:
+        _save_backfill(spec, backfill, window)
+    elif newest:
+        save_since_id(newest, spec.name)
+
+
+def forward_query(spec):
+    """
+    1件のクエリについてツイートの取得と転送を実行する
+
+    Args:
+        spec: 監視クエリ（QuerySpec）
+
+    Returns:
+        dict: 実行結果（status: success / deferred）
+    """
+    with query_context(spec.name), _delivery_lock(spec.name):
+        return _forward_query(spec)
+
+
+def _forward_query(spec):
+    """forward_query の本体"""
+    logger.info(f"[{spec.name}] ツイートの取得と転送を開始")
+
+    # 前回の実行が途中で終わっていれば、新しいツイートより先に残りを配信する
+    outbox = _open_outbox(spec)
+    delivered = _open_delivered(spec)
+    drained = _drain_outbox(spec, outbox, delivered)
+
+    try:
+        found, backfill, window = _fetch_pending(spec)
+    except RateLimitError as e:
+        # 途中のページまでで転送すると古いツイートを取りこぼすため、今回は何も転送しない
+        logger.warning(f"[{spec.name}] レート制限のため今回の実行を延期します（取得済みのツイートは次回再取得）")
+        save_deferred_until(e.reset_at)
+        return _deferred(e.reset_at, drained)
+
+    # 取得上限で取得しなかった範囲は実行結果にも含める（範囲を取得した実行では、残りがなくても None で含める）
+    summary = {"status": "success", "backfill": window} if window or backfill else {"status": "success"}
+
+    # 配信済みのツイートは送らない（since_id が無効になり再取得した場合など）
+    entries = [entry for tweet_id, entry in found.items() if tweet_id not in delivered]
+    if len(entries) < len(found):
+        logger.info(f"[{spec.name}] 配信済みのツイート {len(found) - len(entries)}件をスキップします")
+    if not entries:
+        _advance(spec, backfill, window, snowflake.max_id(found))
+        logger.info(f"[{spec.name}] 新しいツイートはありません")
+        return {**summary, "forwarded": drained}
+
+    logger.info(f"[{spec.name}] 取得したツイート数: {len(entries)}")
+
+    logger.info(f"[{spec.name}] ツイートをDiscordに転送中...")
+    items = _build_items(spec, entries)
+
+    if outbox is None:
+        result = _deliver(spec, items, outbox, delivered)
+        # 次回用に、先頭から途切れずに配信できた最後のIDを保存
+        # 未取得の範囲の配信に失敗した場合は、次回も同じ範囲を取得する（配信済みのツイートは送らない）
+        if backfill is None or not result.error:
+            _advance(spec, backfill, window, result.committed_id)
+    else:
+        # アウトボックスに書き出した時点で取得済みとし、since_id（取得しなかった範囲）を進める
+        # 未配信分は次回アウトボックスから再開するため、X API から再取得しない
+        outbox.put(items)
+        _advance(spec, backfill, window, snowflake.max_id(found))
+        result = _deliver(spec, items, outbox, delivered)
+
+    if result.error:
+        logger.error(f"[{spec.name}] {result.failed}件の配信に失敗しました（配信済み: {result.delivered}件）")
+        raise result.error
+    if outbox is not None:
+        outbox.clear()
+    logger.info(f"[{spec.name}] 処理完了。{result.delivered}件のツイートを転送しました")
+    return {**summary, "forwarded": drained + result.delivered}
+
 
 def fetch_and_forward():
-    """ツイートの取得と転送を実行する"""
+    """
+    すべての監視クエリについてツイートの取得と転送を並行に実行する
+
+    Returns:
+        dict: 実行結果（status: success / deferred、クエリごとの結果は queries）
+    """
+    with run_context(), metrics.run_seconds.time():
+        try:
+            result = _fetch_and_forward()
+        except Exception:
+            metrics.runs.inc(status="error")
+            raise
+    metrics.runs.inc(status=result["status"])
+    return result
+
+
+def _fetch_and_forward():
+    """fetch_and_forward の本体"""
     logger.info("ツイートの取得と転送を開始")
 
-    since_id = load_since_id()
+    # レート制限の再開時刻までは X API を呼ばない
+    specs = load_query_specs()
+    deferred_until = load_deferred_until()
+    if deferred_until and time.time() < deferred_until:
+        logger.info(f"レート制限の再開時刻（{deferred_until}）前のため、X APIの呼び出しをスキップします")
+        # アウトボックスの未配信分は X API を使わないため、待機中でも配信する
+        drained = 0
+        for spec in specs:
+            with _delivery_lock(spec.name):
+                drained += _drain_outbox(spec, _open_outbox(spec))
+        return _deferred(deferred_until, drained)
+
+    # 呼び出し枠・読み取り予算はほかの実行・インスタンスと共有する
+    quota = get_manager()
+    quota.restore(load_quota_state())
+    # 再開時刻・月・予算の読み取り数が変わった場合のみ保存する（呼び出しのたびに Secret Manager に書き込まない）
+    changes = quota.changes
+
+    results = {}
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(QUERY_MAX_WORKERS, len(specs)))) as executor:
+            # ログの相関IDをクエリごとのスレッドに引き継ぐ
+            futures = [(spec, executor.submit(contextvars.copy_context().run, forward_query, spec)) for spec in specs]
+            for spec, future in futures:
+                try:
+                    results[spec.name] = future.result()
+                except Exception as e:
+                    logger.exception(f"[{spec.name}] クエリの処理に失敗")
+                    errors.append(e)
+    finally:
+        if quota.changes != changes:
+            save_quota_state(quota.to_dict())
+
+    # 一部のクエリが失敗しても、他のクエリの結果（since_id）は保存済み
+    if errors:
+        raise errors[0]
+
+    forwarded = sum(r["forwarded"] for r in results.values())
+    deferred = [r["deferred_until"] for r in results.values() if r["status"] == "deferred"]
+    summary = _deferred(max(deferred), forwarded) if deferred else {"status": "success", "forwarded": forwarded}
+    summary["queries"] = results
+    return summary
 
-    # X APIからツイートを取得
-    payload = fetch_tweets(since_id)
-    if payload is None:
-        return
 
-    tweets = payload.get("data", [])
-    includes = payload.get("includes", {})
-    users_idx = build_index(includes.get("users", []))
+def _forward_stream_tweets(spec, found, caught_up=None):
+    """
+    ストリームで受け取った1件のクエリ分のツイートを、ポーリングと同じ配信処理で転送する
 
-    if not tweets:
-        logger.info("新しいツイートはありません")
+    Args:
+        spec: 監視クエリ（QuerySpec）
+        found: ツイートID -> (ツイート, ユーザー名, ツイートURL, embed)
+        caught_up: 接続してから切断中のツイートを取得し終えたクエリ名の集合（None の場合は取得済みとする）
+
+    Returns:
+        int: 配信した件数（アウトボックスの残りを含む）
+    """
+    # 配信済みIDはキャッチアップの実行でも更新されるため、まとめて転送するたびに読み込む
+    outbox = _open_outbox(spec)
+    delivered = _open_delivered(spec)
+    drained = _drain_outbox(spec, outbox, delivered)
+
+    entries = [entry for tweet_id, entry in found.items() if tweet_id not in delivered]
+    if not entries:
+        return drained
+
+    items = _build_items(spec, entries)
+    if outbox is not None:
+        outbox.put(items)
+    result = _deliver(spec, items, outbox, delivered)
+    if result.error:
+        logger.error(f"[{spec.name}] {result.failed}件の配信に失敗しました（配信済み: {result.delivered}件）")
+        raise result.error
+    if outbox is not None:
+        outbox.clear()
+
+    _advance_stream(spec, found, caught_up)
+    logger.info(f"[{spec.name}] ストリームから{result.delivered}件のツイートを転送しました")
+    return drained + result.delivered
+
+
+def _advance_stream(spec, found, caught_up):
+    """
+    ポーリングに戻したときに、ストリームで転送済みのツイートを再取得しないよう since_id を進める
+
+    切断中のツイートをまだ取得していない場合は、since_id からストリームで受け取った最も古いツイートまでを
+    取得しなかった範囲として保存してから進める（既に別の範囲がある場合は since_id を進めない）。
+    """
+    newest = snowflake.max_id(found)
+    since_id = load_since_id(spec.name)
+    if since_id and snowflake.compare(newest, since_id) <= 0:
         return
+    if since_id and caught_up is not None and spec.name not in caught_up:
+        if load_backfill(spec.name) is not None:
+            logger.warning(f"[{spec.name}] 切断中のツイートを取得するまで since_id を進めません")
+            return
+        window = {"since_id": since_id, "until_id": snowflake.min_id(found)}
+        logger.warning(f"[{spec.name}] 切断中のツイートは未取得のため、次回の取得で取得します: {window}")
+        save_backfill(window, spec.name)
+        # この接続で受け取るツイートは途切れないため、以降は since_id を進めてよい
+        caught_up.add(spec.name)
+    save_since_id(newest, spec.name)
 
-    logger.info(f"取得したツイート数: {len(tweets)}")
-    logger.info(f"取得したユーザー数: {len(includes.get('users', []))}")
 
-    # 古い順に送る（Discordの読みやすさ配慮）
-    tweets_sorted = sorted(tweets, key=lambda t: t["id"])
-    logger.info("ツイートをDiscordに転送中...")
+def _forward_stream_batch(specs, events, caught_up=None):
+    """
+    ストリームで受け取ったツイートを、一致したルールのタグ（クエリ名）ごとに転送する
+
+    Returns:
+        int: 配信した件数
+    """
+    found = {}
+    for event in events:
+        page = index_page(event)
+        for tw in page.tweets:
+            entry = _resolve_entry(tw, page.users, page.media)
+            for rule in event.get("matching_rules", []):
+                name = rule.get("tag")
+                if name in specs:
+                    found.setdefault(name, {}).setdefault(tw["id"], entry)
+
+    forwarded = 0
+    for name, tweets in found.items():
+        # 同じクエリのポーリング（キャッチアップ・POST・スケジューラー）の配信が終わるまで待つ
+        with query_context(name), _delivery_lock(name):
+            try:
+                forwarded += _forward_stream_tweets(specs[name], tweets, caught_up)
+            except Exception:
+                # 配信できなかった分はアウトボックスに残り、次に受け取ったときに再送する
+                logger.exception(f"[{name}] ストリームのツイートの転送に失敗")
+    return forwarded
+
+
+def _catch_up(specs):
+    """
+    接続していなかった間のツイートを search/recent で取得して転送する
+
+    Returns:
+        tuple: (取得し終えたクエリ名の集合, 取得し直す時刻（UNIX秒、すべて取得し終えた場合は None）)
+    """
+    logger.info("ストリームの切断中のツイートを取得します")
+    try:
+        result = fetch_and_forward()
+    except Exception:
+        logger.exception("切断中のツイートの取得に失敗")
+        return set(), time.time() + _CATCH_UP_RETRY_INTERVAL
+
+    # 延期したクエリ・未取得の範囲を取得したクエリは、新しいツイートまで取得し終えていない
+    done = {
+        name for name, query in result.get("queries", {}).items() if query["status"] == "success" and "backfill" not in query
+    }
+    if done >= set(specs):
+        return done, None
+    logger.warning(f"切断中のツイートを取得し終えていないクエリがあります: {sorted(set(specs) - done)}")
+    return done, result.get("deferred_until") or time.time() + _CATCH_UP_RETRY_INTERVAL
 
-    for i, tw in enumerate(tweets_sorted, 1):
-        user = users_idx.get(tw["author_id"], {})
-        username = user.get("username", "unknown")
-        logger.info(f"ツイート {i}/{len(tweets_sorted)} を処理中: @{username}")
-        tweet_url = get_tweet_url(tw, users_idx)
-        discord_post(content=tweet_url)
 
-    # 次回用に最大IDを保存
-    max_id = max(t["id"] for t in tweets_sorted)
-    save_since_id(max_id)
-    logger.info(f"処理完了。{len(tweets)}件のツイートを転送しました")
+def _forward_stream_events(specs, events):
+    """キューからストリームのツイートを取り出し、STREAM_BATCH_WAIT 秒分ずつまとめて転送する"""
+    # 切断中のツイートを取得し終えたクエリ（取得しない設定の場合はすべて）
+    caught_up = set() if STREAM_CATCH_UP else set(specs)
+    retry_at = None
+    pending = None
+    while True:
+        event = events.get() if pending is None else pending
+        pending = None
+        if event is _STOP:
+            return
+        if event is _CATCH_UP:
+            # 再接続したので、切断中のツイートを取得し終えるまで since_id を進めない
+            caught_up, retry_at = _catch_up(specs)
+            continue
+        if retry_at is not None and time.time() >= retry_at:
+            done, retry_at = _catch_up(specs)
+            caught_up |= done
+
+        batch = [event]
+        deadline = time.monotonic() + STREAM_BATCH_WAIT
+        while len(batch) < STREAM_BATCH_MAX:
+            try:
+                event = events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if event is _STOP or event is _CATCH_UP:
+                pending = event
+                break
+            batch.append(event)
+        _forward_stream_batch(specs, batch, caught_up)
+
+
+def stream_and_forward(stop_event=None):
+    """
+    フィルタードストリームで受け取ったツイートを、stop_event がセットされるまで転送し続ける
+
+    受け取りと配信は別スレッドで行い、配信中もストリームの読み込みを止めない。
+
+    Args:
+        stop_event: 停止を指示する threading.Event
+    """
+    specs = {spec.name: spec for spec in load_query_specs()}
+    sync_rules(build_rules(specs.values()))
+
+    events = queue.Queue()
+    # ログの相関IDを配信スレッドに引き継ぐ
+    worker = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_forward_stream_events, specs, events),
+        name="stream-forwarder",
+        daemon=True,
+    )
+    worker.start()
+    try:
+        on_connect = (lambda: events.put(_CATCH_UP)) if STREAM_CATCH_UP else None
+        run_stream(events.put, stop_event, on_connect=on_connect)
+    finally:
+        # 受け取り済みのツイートを配信してから終了する
+        events.put(_STOP)
+        worker.join()
+
+
+def run_bot():
+    """
+    環境変数を検証してボットを1回実行する（失敗時は例外を送出）
+
+    Returns:
+        dict: 実行結果
+    """
+    if not validate_env_vars():
+        raise RuntimeError("環境変数の検証に失敗しました")
+    return fetch_and_forward()
 
 
 def main():
@@ -59,12 +646,53 @@ def main():
         sys.exit(1)
 
     try:
-        fetch_and_forward()
+        result = fetch_and_forward()
         logger.info("=== ASAI X Bot 正常終了 ===")
+        return result
     except Exception:
         logger.exception("=== ASAI X Bot 異常終了 ===")
         sys.exit(1)
 
 
+def _stop_event_on_signals():
+    """SIGTERM / SIGINT でセットされる停止用のイベント"""
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop_event.set())
+    return stop_event
+
+
+def loop_main():
+    """内蔵スケジューラーで繰り返し実行するメイン関数（SIGTERM / SIGINT で停止）"""
+    logger.info("=== ASAI X Bot 定期実行モード開始 ===")
+
+    if not validate_env_vars():
+        logger.error("環境変数の検証に失敗しました")
+        sys.exit(1)
+
+    run_scheduler(fetch_and_forward, _stop_event_on_signals(), get_rate_limit=get_rate_limit_status)
+    logger.info("=== ASAI X Bot 定期実行モード終了 ===")
+
+
+def stream_main():
+    """ストリームモードのメイン関数（SIGTERM / SIGINT で停止）"""
+    logger.info("=== ASAI X Bot ストリームモード開始 ===")
+
+    if not validate_env_vars():
+        logger.error("環境変数の検証に失敗しました")
+        sys.exit(1)
+
+    # 停止はキープアライブ（約20秒ごと）またはツイートを受け取った時点で反映される
+    stop_event = _stop_event_on_signals()
+
+    try:
+        with run_context():
+            stream_and_forward(stop_event)
+        logger.info("=== ASAI X Bot ストリームモード終了 ===")
+    except Exception:
+        logger.exception("=== ASAI X Bot ストリームモード異常終了 ===")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
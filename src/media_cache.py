@@ -0,0 +1,332 @@
+"""
+ツイートの画像のローカルキャッシュと Discord への添付
+
+X のメディアURLを embed に載せたままにすると、Discord が投稿のたびに画像を取りに行き、URLが失効すると表示されなくなる。
+MEDIA_CACHE_DIR を設定すると、embed の画像を次のように扱う。
+
+- 取得: 画像は共有のスレッドプールで1回だけダウンロードする（同じURLの同時取得は1回にまとめる）
+- 保存: 内容の SHA-256 をファイル名にしてディスクに保存する（複数の公式アカウントが同じ画像を投稿しても1ファイル）。
+  MEDIA_CACHE_MAX_AGE 秒より古いファイルを削除し、MEDIA_CACHE_MAX_BYTES を超えたら使われていない順に削除する
+- 添付: Webhook にマルチパートで添付し、embed からは attachment:// で参照する。
+  アップロードした画像の Discord のURLを記録し、期限内に同じ画像を投稿する場合は再アップロードせずにそのURLを使う
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+import transport
+from config import (
+    MEDIA_CACHE_DIR,
+    MEDIA_CACHE_MAX_AGE,
+    MEDIA_CACHE_MAX_BYTES,
+    MEDIA_MAX_BYTES,
+    MEDIA_MAX_WORKERS,
+    MEDIA_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+# アップロードした添付ファイルの Discord のURLを使い回す時間（秒、Discord のURLは約24時間で失効する）
+UPLOADED_URL_TTL = 12 * 3600
+
+_cache = None
+_cache_lock = threading.Lock()
+_executor = None
+_inflight: dict = {}
+# fetch の中から _get_executor を呼び、完了済みの Future のコールバックも同じスレッドで呼ばれるため再入可能にする
+_inflight_lock = threading.RLock()
+
+
+def _extension(url, content_type):
+    """Content-Type（なければURL）からファイルの拡張子を決める"""
+    ext = mimetypes.guess_extension((content_type or "").split(";")[0].strip()) if content_type else None
+    if not ext:
+        ext = os.path.splitext(urlsplit(url).path)[1]
+    return ".jpg" if ext in (".jpe", ".jpeg") else ext or ".bin"
+
+
+class MediaCache:
+    """
+    内容のハッシュで保存するメディアのディスクキャッシュ（スレッドセーフ）
+
+    Args:
+        directory: 保存先のディレクトリ
+        max_bytes: 保存するファイルの合計サイズの上限
+        max_age: ファイルを保持する秒数
+    """
+
+    def __init__(self, directory, max_bytes=MEDIA_CACHE_MAX_BYTES, max_age=MEDIA_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # メディアURL -> {"file": ファイル名, "content_type": ..., "uploaded_url": ..., "uploaded_at": ...}
+        self._index = self._load_index()
+        self.size = 0
+        self.evict()
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"メディアキャッシュの索引の読み込みに失敗したため作り直します: {e}")
+            return {}
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, separators=(",", ":"))
+        os.replace(tmp_path, self._index_path())
+
+    def path(self, filename):
+        """キャッシュ内のファイルのパス"""
+        return os.path.join(self.directory, filename)
+
+    def lookup(self, url, now=None):
+        """
+        キャッシュ済みのメディアを探す（見つかった場合は最終使用時刻を更新する）
+
+        Returns:
+            dict | None: 索引のエントリ（file / content_type など）
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return None
+            path = self.path(entry["file"])
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    return None
+                os.utime(path, (now, now))
+            except OSError:
+                return None
+            return dict(entry)
+
+    def store(self, url, content, content_type=None, now=None):
+        """
+        メディアを保存する（同じ内容のファイルがあれば書き込まない）
+
+        Returns:
+            dict: 索引のエントリ
+        """
+        now = time.time() if now is None else now
+        filename = hashlib.sha256(content).hexdigest() + _extension(url, content_type)
+        path = self.path(filename)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path, (now, now))
+            else:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                os.utime(path, (now, now))
+                self.size += len(content)
+            entry = self._index[url] = {"file": filename, "content_type": content_type}
+            self._save_index()
+        if self.size > self.max_bytes:
+            self.evict(now)
+        return dict(entry)
+
+    def uploaded_url(self, url, now=None):
+        """期限内にアップロードした Discord のURL（なければ None）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._index.get(url) or {}
+            if entry.get("uploaded_url") and now - entry.get("uploaded_at", 0) < UPLOADED_URL_TTL:
+                return entry["uploaded_url"]
+            return None
+
+    def record_upload(self, filename, uploaded_url, now=None):
+        """アップロードしたファイルの Discord のURLを、同じ内容のすべてのメディアURLに記録する"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for entry in self._index.values():
+                if entry["file"] == filename:
+                    entry["uploaded_url"] = uploaded_url
+                    entry["uploaded_at"] = now
+            self._save_index()
+
+    def evict(self, now=None):
+        """古いファイルを削除し、合計サイズが上限を超えていれば使われていない順に削除する"""
+        now = time.time() if now is None else now
+        with self._lock:
+            files = []
+            for name in os.listdir(self.directory):
+                if name == INDEX_FILE or name.endswith(".tmp"):
+                    continue
+                with contextlib.suppress(OSError):
+                    stat = os.stat(self.path(name))
+                    files.append((stat.st_mtime, stat.st_size, name))
+            files.sort()
+
+            total = sum(size for _mtime, size, _name in files)
+            removed = set()
+            for mtime, size, name in files:
+                if now - mtime <= self.max_age and total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.path(name))
+                total -= size
+                removed.add(name)
+
+            self.size = total
+            if removed:
+                logger.info(f"メディアキャッシュから{len(removed)}件のファイルを削除しました（残り {total}バイト）")
+                self._index = {url: entry for url, entry in self._index.items() if entry["file"] not in removed}
+                self._save_index()
+
+
+def get_cache():
+    """プロセスで共有する MediaCache（MEDIA_CACHE_DIR が未設定の場合は None）"""
+    global _cache  # noqa: PLW0603
+
+    if not MEDIA_CACHE_DIR:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = MediaCache(MEDIA_CACHE_DIR)
+        return _cache
+
+
+def _get_executor():
+    global _executor  # noqa: PLW0603
+
+    with _inflight_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MEDIA_MAX_WORKERS, thread_name_prefix="media")
+        return _executor
+
+
+def _download(cache, url):
+    """メディアをダウンロードしてキャッシュに保存する（失敗した場合・大きすぎる場合は None）"""
+    try:
+        res = transport.request("GET", url, timeout=MEDIA_TIMEOUT)
+        res.raise_for_status()
+        content = res.content
+        if len(content) > MEDIA_MAX_BYTES:
+            metrics.media_fetches.inc(result="too_large")
+            logger.warning(f"メディアが添付できるサイズを超えているため、URLのまま投稿します: {url}（{len(content)}バイト）")
+            return None
+        entry = cache.store(url, content, res.headers.get("Content-Type"))
+    except Exception as e:
+        metrics.media_fetches.inc(result="error")
+        logger.warning(f"メディアの取得に失敗したため、URLのまま投稿します: {url}: {e}")
+        return None
+    metrics.media_fetches.inc(result="downloaded")
+    return entry
+
+
+def _fetch(cache, url):
+    entry = cache.lookup(url)
+    if entry is not None:
+        metrics.media_fetches.inc(result="hit")
+        return entry
+    return _download(cache, url)
+
+
+def fetch(url, cache=None):
+    """
+    メディアをキャッシュから取り出す（なければ共有のスレッドプールでダウンロードする）
+
+    同じURLを同時に取得する場合はダウンロードを1回にまとめる。
+
+    Returns:
+        Future: 索引のエントリ（取得できなかった場合は None）を返す Future
+    """
+    cache = cache or get_cache()
+    with _inflight_lock:
+        future = _inflight.get(url)
+        if future is None:
+            future = _inflight[url] = _get_executor().submit(_fetch, cache, url)
+            future.add_done_callback(lambda _future: _release(url))
+    return future
+
+
+def _release(url):
+    with _inflight_lock:
+        _inflight.pop(url, None)
+
+
+def image_urls(message):
+    """discord_post の引数に含まれる embed の画像URL"""
+    embeds = [message["embed"]] if message.get("embed") else []
+    embeds += message.get("embeds") or []
+    return [embed["image"]["url"] for embed in embeds if embed.get("image", {}).get("url")]
+
+
+def prefetch(messages):
+    """配信前に embed の画像のダウンロードを始めておく（キャッシュが無効な場合は何もしない）"""
+    cache = get_cache()
+    if cache is None:
+        return
+    for message in messages:
+        for url in image_urls(message):
+            if cache.uploaded_url(url) is None:
+                fetch(url, cache)
+
+
+def attach(embeds, cache=None):
+    """
+    embed の画像を添付ファイルに置き換える
+
+    アップロード済みの画像は Discord のURLに置き換え、それ以外はキャッシュから読み込んで attachment:// で参照する。
+    取得できなかった画像は元のURLのままにする。
+
+    Args:
+        embeds: Webhook に送る embed のリスト（画像のURLを書き換える）
+
+    Returns:
+        list: (ファイル名, 内容, Content-Type) のリスト（同じファイルは1回のみ）
+    """
+    cache = cache or get_cache()
+    files = {}
+    for embed in embeds:
+        url = embed.get("image", {}).get("url")
+        if not url or url.startswith("attachment://"):
+            continue
+        uploaded_url = cache.uploaded_url(url)
+        if uploaded_url:
+            metrics.media_uploads.inc(result="reused")
+            embed["image"] = {"url": uploaded_url}
+            continue
+        entry = fetch(url, cache).result()
+        if entry is None:
+            continue
+        filename = entry["file"]
+        if filename not in files:
+            try:
+                with open(cache.path(filename), "rb") as f:
+                    files[filename] = (filename, f.read(), entry.get("content_type") or "application/octet-stream")
+            except OSError as e:
+                logger.warning(f"キャッシュしたメディアの読み込みに失敗したため、URLのまま投稿します: {url}: {e}")
+                continue
+        embed["image"] = {"url": f"attachment://{filename}"}
+    return list(files.values())
+
+
+def record_uploads(response_json, cache=None):
+    """Webhook のレスポンス（wait=true）の添付ファイルの Discord のURLを記録する"""
+    cache = cache or get_cache()
+    for attachment in response_json.get("attachments", []):
+        if attachment.get("filename") and attachment.get("url"):
+            metrics.media_uploads.inc(result="uploaded")
+            cache.record_upload(attachment["filename"], attachment["url"])
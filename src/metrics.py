@@ -0,0 +1,208 @@
+"""
+Prometheus 形式のメトリクス
+
+外部ライブラリを使わない軽量なカウンター・ヒストグラムで、1回の実行の時間がどこで使われているか
+（X API の取得、Discord への投稿、Secret Manager の読み書きなど）を計測する。
+server.py の GET /metrics でテキスト形式（exposition format 0.0.4）として公開する。
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+NAMESPACE = "asai_x_bot"
+
+# 秒単位の所要時間のバケット
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# バイト単位のサイズのバケット
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# 件数のバケット
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values, strict=True), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """ラベルつきメトリクスの基底クラス"""
+
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        """記録した値を消去する（テスト用）"""
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        """テキスト形式に変換する"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """カウンターを増やす"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """現在の値"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """値の分布（累積バケット・合計・件数）"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, value, **labels):
+        """値を記録する"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """ブロックの所要時間（秒）を記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """記録した件数"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+@contextmanager
+def track(counter, histogram, **labels):
+    """ブロックの所要時間と結果（ok / error）を記録する"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        counter.inc(result="error", **labels)
+        raise
+    else:
+        counter.inc(result="ok", **labels)
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def render():
+    """すべてのメトリクスをテキスト形式で返す"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def reset():
+    """すべてのメトリクスの値を消去する（テスト用）"""
+    for metric in _registry:
+        metric.reset()
+
+
+# X API
+x_api_requests = Counter("x_api_requests_total", "X APIへのリクエスト数", ["status"])
+x_api_request_seconds = Histogram("x_api_request_seconds", "X APIの1ページ取得の所要時間")
+x_api_page_bytes = Histogram("x_api_page_bytes", "X APIの1ページのレスポンスサイズ", buckets=SIZE_BUCKETS)
+x_api_page_tweets = Histogram("x_api_page_tweets", "X APIの1ページのツイート数", buckets=COUNT_BUCKETS)
+count_prechecks = Counter(
+    "count_prechecks_total", "件数APIによる検索前の確認の回数（result: empty / found / error）", ["result"]
+)
+x_api_walks_truncated = Counter("x_api_walks_truncated_total", "取得上限により古いツイートを取得しきれなかった回数", ["query"])
+quota_throttled = Counter("quota_throttled_total", "呼び出し枠・読み取り予算によりX APIを呼ばなかった回数", ["reason"])
+stream_connections = Counter("stream_connections_total", "フィルタードストリームへの接続数", ["status"])
+stream_tweets = Counter("stream_tweets_total", "フィルタードストリームで受け取ったツイート数")
+stream_restarts = Counter("stream_restarts_total", "異常終了したストリームモードを再開した回数")
+
+# Discord
+discord_posts = Counter("discord_posts_total", "DiscordのWebhook呼び出し数", ["status"])
+discord_post_seconds = Histogram("discord_post_seconds", "DiscordのWebhook呼び出しの所要時間")
+
+media_fetches = Counter(
+    "media_fetches_total", "embed の画像の取得数（result: hit / downloaded / too_large / error）", ["result"]
+)
+media_uploads = Counter("media_uploads_total", "embed の画像の添付数（result: uploaded / reused）", ["result"])
+
+# レート制限（api: x / discord）
+rate_limited = Counter("rate_limited_total", "HTTP 429 の応答数", ["api"])
+
+# 状態の保存・読み込み
+secret_manager_operations = Counter("secret_manager_operations_total", "Secret Managerの読み書き回数", ["operation", "result"])
+secret_manager_seconds = Histogram("secret_manager_seconds", "Secret Managerの読み書きの所要時間", ["operation"])
+state_operation_seconds = Histogram("state_operation_seconds", "状態の読み込み・保存の所要時間", ["operation"])
+
+# 実行
+tweets_forwarded = Counter("tweets_forwarded_total", "Discordに転送したツイート数", ["query"])
+runs = Counter("runs_total", "ツイートの取得と転送の実行回数", ["status"])
+run_seconds = Histogram("run_seconds", "ツイートの取得と転送の1回の実行の所要時間")
@@ -0,0 +1,123 @@
+"""
+配信アウトボックス（ディスク上の先行書き込みログ）
+
+取得したツイートを配信前にログへ書き出してから since_id を進め、
+配信できたものから1件ずつ完了を記録する。
+途中でプロセスが落ちた場合、次回の実行は X API を呼ばずにログの未配信分から再開する。
+
+ログは1行1レコードのJSON Lines形式で、追記のたびに fsync する。
+- {"op": "put", "id": ..., "tweet_ids": [...], "message": {...}, "webhook_url": ..., "label": ...}
+- {"op": "ack", "id": ...}
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+
+from config import OUTBOX_DIR
+from delivery import DeliveryItem
+
+logger = logging.getLogger(__name__)
+
+
+def _item_key(item):
+    """ログ上で配信単位を識別するキー（含まれる最後のツイートID）"""
+    return item.tweet_ids[-1]
+
+
+class Outbox:
+    """クエリごとの配信アウトボックス"""
+
+    def __init__(self, name, directory=None):
+        self.path = os.path.join(directory or OUTBOX_DIR, f"outbox-{name}.jsonl")
+        self._lock = threading.Lock()
+
+    def _append(self, records):
+        """レコードを追記してディスクに書き込む"""
+        lines = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self):
+        """
+        ログを再生して未配信の配信単位を求める
+
+        Returns:
+            tuple: (キー -> put レコードの辞書（追記順）, 壊れた行があったか)
+        """
+        pending: dict[str, dict] = {}
+        corrupted = False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた行は無視する（fsync 前の put は since_id も未保存）
+                        corrupted = True
+                        continue
+                    if record.get("op") == "put":
+                        pending[record["id"]] = record
+                    elif record.get("op") == "ack":
+                        pending.pop(record["id"], None)
+        except FileNotFoundError:
+            pass
+        return pending, corrupted
+
+    def pending(self):
+        """
+        未配信の配信単位を古い順に取得する
+
+        Returns:
+            list[DeliveryItem]: 未配信の配信単位
+        """
+        records, corrupted = self._replay()
+        if corrupted:
+            logger.warning(f"アウトボックス {self.path} に壊れた行があるため、未配信分のみで書き直します")
+            self._rewrite(records.values())
+        return [
+            DeliveryItem(
+                tweet_ids=record["tweet_ids"],
+                message=record["message"],
+                webhook_url=record.get("webhook_url"),
+                label=record.get("label", ""),
+            )
+            for record in records.values()
+        ]
+
+    def _rewrite(self, records):
+        """ログを指定したレコードだけで置き換える"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def put(self, items):
+        """配信前の配信単位をログに書き出す"""
+        self._append(
+            {
+                "op": "put",
+                "id": _item_key(item),
+                "tweet_ids": item.tweet_ids,
+                "message": item.message,
+                "webhook_url": item.webhook_url,
+                "label": item.label,
+            }
+            for item in items
+        )
+        logger.info(f"アウトボックスに {len(items)} 件を書き出しました")
+
+    def ack(self, item):
+        """配信単位の配信完了を記録する"""
+        self._append([{"op": "ack", "id": _item_key(item)}])
+
+    def clear(self):
+        """すべて配信済みになったログを削除する"""
+        with self._lock, contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
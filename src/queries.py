@@ -0,0 +1,102 @@
+"""
+監視クエリの設定
+
+QUERIES（JSON文字列）または QUERIES_FILE（JSONファイル）で複数の名前付きクエリを設定できる。
+
+    [
+        {"name": "asai", "query": "#浅井恋乃未", "webhook_url": "https://discord.com/api/webhooks/..."},
+        {"name": "official", "query": "from:sakurazaka46"}
+    ]
+
+query の代わりに hashtags / accounts / keywords / filters を指定すると、
+query_planner がクエリ長の上限に収まるように必要最小限のクエリへ分割する。
+
+    {"name": "asai", "hashtags": ["浅井恋乃未"], "accounts": ["sakurazaka46", "anan_mag"]}
+
+webhook_url を省略したクエリは DISCORD_WEBHOOK_URL に転送する。
+どちらも未設定の場合は QUERY / DISCORD_WEBHOOK_URL の1件のみを監視する。
+"""
+
+import json
+import re
+from dataclasses import dataclass
+
+from config import DEFAULT_QUERY_NAME, QUERIES, QUERIES_FILE, QUERY, WEBHOOK_URL
+from query_planner import plan_queries
+
+# シークレットIDやファイル名に使うため英数字・ハイフン・アンダースコアのみ許可
+QUERY_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+# 構造化されたクエリ設定のキー
+STRUCTURED_KEYS = ("hashtags", "accounts", "keywords")
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    """名前付きの監視クエリ（queries は結果をまとめて扱う検索クエリのリスト）"""
+
+    name: str
+    queries: tuple[str, ...]
+    webhook_url: str | None = None
+
+
+def _build_queries(name, raw):
+    """クエリ設定から検索クエリのリストを組み立てる"""
+    if raw.get("query"):
+        return (raw["query"],)
+    if any(raw.get(key) for key in STRUCTURED_KEYS):
+        return tuple(
+            plan_queries(
+                hashtags=raw.get("hashtags", ()),
+                accounts=raw.get("accounts", ()),
+                keywords=raw.get("keywords", ()),
+                filters=raw.get("filters", ()),
+            )
+        )
+    raise ValueError(f"クエリ {name} の query（または hashtags / accounts / keywords）が設定されていません")
+
+
+def _load_raw_queries():
+    """QUERIES / QUERIES_FILE からクエリ設定を読み込み"""
+    if QUERIES:
+        return json.loads(QUERIES)
+    if QUERIES_FILE:
+        with open(QUERIES_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def load_query_specs():
+    """
+    監視クエリの一覧を取得
+
+    Returns:
+        list[QuerySpec]: 監視クエリの一覧
+
+    Raises:
+        ValueError: 設定が不正な場合
+    """
+    raw_queries = _load_raw_queries()
+    if raw_queries is None:
+        return [QuerySpec(name=DEFAULT_QUERY_NAME, queries=(QUERY or "",), webhook_url=WEBHOOK_URL)]
+
+    if not isinstance(raw_queries, list) or not raw_queries:
+        raise ValueError("QUERIES は1件以上のクエリを含むリストで指定してください")
+
+    specs = []
+    names = set()
+    for raw in raw_queries:
+        name = raw.get("name")
+        if not name or not QUERY_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"クエリ名が不正です（英数字・ハイフン・アンダースコアのみ）: {name!r}")
+        if name in names:
+            raise ValueError(f"クエリ名が重複しています: {name}")
+        queries = _build_queries(name, raw)
+        webhook_url = raw.get("webhook_url") or WEBHOOK_URL
+        if not webhook_url:
+            raise ValueError(f"クエリ {name} の webhook_url が設定されていません")
+
+        names.add(name)
+        specs.append(QuerySpec(name=name, queries=queries, webhook_url=webhook_url))
+    return specs
@@ -0,0 +1,146 @@
+"""
+検索クエリのプランナー
+
+ハッシュタグ・アカウント・キーワードの構造化されたリストから、X API のクエリ長制限に収まる
+できるだけ少ない数のクエリを組み立てる（分割は First Fit Decreasing による詰め込み）。
+
+カテゴリ内の条件は OR、カテゴリ間は AND で結合する（README の監視クエリと同じ形）。
+
+    (#浅井恋乃未) (from:sakurazaka46 OR from:sakura_joqr OR ...)
+
+制限を超える場合は最も長いカテゴリを分割する。(H) AND (A1 OR A2) は
+(H AND A1) OR (H AND A2) と同じ結果になるため、分割したクエリの結果を合わせれば元のクエリと一致する。
+残りのカテゴリだけで上限に近い場合は、次に長いカテゴリも分割し、分割したグループのすべての組み合わせをクエリにする。
+"""
+
+import itertools
+import logging
+
+from config import QUERY_MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_hashtag(tag):
+    tag = tag.strip()
+    return tag if tag.startswith("#") else f"#{tag}"
+
+
+def _normalize_account(account):
+    return f"from:{account.strip().lstrip('@')}"
+
+
+def _normalize_keyword(keyword):
+    keyword = keyword.strip()
+    return f'"{keyword}"' if " " in keyword and not keyword.startswith('"') else keyword
+
+
+def _render_group(terms):
+    """OR で結合した条件グループを文字列にする"""
+    if len(terms) == 1:
+        return terms[0]
+    return f"({' OR '.join(terms)})"
+
+
+def _render(groups, filters):
+    """条件グループと追加フィルタからクエリを組み立てる"""
+    return " ".join([_render_group(terms) for terms in groups if terms] + list(filters))
+
+
+def _pack_terms(terms, budget):
+    """
+    条件を " OR " 区切りで budget 文字以内のグループに詰める（First Fit Decreasing）
+
+    Returns:
+        list[list[str]]: 詰めたグループのリスト
+    """
+    bins: list[list[str]] = []
+    sizes: list[int] = []
+    for term in sorted(terms, key=len, reverse=True):
+        for i, size in enumerate(sizes):
+            # 2件目以降は " OR " と、複数件になるときの括弧の分が増える
+            added = len(term) + 4 + (2 if len(bins[i]) == 1 else 0)
+            if size + added <= budget:
+                bins[i].append(term)
+                sizes[i] += added
+                break
+        else:
+            if len(term) > budget:
+                raise ValueError(f"条件 {term} だけでクエリ長の上限を超えます")
+            bins.append([term])
+            sizes.append(len(term))
+    return bins
+
+
+def plan_queries(hashtags=(), accounts=(), keywords=(), filters=(), max_length=None):
+    """
+    構造化された条件からクエリ長の上限に収まるできるだけ少ない数のクエリを組み立てる
+
+    Args:
+        hashtags: ハッシュタグのリスト（# は省略可）
+        accounts: アカウント名のリスト（@ は省略可）
+        keywords: キーワードのリスト
+        filters: そのまま付け加える演算子（例: "-is:retweet"）
+        max_length: クエリ長の上限（省略時は QUERY_MAX_LENGTH）
+
+    Returns:
+        list[str]: クエリのリスト
+
+    Raises:
+        ValueError: 条件が空、または分割しても上限に収まらない場合
+    """
+    max_length = QUERY_MAX_LENGTH if max_length is None else max_length
+    groups = [
+        list(dict.fromkeys(_normalize_hashtag(t) for t in hashtags if t.strip())),
+        list(dict.fromkeys(_normalize_account(a) for a in accounts if a.strip())),
+        list(dict.fromkeys(_normalize_keyword(k) for k in keywords if k.strip())),
+    ]
+    groups = [terms for terms in groups if terms]
+    filters = list(filters)
+    if not groups:
+        raise ValueError("ハッシュタグ・アカウント・キーワードのいずれかを指定してください")
+
+    query = _render(groups, filters)
+    if len(query) <= max_length:
+        return [query]
+
+    # 長いカテゴリから順に分割するカテゴリを増やし、残りのカテゴリは各クエリにそのまま含める
+    order = sorted(range(len(groups)), key=lambda i: len(_render_group(groups[i])), reverse=True)
+    for count in range(1, len(groups) + 1):
+        split = sorted(order[:count])
+        budgets = _split_budgets(groups, split, filters, max_length)
+        if budgets is not None:
+            break
+    else:
+        longest = [max(terms, key=len) for terms in groups]
+        raise ValueError(f"条件の組み合わせ {_render([[t] for t in longest], filters)} だけでクエリ長の上限を超えます")
+
+    chunks = [_pack_terms(groups[i], budget) for i, budget in zip(split, budgets, strict=True)]
+    queries = []
+    for combination in itertools.product(*chunks):
+        chosen = dict(zip(split, combination, strict=True))
+        queries.append(_render([chosen.get(i, terms) for i, terms in enumerate(groups)], filters))
+    logger.info(f"クエリを {len(queries)} 件に分割しました（上限 {max_length} 文字）")
+    return queries
+
+
+def _split_budgets(groups, split, filters, max_length):
+    """
+    分割するカテゴリごとに、1グループに使える文字数を決める
+
+    分割しないカテゴリとフィルタを除いた残りを、各カテゴリの最も長い条件の分を確保したうえで
+    条件の合計の長さに比例して割り当てる。
+
+    Returns:
+        list[int] | None: split の順の文字数（最も長い条件どうしの組み合わせでも収まらない場合は None）
+    """
+    fixed = _render([terms for i, terms in enumerate(groups) if i not in split], filters)
+    # 分割したグループの間と、分割しないカテゴリとの間の空白の分を除く
+    available = max_length - len(fixed) - (len(split) if fixed else len(split) - 1)
+    minimums = [len(max(groups[i], key=len)) for i in split]
+    extras = [len(_render_group(groups[i])) - minimum for i, minimum in zip(split, minimums, strict=True)]
+    slack = available - sum(minimums)
+    if slack < 0:
+        return None
+    total = sum(extras) or 1
+    return [minimum + slack * extra // total for minimum, extra in zip(minimums, extras, strict=True)]
@@ -0,0 +1,217 @@
+"""
+X API の呼び出し枠と月間の読み取り予算
+
+- 呼び出し枠: トークンバケット（X_RATE_LIMIT 回 / X_RATE_LIMIT_WINDOW 秒で補充）で X API の呼び出しを制限し、
+  レスポンスの x-rate-limit-remaining / x-rate-limit-reset で実際の残り回数に合わせる。
+  残りが0になったらリセット時刻まで呼び出さないため、429 を受けてから止まるのではなく事前に止まる。
+- 読み取り予算: 1か月（UTC）に読み取ったツイート数を数え、X_MONTHLY_TWEET_BUDGET に達したら翌月まで呼び出さない。
+  残りが少なくなったら1回の実行で取得するページ数・件数を抑える。
+
+状態はクエリ（スレッド）間で共有し、実行の終了時に保存して次の実行・ほかのインスタンスに引き継ぐ。
+"""
+
+import datetime
+import threading
+import time
+
+from config import X_BUDGET_LOW_WATERMARK, X_MONTHLY_TWEET_BUDGET, X_RATE_LIMIT, X_RATE_LIMIT_WINDOW
+
+# 呼び出しを止めた理由（メトリクスのラベル）
+REASON_RATE_LIMIT = "rate_limit"
+REASON_BUDGET = "budget"
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def month_of(now):
+    """UNIX秒の時刻が属する月（UTC、YYYY-MM）"""
+    return datetime.datetime.fromtimestamp(now, tz=datetime.UTC).strftime("%Y-%m")
+
+
+def next_month_start(now):
+    """翌月の1日 0時（UTC）の UNIX秒"""
+    current = datetime.datetime.fromtimestamp(now, tz=datetime.UTC)
+    year, month = (current.year + 1, 1) if current.month == 12 else (current.year, current.month + 1)
+    return int(datetime.datetime(year, month, 1, tzinfo=datetime.UTC).timestamp())
+
+
+class TokenBucket:
+    """一定の速度で補充されるトークンバケット"""
+
+    def __init__(self, capacity, refill_per_sec, tokens=None, updated_at=None):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity if tokens is None else min(tokens, capacity)
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def refill(self, now):
+        """経過時間分のトークンを補充する"""
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_sec)
+            self.updated_at = now
+
+    def try_acquire(self, now, amount=1):
+        """
+        トークンを取り出す
+
+        Returns:
+            float: 取り出せた場合は0、足りない場合は取り出せるようになるまでの秒数
+        """
+        self.refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_sec
+
+
+class QuotaManager:
+    """
+    X API の呼び出し枠・月間の読み取り予算（スレッドセーフ）
+
+    Args:
+        rate_limit: ウィンドウあたりの呼び出し回数（0 で制限しない）
+        window: レート制限のウィンドウ（秒）
+        monthly_budget: 1か月に読み取るツイート数の上限（0 で無制限）
+        low_watermark: 予算の残りがこの割合を下回ったら取得するページを絞る
+    """
+
+    def __init__(
+        self,
+        rate_limit=X_RATE_LIMIT,
+        window=X_RATE_LIMIT_WINDOW,
+        monthly_budget=X_MONTHLY_TWEET_BUDGET,
+        low_watermark=X_BUDGET_LOW_WATERMARK,
+        now=None,
+    ):
+        now = time.time() if now is None else now
+        self.monthly_budget = monthly_budget
+        self.low_watermark = low_watermark
+        # rate_limit が0以下の場合は呼び出し枠で制限しない
+        self.bucket = TokenBucket(max(rate_limit, 0), max(rate_limit, 0) / window, updated_at=now)
+        # サーバーの残り回数が0になった場合のリセット時刻
+        self.blocked_until = None
+        self.month = month_of(now)
+        self.tweets_read = 0
+        # 保存が必要な変化（再開時刻・月・予算がある場合の読み取り数）の回数。
+        # 呼び出し枠の残りはレスポンスのヘッダーで合わせ直すため、変化に数えない
+        self.changes = 0
+        self._lock = threading.Lock()
+
+    def _roll_month(self, now):
+        month = month_of(now)
+        if month != self.month:
+            self.month = month
+            self.tweets_read = 0
+            self.changes += 1
+
+    def _budget_left(self):
+        return None if self.monthly_budget <= 0 else max(0, self.monthly_budget - self.tweets_read)
+
+    def acquire(self, now=None):
+        """
+        X API を1回呼び出してよいか確認し、よければ枠を1回分使う
+
+        Returns:
+            tuple | None: 呼び出せる場合は None、呼び出せない場合は (理由, 再開可能時刻（UNIX秒）)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll_month(now)
+            if self._budget_left() == 0:
+                return REASON_BUDGET, next_month_start(now)
+            if self.blocked_until is not None:
+                if now < self.blocked_until:
+                    return REASON_RATE_LIMIT, int(self.blocked_until) + 1
+                # リセット時刻を過ぎたのでサーバー側の枠は満タンに戻っている
+                self.blocked_until = None
+                self.bucket.tokens = self.bucket.capacity
+                self.bucket.updated_at = now
+                self.changes += 1
+            if self.bucket.capacity > 0:
+                wait = self.bucket.try_acquire(now)
+                if wait:
+                    return REASON_RATE_LIMIT, int(now + wait) + 1
+            return None
+
+    def record_response(self, remaining, reset_at, now=None):
+        """レスポンスのレート制限ヘッダーで残り回数を合わせる"""
+        if remaining is None:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self.bucket.refill(now)
+            self.bucket.tokens = min(self.bucket.tokens, remaining)
+            if remaining <= 0 and reset_at and reset_at > now and reset_at != self.blocked_until:
+                self.blocked_until = reset_at
+                self.changes += 1
+
+    def record_tweets(self, count, now=None):
+        """読み取ったツイート数を予算に計上する"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll_month(now)
+            if count:
+                self.tweets_read += count
+                # 予算がない場合は読み取り数で呼び出しを止めないため、保存しなくてよい
+                if self.monthly_budget > 0:
+                    self.changes += 1
+
+    def tweet_allowance(self, now=None):
+        """今月あと読み取れるツイート数（無制限の場合は None）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll_month(now)
+            return self._budget_left()
+
+    def page_limit(self, max_pages, now=None):
+        """予算の残りが少ない場合は1回の実行で取得するページを1ページにする"""
+        allowance = self.tweet_allowance(now)
+        if allowance is not None and allowance < self.monthly_budget * self.low_watermark:
+            return min(max_pages, 1)
+        return max_pages
+
+    def to_dict(self):
+        """保存用の状態"""
+        with self._lock:
+            return {
+                "tokens": self.bucket.tokens,
+                "updated_at": self.bucket.updated_at,
+                "blocked_until": self.blocked_until,
+                "month": self.month,
+                "tweets_read": self.tweets_read,
+            }
+
+    def restore(self, state, now=None):
+        """
+        保存した状態を取り込む
+
+        ほかの実行・インスタンスが保存した状態とプロセス内の状態のうち、枠・予算の残りが少ない方に合わせる。
+        """
+        if not state:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll_month(now)
+            saved = TokenBucket(
+                self.bucket.capacity, self.bucket.refill_per_sec, state.get("tokens"), state.get("updated_at", now)
+            )
+            saved.refill(now)
+            self.bucket.refill(now)
+            self.bucket.tokens = min(self.bucket.tokens, saved.tokens)
+
+            blocked_until = state.get("blocked_until")
+            if blocked_until and blocked_until > now:
+                self.blocked_until = max(self.blocked_until or 0, blocked_until)
+            if state.get("month") == self.month:
+                self.tweets_read = max(self.tweets_read, state.get("tweets_read", 0))
+
+
+def get_manager():
+    """プロセスで共有する QuotaManager"""
+    global _manager  # noqa: PLW0603
+
+    with _manager_lock:
+        if _manager is None:
+            _manager = QuotaManager()
+        return _manager
@@ -2,9 +2,24 @@
 """
 ASAI X Bot エントリーポイント
 元のasai-radar.pyと同じ動作を提供します
+
+--loop を指定すると内蔵スケジューラーでツイートの到着ペースに合わせて繰り返し実行し、
+--stream を指定するとフィルタードストリームに接続し続けるストリームモードで起動します
 """
 
-from main import main
+import argparse
+
+from main import loop_main, main, stream_main
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ASAI X Bot")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--loop", action="store_true", help="到着ペースに合わせた間隔で繰り返し実行する")
+    mode.add_argument("--stream", action="store_true", help="フィルタードストリームで常時転送する")
+    args = parser.parse_args()
+    if args.stream:
+        stream_main()
+    elif args.loop:
+        loop_main()
+    else:
+        main()
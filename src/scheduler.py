@@ -0,0 +1,148 @@
+"""
+ツイートの到着ペースに合わせて実行間隔を変える内蔵スケジューラー
+
+Cloud Scheduler の固定間隔の代わりに、プロセス内で繰り返し実行する。
+- 1回に転送した件数から到着ペース（件/秒）を指数移動平均で推定し、
+  1回あたり POLL_TARGET_TWEETS 件程度になる間隔で実行する（ライブ中は短く、静かなときは長く）
+- x-rate-limit-remaining の残り回数をリセット時刻までに使い切らない間隔より短くしない
+- レート制限で延期された場合は再開時刻まで、失敗した場合は間隔を倍にして待つ
+"""
+
+import logging
+import threading
+import time
+
+from config import POLL_MAX_INTERVAL, POLL_MIN_INTERVAL, POLL_RATE_LIMIT_RESERVE, POLL_TARGET_TWEETS
+
+logger = logging.getLogger(__name__)
+
+# 到着ペースの指数移動平均で、最新の実行の結果に置く重み
+RATE_SMOOTHING = 0.5
+
+
+class AdaptiveScheduler:
+    """
+    次の実行までの間隔を決める
+
+    Args:
+        min_interval: 間隔の下限（秒）
+        max_interval: 間隔の上限（秒）
+        target_tweets: 1回の実行で転送したいツイート数の目安
+        rate_limit_reserve: レート制限の残り回数のうち使わずに残す回数
+    """
+
+    def __init__(
+        self,
+        min_interval=POLL_MIN_INTERVAL,
+        max_interval=POLL_MAX_INTERVAL,
+        target_tweets=POLL_TARGET_TWEETS,
+        rate_limit_reserve=POLL_RATE_LIMIT_RESERVE,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_tweets = target_tweets
+        self.rate_limit_reserve = rate_limit_reserve
+        # 到着ペース（件/秒）の推定値。最初の実行は前回からの経過時間が分からないため推定しない
+        self.rate = None
+        self.interval = min_interval
+        # 1回の実行で使う X API の呼び出し回数の推定値
+        self.calls_per_run = 1
+        self._last_started = None
+        self._last_rate_limit = None
+
+    def _clamp(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _observe(self, forwarded, started):
+        """前回の実行からの経過時間と転送件数で到着ペースを更新する"""
+        if self._last_started is not None and started > self._last_started:
+            observed = forwarded / (started - self._last_started)
+            self.rate = observed if self.rate is None else RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * self.rate
+        self._last_started = started
+
+    def _observe_calls(self, rate_limit):
+        """同じレート制限ウィンドウ内の残り回数の減り方から、1回の実行の呼び出し回数を推定する"""
+        previous = self._last_rate_limit
+        if previous is not None and rate_limit is not None and previous.reset_at == rate_limit.reset_at:
+            used = previous.remaining - rate_limit.remaining
+            if used > 0:
+                self.calls_per_run = used
+        self._last_rate_limit = rate_limit
+
+    def _rate_limit_interval(self, rate_limit, now):
+        """レート制限の残り回数をリセット時刻までに使い切らない最短の間隔"""
+        if rate_limit is None or rate_limit.remaining is None or not rate_limit.reset_at or rate_limit.reset_at <= now:
+            return 0.0
+        window = rate_limit.reset_at - now
+        usable = rate_limit.remaining - self.rate_limit_reserve
+        if usable < self.calls_per_run:
+            # 残りがなければリセット時刻まで待つ
+            return window
+        return window / (usable / self.calls_per_run)
+
+    def next_interval(self, result=None, started=None, rate_limit=None, now=None):
+        """
+        1回の実行結果から次の実行までの秒数を決める
+
+        Args:
+            result: fetch_and_forward の実行結果（失敗した場合は None）
+            started: その実行を開始した時刻（UNIX秒）
+            rate_limit: 直近のレート制限の状態（x_api_client.RateLimitStatus）
+            now: 現在時刻（UNIX秒）
+
+        Returns:
+            float: 次の実行までの秒数
+        """
+        now = time.time() if now is None else now
+        started = now if started is None else started
+
+        if result is None:
+            # 失敗が続く間は間隔を倍にしていく
+            self.interval = self._clamp(self.interval * 2)
+            return self.interval
+
+        self._observe_calls(rate_limit)
+        if result.get("status") == "deferred":
+            self._last_started = started
+            return max(result["deferred_until"] - now, self.min_interval)
+
+        self._observe(result.get("forwarded", 0), started)
+        if self.rate is None:
+            interval = self.min_interval
+        elif self.rate <= 0:
+            interval = self.max_interval
+        else:
+            interval = self.target_tweets / self.rate
+        self.interval = self._clamp(interval)
+
+        # レート制限のリセット待ちは上限を超えてもよい
+        return max(self.interval, self._rate_limit_interval(rate_limit, now))
+
+
+def run_scheduler(run_once, stop_event=None, scheduler=None, get_rate_limit=None):
+    """
+    stop_event がセットされるまで run_once を繰り返し実行する
+
+    Args:
+        run_once: 1回分の実行（fetch_and_forward の実行結果を返す）
+        stop_event: 停止を指示する threading.Event
+        scheduler: 実行間隔を決める AdaptiveScheduler（省略時は設定値で作成）
+        get_rate_limit: 直近のレート制限の状態を返す関数
+    """
+    stop_event = stop_event or threading.Event()
+    scheduler = scheduler or AdaptiveScheduler()
+    while not stop_event.is_set():
+        started = time.time()
+        try:
+            result = run_once()
+        except Exception:
+            logger.exception("定期実行に失敗")
+            result = None
+
+        rate_limit = get_rate_limit() if get_rate_limit is not None else None
+        interval = scheduler.next_interval(result, started=started, rate_limit=rate_limit)
+        rate = "不明" if scheduler.rate is None else f"{scheduler.rate * 3600:.1f}件/時"
+        logger.info(f"次の実行まで {interval:.0f}秒待機します（到着ペース: {rate}）")
+        # 次の実行の開始時刻は実行にかかった時間を含めず、終了から interval 秒後とする
+        stop_event.wait(interval)
+    logger.info("定期実行を停止しました")
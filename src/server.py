@@ -4,54 +4,186 @@ Cloud Run用のHTTPサーバー
 Cloud SchedulerからのHTTPリクエストを受け取ってボットを実行する
 """
 
+import json
 import logging
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from main import main
+import metrics
+from config import SCHEDULER_ENABLED, STREAM_ENABLED, TRIGGER_JOIN_TIMEOUT
+from logging_config import run_context
+from main import run_bot, stream_and_forward
+from scheduler import run_scheduler
+from x_api_client import get_rate_limit_status
 
 logger = logging.getLogger(__name__)
 
+# ストリームモードが異常終了してから再開するまでの秒数
+STREAM_RESTART_WAIT = 30
+
+
+class _Flight:
+    """実行中の1回分の処理"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Exception | None = None
+
+
+class SingleFlight:
+    """同時に1つだけ処理を実行し、実行中に来た呼び出しは同じ実行に合流させる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: _Flight | None = None
+
+    @property
+    def running(self):
+        """処理が実行中かどうか"""
+        return self._current is not None
+
+    def run(self, func, join_timeout=0.0):
+        """
+        処理を実行する（実行中なら合流して結果を待つ）
+
+        Args:
+            func: 実行する処理
+            join_timeout: 実行中の処理に合流した場合に結果を待つ秒数
+
+        Returns:
+            tuple: (完了したかどうか, 実行結果, 合流したかどうか)
+
+        Raises:
+            Exception: 処理が失敗した場合はその例外（合流した呼び出しにも伝播）
+        """
+        with self._lock:
+            flight = self._current
+            joined = flight is not None
+            if not joined:
+                flight = _Flight()
+                self._current = flight
+
+        if joined:
+            if not flight.done.wait(join_timeout):
+                return False, None, True
+        else:
+            try:
+                flight.result = func()
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    self._current = None
+                flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return True, flight.result, joined
+
 
 class BotHandler(BaseHTTPRequestHandler):
     """HTTP リクエストハンドラー"""
 
+    single_flight = SingleFlight()
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body, ensure_ascii=False).encode())
+
     def do_GET(self):
-        """GET リクエストの処理"""
+        """GET リクエストの処理（実行中のPOSTを待たずに即座に応答）"""
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
         self.send_response(200)
         self.send_header("Content-type", "text/plain")
         self.end_headers()
         self.wfile.write(b"ASAI X Bot is running")
 
     def do_POST(self):
-        """POST リクエストの処理 - ボットを実行"""
+        """POST リクエストの処理 - ボットを実行（同時実行は1つに集約）"""
         try:
             logger.info("Cloud Schedulerからのリクエストを受信")
-            main()
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(b'{"status": "success"}')
+            finished, result, joined = self.single_flight.run(run_bot, TRIGGER_JOIN_TIMEOUT)
+            if not finished:
+                logger.info("ボットは既に実行中のため、新たな実行は行いません")
+                self._send_json(202, {"status": "running"})
+                return
+            if joined:
+                logger.info("実行中のボットの結果に合流しました")
+            self._send_json(200, result or {"status": "success"})
         except Exception as e:
             logger.exception("ボット実行中にエラーが発生")
-            self.send_response(500)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            error_response = f'{{"status": "error", "message": "{str(e)}"}}'
-            self.wfile.write(error_response.encode())
+            self._send_json(500, {"status": "error", "message": str(e)})
 
     def log_message(self, format, *args):
         """アクセスログを標準ログに統合"""
         logger.info(f"HTTP {format % args}")
 
 
+def start_stream(stop_event=None):
+    """ストリームモードをバックグラウンドのスレッドで開始する（異常終了した場合は待機して再開する）"""
+    stop_event = stop_event or threading.Event()
+
+    def run():
+        with run_context():
+            while not stop_event.is_set():
+                try:
+                    stream_and_forward(stop_event)
+                    return
+                except Exception:
+                    logger.exception(f"ストリームモードが停止しました。{STREAM_RESTART_WAIT}秒後に再開します")
+                    metrics.stream_restarts.inc()
+                stop_event.wait(STREAM_RESTART_WAIT)
+
+    thread = threading.Thread(target=run, name="stream", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_scheduler(stop_event=None):
+    """内蔵スケジューラーをバックグラウンドのスレッドで開始する（POSTによる実行とは同時に実行しない）"""
+
+    def run_once():
+        _finished, result, _joined = BotHandler.single_flight.run(run_bot, None)
+        return result
+
+    thread = threading.Thread(
+        target=run_scheduler,
+        args=(run_once, stop_event),
+        kwargs={"get_rate_limit": get_rate_limit_status},
+        name="scheduler",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
 def run_server():
     """HTTPサーバーを起動"""
     port = int(os.environ.get("PORT", "8080"))
     host = "0.0.0.0"  # Cloud Runではこれが重要  # nosec B104
 
+    if STREAM_ENABLED:
+        logger.info("ストリームモードを開始します")
+        start_stream()
+    if SCHEDULER_ENABLED:
+        logger.info("内蔵スケジューラーを開始します")
+        start_scheduler()
+
     logger.info(f"サーバーを {host}:{port} で起動")
-    server = HTTPServer((host, port), BotHandler)
+    server = ThreadingHTTPServer((host, port), BotHandler)
+    server.daemon_threads = True
 
     try:
         server.serve_forever()
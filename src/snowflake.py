@@ -0,0 +1,78 @@
+"""
+X（Twitter）の snowflake ID の操作
+
+ツイートIDは文字列で返るが、桁数が異なると文字列の大小と数値の大小が一致しない。
+並べ替え・比較は必ず整数として行い、生成時刻の取り出しや
+指定時刻に対応するIDの生成（since_id / until_id の組み立て用）もここで行う。
+
+snowflake ID の構成: 上位41ビットが Twitter epoch からのミリ秒、下位22ビットがワーカー・連番。
+"""
+
+import datetime
+
+# Twitter snowflake epoch（2010-11-04 01:42:54.657 UTC）
+TWITTER_EPOCH_MS = 1288834974657
+TIMESTAMP_SHIFT = 22
+
+
+def sort_key(tweet_id) -> int:
+    """並べ替え・比較に使うキー（IDの整数値）"""
+    return int(tweet_id)
+
+
+def sort_ids(tweet_ids, reverse=False):
+    """IDを数値の昇順（古い順）に並べ替える"""
+    return sorted(tweet_ids, key=int, reverse=reverse)
+
+
+def max_id(tweet_ids):
+    """最も新しいID（空の場合は None）"""
+    return max(tweet_ids, key=int, default=None)
+
+
+def min_id(tweet_ids):
+    """最も古いID（空の場合は None）"""
+    return min(tweet_ids, key=int, default=None)
+
+
+def compare(a, b) -> int:
+    """2つのIDを比較する（a が古ければ負、同じなら0、新しければ正）"""
+    a, b = int(a), int(b)
+    return (a > b) - (a < b)
+
+
+def timestamp_ms(tweet_id) -> int:
+    """IDの生成時刻（UNIXミリ秒）"""
+    return (int(tweet_id) >> TIMESTAMP_SHIFT) + TWITTER_EPOCH_MS
+
+
+def timestamps_ms(tweet_ids) -> list[int]:
+    """複数のIDの生成時刻（UNIXミリ秒）をまとめて取り出す"""
+    return [(int(tweet_id) >> TIMESTAMP_SHIFT) + TWITTER_EPOCH_MS for tweet_id in tweet_ids]
+
+
+def to_datetime(tweet_id) -> datetime.datetime:
+    """IDの生成時刻（UTC）"""
+    return datetime.datetime.fromtimestamp(timestamp_ms(tweet_id) / 1000, tz=datetime.UTC)
+
+
+def id_for_time(when) -> str:
+    """
+    指定時刻に生成された最小のIDを作る
+
+    since_id に使うとその時刻以降のツイート、until_id に使うとその時刻より前のツイートが対象になる。
+
+    Args:
+        when: datetime（タイムゾーンなしはUTCとみなす）または UNIX秒
+
+    Returns:
+        str: ID
+    """
+    if isinstance(when, datetime.datetime):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.UTC)
+        when = when.timestamp()
+    ms = int(when * 1000) - TWITTER_EPOCH_MS
+    if ms < 0:
+        raise ValueError(f"Twitter epoch より前の時刻です: {when}")
+    return str(ms << TIMESTAMP_SHIFT)
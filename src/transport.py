@@ -0,0 +1,66 @@
+"""
+外部HTTP通信のセッション管理
+
+ホスト（api.x.com, discord.com など）ごとに Keep-Alive のセッションを保持し、
+すべての外部リクエストで TCP/TLS 接続を再利用する
+"""
+
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import HTTP_MAX_RETRIES, HTTP_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 一時的なサーバーエラーのみ再試行する（429 は呼び出し側で扱う）
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _create_session():
+    """接続プールと再試行設定を持つセッションを作成"""
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUS_CODES,
+        # POST は重複投稿を避けるため接続エラー時のみ再試行する
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    """URLのホストに対応する共有セッションを取得"""
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            logger.info(f"HTTPセッションを作成: {host}")
+            session = _create_session()
+            _sessions[host] = session
+        return session
+
+
+def request(method, url, timeout, **kwargs):
+    """共有セッションを使ってHTTPリクエストを送信"""
+    return get_session(url).request(method, url, timeout=timeout, **kwargs)
+
+
+def close_sessions():
+    """保持しているすべてのセッションを閉じる"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
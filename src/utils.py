@@ -1,18 +1,46 @@
 import datetime
+import json
 import logging
 import os
+import threading
+import time
 
-from google.api_core import exceptions as gcp_exceptions
-from google.cloud import secretmanager
-
+import metrics
+import snowflake
 from config import (
+    DEFAULT_QUERY_NAME,
     PROJECT_ID,
+    SECRET_CACHE_ENABLED,
+    SECRET_COMPACTION_INTERVAL,
+    SECRET_VERSION_PRUNE_ACTION,
+    SECRET_VERSION_RETENTION,
     SINCE_ID_SECRET_NAME,
+    STATE_DIR,
     STATE_FILE,
+    STATE_SECRET_PREFIX,
 )
 
 logger = logging.getLogger(__name__)
 
+# X API のレート制限による待機状態の状態名
+RATE_LIMIT_STATE = "rate-limit"
+# X API の呼び出し枠・読み取り予算の状態名
+QUOTA_STATE = "quota"
+# 配信済みツイートIDの状態名の接頭辞（"{接頭辞}-{クエリ名}"）
+DELIVERED_IDS_STATE = "delivered"
+# 取得上限で取得しなかった範囲の状態名の接頭辞（"{接頭辞}-{クエリ名}"）
+BACKFILL_STATE = "backfill"
+
+# Secret Manager のプロセス内キャッシュ（ウォームインスタンスではPOSTをまたいで再利用）
+_secret_manager_client = None
+_secret_manager_lock = threading.Lock()
+# 存在を確認済みのシークレットID
+_existing_secrets: set[str] = set()
+# シークレットID -> 最後に読み書きした値
+_secret_values: dict[str, str] = {}
+# シークレットID -> 最後に古いバージョンを整理した時刻(monotonic)
+_last_compaction: dict[str, float] = {}
+
 
 def is_since_id_valid(since_id: str) -> bool:
     """
@@ -28,11 +56,8 @@ def is_since_id_valid(since_id: str) -> bool:
         return False
 
     try:
-        # Twitter snowflake ID を timestamp に変換
-        # Twitter snowflake epoch は 1288834974657 (Nov 4, 2010 01:42:54 UTC)
-        twitter_epoch = 1288834974657
-        timestamp = ((int(since_id) >> 22) + twitter_epoch) / 1000
-        dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.UTC)
+        # Twitter snowflake ID から生成時刻を取り出す
+        dt = snowflake.to_datetime(since_id)
 
         # 現在時刻との差分を計算
         now = datetime.datetime.now(datetime.UTC)
@@ -53,43 +78,91 @@ def is_since_id_valid(since_id: str) -> bool:
 
 
 def _get_secret_manager_client():
-    """Secret Manager クライアントを取得"""
-    return secretmanager.SecretManagerServiceClient()
+    """
+    Secret Manager クライアントを取得
+
+    gRPCチャネルと認証情報の取得を毎回行わないよう、プロセス内で1つのクライアントを使い回す。
+    コールドスタート短縮のため、ライブラリは初回利用時に読み込む。
+    """
+    global _secret_manager_client  # noqa: PLW0603
+    with _secret_manager_lock:
+        if _secret_manager_client is None:
+            from google.cloud import secretmanager
+
+            _secret_manager_client = secretmanager.SecretManagerServiceClient()
+        return _secret_manager_client
+
+
+def reset_secret_manager_cache():
+    """Secret Manager のクライアントと値のキャッシュを破棄"""
+    global _secret_manager_client  # noqa: PLW0603
+    with _secret_manager_lock:
+        _secret_manager_client = None
+    _existing_secrets.clear()
+    _secret_values.clear()
+    _last_compaction.clear()
 
 
-def _get_secret_path():
+def _get_secret_path(secret_name=None):
     """Secret Managerのシークレットパスを取得"""
-    return f"projects/{PROJECT_ID}/secrets/{SINCE_ID_SECRET_NAME}"
+    return f"projects/{PROJECT_ID}/secrets/{secret_name or SINCE_ID_SECRET_NAME}"
 
 
-def _load_since_id_from_secret_manager():
-    """Secret Manager から since_id を読み込み"""
-    try:
-        client = _get_secret_manager_client()
-        name = f"{_get_secret_path()}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
-        since_id = response.payload.data.decode("UTF-8").strip()
+def _access_secret(secret_name=None):
+    """
+    Secret Manager からシークレットの最新バージョンを読み込み（キャッシュ済みならRPCを行わない）
 
-        if since_id:
-            logger.info(f"Secret Manager から前回の処理IDを読み込み: {since_id}")
-            return since_id
-        logger.info("Secret Manager から空の処理IDを読み込み。初回実行として処理します")
-        return None
-    except Exception as e:
-        logger.info(f"Secret Manager からの読み込みに失敗: {e}")
-        return None
+    シークレット（またはそのバージョン）が存在しない場合は空文字列を返し、空文字列としてキャッシュする。
+    """
+    from google.api_core import exceptions as gcp_exceptions
 
+    secret_id = secret_name or SINCE_ID_SECRET_NAME
+    if SECRET_CACHE_ENABLED and secret_id in _secret_values:
+        logger.info(f"Secret Manager のキャッシュからシークレット {secret_id} を読み込み")
+        metrics.secret_manager_operations.inc(operation="read", result="cached")
+        return _secret_values[secret_id]
 
-def _save_since_id_to_secret_manager(since_id: str):
-    """Secret Manager に since_id を保存"""
+    client = _get_secret_manager_client()
+    name = f"{_get_secret_path(secret_id)}/versions/latest"
     try:
-        client = _get_secret_manager_client()
-        parent = f"projects/{PROJECT_ID}"
-        secret_id = SINCE_ID_SECRET_NAME
+        with metrics.track(metrics.secret_manager_operations, metrics.secret_manager_seconds, operation="read"):
+            response = client.access_secret_version(request={"name": name})
+    except gcp_exceptions.NotFound:
+        # 存在しないことも覚えておき、保存するまで読み込みのたびにRPCを行わない
+        logger.info(f"Secret Manager にシークレット {secret_id} がありません")
+        _secret_values[secret_id] = ""
+        return ""
+    value = response.payload.data.decode("UTF-8").strip()
+
+    _existing_secrets.add(secret_id)
+    _secret_values[secret_id] = value
+    return value
+
+
+def _add_secret_version(value: str, secret_name=None):
+    """
+    Secret Manager にシークレットのバージョンを追加（存在しない場合は作成）
+
+    最後に読み書きした値と同じ場合はバージョンを追加しない。
+
+    Returns:
+        追加したバージョン。変更がなくスキップした場合は None
+    """
+    from google.api_core import exceptions as gcp_exceptions
+
+    secret_id = secret_name or SINCE_ID_SECRET_NAME
+    if _secret_values.get(secret_id) == value:
+        logger.info(f"シークレット {secret_id} の値に変更がないため、バージョンの追加をスキップします")
+        metrics.secret_manager_operations.inc(operation="write", result="skipped")
+        return None
 
-        # シークレットが存在しない場合は作成
+    client = _get_secret_manager_client()
+    parent = f"projects/{PROJECT_ID}"
+
+    # シークレットが存在しない場合は作成（存在を確認済みなら確認を省略）
+    if secret_id not in _existing_secrets:
         try:
-            client.get_secret(request={"name": _get_secret_path()})
+            client.get_secret(request={"name": _get_secret_path(secret_id)})
         except gcp_exceptions.NotFound:
             logger.info(f"Secret Manager にシークレット {secret_id} を作成中...")
             client.create_secret(
@@ -100,14 +173,105 @@ def _save_since_id_to_secret_manager(since_id: str):
                 }
             )
             logger.info(f"Secret Manager にシークレット {secret_id} を作成しました")
+        _existing_secrets.add(secret_id)
 
-        # バージョンを追加
+    # バージョンを追加
+    with metrics.track(metrics.secret_manager_operations, metrics.secret_manager_seconds, operation="write"):
         response = client.add_secret_version(
             request={
-                "parent": _get_secret_path(),
-                "payload": {"data": since_id.encode("UTF-8")},
+                "parent": _get_secret_path(secret_id),
+                "payload": {"data": value.encode("UTF-8")},
             }
         )
+    _secret_values[secret_id] = value
+    schedule_secret_compaction(secret_id)
+    return response
+
+
+def compact_secret_versions(secret_name=None, retention=None, action=None):
+    """
+    シークレットの古いバージョンを無効化または破棄する
+
+    Args:
+        secret_name: シークレットID（省略時は since_id のシークレット）
+        retention: 残す新しいバージョンの数（省略時は SECRET_VERSION_RETENTION）
+        action: destroy / disable（省略時は SECRET_VERSION_PRUNE_ACTION）
+
+    Returns:
+        int: 無効化・破棄したバージョン数
+    """
+    secret_id = secret_name or SINCE_ID_SECRET_NAME
+    retention = SECRET_VERSION_RETENTION if retention is None else retention
+    action = SECRET_VERSION_PRUNE_ACTION if action is None else action
+
+    client = _get_secret_manager_client()
+    # destroy は無効化済みのバージョンも対象にする
+    version_filter = "state:ENABLED" if action == "disable" else "NOT state:DESTROYED"
+    versions = client.list_secret_versions(request={"parent": _get_secret_path(secret_id), "filter": version_filter})
+    names = sorted((v.name for v in versions), key=lambda name: int(name.rsplit("/", 1)[-1]), reverse=True)
+
+    pruned = 0
+    for name in names[max(retention, 1) :]:
+        if action == "disable":
+            client.disable_secret_version(request={"name": name})
+        else:
+            client.destroy_secret_version(request={"name": name})
+        pruned += 1
+
+    logger.info(f"シークレット {secret_id} の古いバージョンを {pruned} 件 {action} しました（保持: {retention} 件）")
+    return pruned
+
+
+def schedule_secret_compaction(secret_name=None):
+    """
+    古いバージョンの整理をバックグラウンドで実行する（同じシークレットは一定間隔に1回まで）
+
+    Returns:
+        threading.Thread | None: 起動したスレッド。間隔内のため起動しなかった場合は None
+    """
+    secret_id = secret_name or SINCE_ID_SECRET_NAME
+    if SECRET_VERSION_RETENTION <= 0:
+        return None
+
+    now = time.monotonic()
+    with _secret_manager_lock:
+        last = _last_compaction.get(secret_id)
+        if last is not None and now - last < SECRET_COMPACTION_INTERVAL:
+            return None
+        _last_compaction[secret_id] = now
+
+    def run():
+        try:
+            compact_secret_versions(secret_id)
+        except Exception as e:
+            logger.warning(f"シークレット {secret_id} の古いバージョンの整理に失敗: {e}")
+
+    thread = threading.Thread(target=run, name=f"compact-{secret_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _load_since_id_from_secret_manager(secret_name=None):
+    """Secret Manager から since_id を読み込み"""
+    try:
+        since_id = _access_secret(secret_name)
+
+        if since_id:
+            logger.info(f"Secret Manager から前回の処理IDを読み込み: {since_id}")
+            return since_id
+        logger.info("Secret Manager から空の処理IDを読み込み。初回実行として処理します")
+        return None
+    except Exception as e:
+        logger.info(f"Secret Manager からの読み込みに失敗: {e}")
+        return None
+
+
+def _save_since_id_to_secret_manager(since_id: str, secret_name=None):
+    """Secret Manager に since_id を保存"""
+    try:
+        response = _add_secret_version(since_id, secret_name)
+        if response is None:
+            return
         version_info = f"version: {response.name}"
         logger.info(f"Secret Manager に処理IDを保存: {since_id} ({version_info})")
 
@@ -116,10 +280,10 @@ def _save_since_id_to_secret_manager(since_id: str):
         raise
 
 
-def _load_since_id_from_file():
+def _load_since_id_from_file(state_file=None):
     """ファイルから since_id を読み込み（フォールバック用）"""
     try:
-        with open(STATE_FILE, encoding="utf-8") as f:
+        with open(state_file or STATE_FILE, encoding="utf-8") as f:
             since_id = f.read().strip() or None
             if since_id:
                 logger.info(f"ファイルから前回の処理IDを読み込み: {since_id}")
@@ -131,18 +295,134 @@ def _load_since_id_from_file():
         return None
 
 
-def _save_since_id_to_file(since_id: str):
+def _save_since_id_to_file(since_id: str, state_file=None):
     """ファイルに since_id を保存（フォールバック用）"""
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
+    with open(state_file or STATE_FILE, "w", encoding="utf-8") as f:
         f.write(since_id)
     logger.info(f"ファイルに処理IDを保存: {since_id}")
 
 
-def load_since_id():
+def _use_secret_manager():
+    """Cloud Run環境で Secret Manager を使うかどうか"""
+    return bool(PROJECT_ID and os.getenv("K_SERVICE"))
+
+
+def _get_state_file(name: str):
+    """状態ファイルのパスを取得"""
+    return os.path.join(STATE_DIR, f"{name}.json")
+
+
+@metrics.state_operation_seconds.time(operation="load_state")
+def load_state(name: str, default=None):
+    """
+    JSON形式の状態を読み込み（Secret Manager -> ファイルの順で試行）
+
+    Args:
+        name: 状態名（シークレット名・ファイル名に使用）
+        default: 状態が存在しない場合の値
+
+    Returns:
+        読み込んだ状態。存在しない・読み込めない場合は default
+    """
+    if _use_secret_manager():
+        try:
+            raw = _access_secret(f"{STATE_SECRET_PREFIX}-{name}")
+            # 空（存在しない）の場合は、Secret Manager への保存に失敗して書き込んだファイルを探す
+            if raw:
+                return json.loads(raw)
+        except Exception as e:
+            logger.info(f"Secret Manager から状態 {name} を読み込めません: {e}")
+
+    try:
+        with open(_get_state_file(name), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except ValueError as e:
+        logger.warning(f"状態ファイル {name} の解析に失敗: {e}")
+        return default
+
+
+@metrics.state_operation_seconds.time(operation="save_state")
+def save_state(name: str, value):
+    """JSON形式の状態を保存（Secret Manager -> ファイルの順で試行）"""
+    raw = json.dumps(value, separators=(",", ":"))
+    if _use_secret_manager():
+        try:
+            if _add_secret_version(raw, f"{STATE_SECRET_PREFIX}-{name}") is not None:
+                logger.info(f"Secret Manager に状態 {name} を保存")
+            return
+        except Exception as e:
+            logger.warning(f"Secret Manager への状態保存に失敗。ファイルにフォールバック: {e}")
+
+    with open(_get_state_file(name), "w", encoding="utf-8") as f:
+        f.write(raw)
+    logger.info(f"ファイルに状態 {name} を保存")
+
+
+def load_deferred_until():
+    """X API の呼び出しを再開してよい時刻（UNIX秒）を読み込み"""
+    state = load_state(RATE_LIMIT_STATE, {})
+    return state.get("deferred_until")
+
+
+def save_deferred_until(deferred_until: int):
+    """X API の呼び出しを再開してよい時刻（UNIX秒）を保存"""
+    save_state(RATE_LIMIT_STATE, {"deferred_until": deferred_until})
+
+
+def load_quota_state():
+    """X API の呼び出し枠・読み取り予算の状態を読み込み"""
+    return load_state(QUOTA_STATE, {})
+
+
+def save_quota_state(state):
+    """X API の呼び出し枠・読み取り予算の状態を保存"""
+    save_state(QUOTA_STATE, state)
+
+
+def load_delivered_ids(query_name=None):
+    """最近配信したツイートIDの一覧を読み込み（古い順）"""
+    return load_state(f"{DELIVERED_IDS_STATE}-{query_name or DEFAULT_QUERY_NAME}", [])
+
+
+def save_delivered_ids(tweet_ids, query_name=None):
+    """最近配信したツイートIDの一覧を保存（古い順）"""
+    save_state(f"{DELIVERED_IDS_STATE}-{query_name or DEFAULT_QUERY_NAME}", list(tweet_ids))
+
+
+def load_backfill(query_name=None):
+    """取得上限で取得しなかった範囲（since_id / until_id）を読み込み（なければ None）"""
+    return load_state(f"{BACKFILL_STATE}-{query_name or DEFAULT_QUERY_NAME}") or None
+
+
+def save_backfill(window, query_name=None):
+    """取得上限で取得しなかった範囲（since_id / until_id）を保存（None で取得済み）"""
+    save_state(f"{BACKFILL_STATE}-{query_name or DEFAULT_QUERY_NAME}", window)
+
+
+def _get_since_id_location(query_name=None):
+    """
+    クエリごとの since_id の保存先を取得
+
+    既定のクエリは従来どおり SINCE_ID_SECRET_NAME / STATE_FILE を使う。
+
+    Returns:
+        tuple: (シークレットID, ファイルパス)。既定の保存先の場合は (None, None)
+    """
+    if not query_name or query_name == DEFAULT_QUERY_NAME:
+        return None, None
+    return f"{SINCE_ID_SECRET_NAME}-{query_name}", os.path.join(STATE_DIR, f"since_id-{query_name}.txt")
+
+
+@metrics.state_operation_seconds.time(operation="load_since_id")
+def load_since_id(query_name=None):
     """since_id を読み込み（Secret Manager -> ファイルの順で試行）"""
+    secret_name, state_file = _get_since_id_location(query_name)
+
     # Cloud Run環境では SECRET_MANAGER を優先
-    if PROJECT_ID and os.getenv("K_SERVICE"):  # Cloud Run環境の判定
-        since_id = _load_since_id_from_secret_manager()
+    if _use_secret_manager():  # Cloud Run環境の判定
+        since_id = _load_since_id_from_secret_manager(secret_name)
         if since_id is not None:
             # 7日制限チェック
             if is_since_id_valid(since_id):
@@ -150,7 +430,7 @@ def load_since_id():
             logger.info("Secret Manager の since_id が古いため、初回実行として処理します")
             return None
 
-    since_id = _load_since_id_from_file()
+    since_id = _load_since_id_from_file(state_file)
     if since_id is not None:
         # 7日制限チェック
         if is_since_id_valid(since_id):
@@ -161,17 +441,20 @@ def load_since_id():
     return None
 
 
-def save_since_id(since_id: str):
+@metrics.state_operation_seconds.time(operation="save_since_id")
+def save_since_id(since_id: str, query_name=None):
     """since_id を保存（Secret Manager -> ファイルの順で試行）"""
+    secret_name, state_file = _get_since_id_location(query_name)
+
     # Cloud Run環境では SECRET_MANAGER を優先
-    if PROJECT_ID and os.getenv("K_SERVICE"):  # Cloud Run環境の判定
+    if _use_secret_manager():  # Cloud Run環境の判定
         try:
-            _save_since_id_to_secret_manager(since_id)
+            _save_since_id_to_secret_manager(since_id, secret_name)
             return
         except Exception as e:
             logger.warning(f"Secret Manager への保存に失敗。ファイルにフォールバック: {e}")
 
-    _save_since_id_to_file(since_id)
+    _save_since_id_to_file(since_id, state_file)
 
 
 def build_index(data_list, key="id"):
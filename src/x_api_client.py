@@ -1,66 +1,306 @@
 import datetime
 import logging
 import time
+from dataclasses import dataclass
 from urllib.parse import urlencode
 
-import requests
-
+import metrics
+import transport
 from config import (
+    COUNTS_URL,
     SEARCH_URL,
+    X_API_TIMEOUT,
+    X_MAX_PAGES,
+    X_MAX_TWEETS,
+    get_field_profile,
     get_x_api_headers,
     get_x_api_params,
 )
+from logging_config import PER_ITEM
+from quota import REASON_BUDGET, get_manager
+from x_decode import decode_page, loads
 
 logger = logging.getLogger(__name__)
 
+# x-rate-limit-reset ヘッダーがない場合の待機時間（X APIのレート制限ウィンドウ）
+DEFAULT_RATE_LIMIT_WINDOW = 900
+
+
+@dataclass(frozen=True)
+class RateLimitStatus:
+    """直近のレスポンスのレート制限ヘッダー（ヘッダーがない項目は None）"""
+
+    limit: int | None
+    remaining: int | None
+    reset_at: int | None
+
+
+_rate_limit_status: RateLimitStatus | None = None
+
+
+class RateLimitError(Exception):
+    """X APIのレート制限に達したことを表す例外"""
+
+    def __init__(self, reset_at: int):
+        super().__init__(f"X APIのレート制限に達しました（再開可能時刻: {reset_at}）")
+        self.reset_at = reset_at
+
+
+class BudgetExhaustedError(RateLimitError):
+    """月間の読み取り予算を使い切ったことを表す例外（reset_at は翌月の開始時刻）"""
+
+    def __init__(self, reset_at: int):
+        super().__init__(reset_at)
+        self.args = (f"X APIの月間の読み取り予算を使い切りました（再開可能時刻: {reset_at}）",)
+
 
 def fetch_tweets(since_id=None):
-    """X APIからツイートを取得する"""
+    """X APIからツイートを取得する（全ページをまとめたペイロードを返す。レート制限時は None）"""
+    merged = {"data": []}
+    try:
+        for page in iter_tweet_pages(since_id):
+            merged["data"].extend(page.tweets)
+            for key, index in (("users", page.users), ("media", page.media)):
+                if index:
+                    merged.setdefault("includes", {}).setdefault(key, []).extend(index.values())
+    except RateLimitError:
+        return None
+    return merged
+
+
+def iter_tweet_pages(since_id=None, max_pages=None, max_tweets=None, query=None, until_id=None):
+    """
+    X APIの検索結果を next_token を辿りながらページ単位で取得するジェネレーター
+
+    各ページはデコード時に includes のユーザー・メディアをIDで引けるようにした x_decode.Page で返す。
+    ページごとに返すため、呼び出し側は全ページの到着を待たずに処理を始められる。
+
+    Args:
+        since_id: このIDより新しいツイートのみ取得する
+        max_pages: 取得する最大ページ数（省略時は X_MAX_PAGES）
+        max_tweets: 取得する最大ツイート数（省略時は X_MAX_TWEETS）
+        query: 検索クエリ（省略時は QUERY）
+        until_id: このIDより古いツイートのみ取得する（取得上限で取得しなかった範囲を後から取得する場合）
+
+    Yields:
+        Page: 1ページ分の検索結果（取得上限で打ち切った最後のページは truncated が True）
+
+    Raises:
+        RateLimitError: レート制限に達した場合（待機せずに即座に送出）
+    """
+    max_pages = X_MAX_PAGES if max_pages is None else max_pages
+    max_tweets = X_MAX_TWEETS if max_tweets is None else max_tweets
+
+    # 月間の読み取り予算の残りに合わせて取得するページ数・件数を抑える
+    quota = get_manager()
+    max_pages = quota.page_limit(max_pages)
+    allowance = quota.tweet_allowance()
+    if allowance is not None:
+        max_tweets = min(max_tweets, allowance) if max_tweets else allowance
+
     params = get_x_api_params().copy()
+    if query:
+        params["query"] = query
     if since_id:
         params["since_id"] = since_id
         logger.info(f"前回のID以降のツイートを取得: {since_id}")
     else:
         logger.info("初回実行のため、最新のツイートを取得")
+    if until_id:
+        params["until_id"] = until_id
+
+    pages = 0
+    total = 0
+    total_bytes = 0
+    while True:
+        # 上限までの残りが1ページより少なければ、読み取る件数（予算の消費）を減らす（X API の下限は10件）
+        if max_tweets and max_tweets - total < int(params.get("max_results", 100)):
+            params["max_results"] = max(10, max_tweets - total)
+        page, size = _request_page(params)
+        pages += 1
+        total_bytes += size
+
+        # 新しい順に返るため、上限を超えた分（古いツイート）を捨てる
+        if max_tweets and total + len(page.tweets) > max_tweets:
+            page.tweets = page.tweets[: max_tweets - total]
+            page.truncated = True
+        total += len(page.tweets)
+        next_token = page.meta.get("next_token")
+        capped = bool(next_token) and (pages >= max_pages or bool(max_tweets and total >= max_tweets))
+        page.truncated = page.truncated or capped
+        logger.info(f"ページ {pages} を取得: {len(page.tweets)}件（累計 {total}件）")
+        yield page
+
+        if not next_token:
+            break
+        if capped:
+            logger.warning(f"取得上限に達したため以降のページを取得しません（{pages}ページ / {total}件）")
+            break
+        params["next_token"] = next_token
+
+    logger.info(
+        f"X APIのレスポンス合計: {total_bytes}バイト（{pages}ページ / {total}件、プロファイル: {get_field_profile()}）"
+    )
 
+
+def count_recent_tweets(query, since_id, until_id=None):
+    """
+    件数APIで since_id より新しいツイートの件数を取得する
+
+    件数APIは検索APIと別のレート制限で、ツイートの読み取り数にも含まれないため、検索の前の確認に使う。
+    取得に失敗した場合は None を返し、呼び出し側は通常どおり検索する。
+
+    Args:
+        query: 検索クエリ
+        since_id: このIDより新しいツイートを数える
+        until_id: このIDより古いツイートのみ数える
+
+    Returns:
+        int | None: ツイート数
+    """
+    params = {"query": query, "since_id": since_id, "granularity": "day"}
+    if until_id:
+        params["until_id"] = until_id
+    total = 0
+    try:
+        while True:
+            res = transport.request(
+                "GET",
+                f"{COUNTS_URL}?{urlencode(params)}",
+                timeout=X_API_TIMEOUT,
+                headers=get_x_api_headers(),
+            )
+            metrics.x_api_requests.inc(status=res.status_code)
+            if res.status_code == 429:
+                metrics.rate_limited.inc(api="x")
+            res.raise_for_status()
+            meta = loads(res.content).get("meta", {})
+            total += int(meta.get("total_tweet_count", 0))
+            if not meta.get("next_token"):
+                break
+            params["next_token"] = meta["next_token"]
+    except Exception as e:
+        metrics.count_prechecks.inc(result="error")
+        logger.warning(f"件数APIでのツイート数の確認に失敗したため、通常どおり検索します: {e}")
+        return None
+
+    metrics.count_prechecks.inc(result="found" if total else "empty")
+    logger.info(f"件数API: 前回のID以降のツイート数 {total}件")
+    return total
+
+
+def _request_page(params):
+    """
+    X APIに1ページ分のリクエストを送信する
+
+    Returns:
+        tuple: (Page, レスポンスのバイト数)
+    """
+    _acquire_quota()
     url = f"{SEARCH_URL}?{urlencode(params, doseq=True)}"
-    logger.info(f"X APIにリクエスト送信中: {url}")
+    logger.info("X APIにリクエスト送信中: %s", url, extra=PER_ITEM)
 
+    res = None
     try:
-        res = requests.get(url, headers=get_x_api_headers(), timeout=30)
+        with metrics.x_api_request_seconds.time():
+            res = transport.request("GET", url, timeout=X_API_TIMEOUT, headers=get_x_api_headers())
+        metrics.x_api_requests.inc(status=res.status_code)
 
         # HTTPレスポンスコードとヘッダーの詳細ログ
         logger.info(f"X API レスポンスコード: {res.status_code}")
 
         # レート制限関連のヘッダーをログ出力
         log_rate_limit_info(res)
+        _record_rate_limit(res)
 
-        if res.status_code == 429:
-            # レート制限時は詳細なエラー情報をログ出力
-            logger.warning("レート制限に達しました (HTTP 429)")
-            try:
-                error_payload = res.json()
-                if "errors" in error_payload:
-                    for error in error_payload["errors"]:
-                        error_code = error.get("code")
-                        error_message = error.get("message")
-                        detail = f"コード: {error_code}, メッセージ: {error_message}"
-                        logger.warning(f"エラー詳細 - {detail}")
-            except Exception as parse_error:
-                logger.warning(f"エラーレスポンスの解析に失敗: {parse_error}")
-
-            logger.info("15分待機してリトライします")
-            time.sleep(900)
-            return None
-
-        res.raise_for_status()
-        payload = res.json()
-        logger.info("X APIからのレスポンス取得成功")
-        return payload
+        if res.status_code != 429:
+            res.raise_for_status()
+            page = decode_page(res.content)
+            size = len(res.content)
+            count = len(page.tweets)
+            get_manager().record_tweets(count)
+            metrics.x_api_page_bytes.observe(size)
+            metrics.x_api_page_tweets.observe(count)
+            per_tweet = size // count if count else size
+            logger.info(f"X APIからのレスポンス取得成功: {size}バイト（{count}件、1件あたり {per_tweet}バイト）")
+            return page, size
     except Exception:
+        if res is None:
+            # 接続エラーなどでレスポンスを受け取れなかった場合
+            metrics.x_api_requests.inc(status="error")
         logger.exception("X APIからのレスポンス取得に失敗")
         raise
 
+    # レート制限時は詳細なエラー情報をログ出力
+    metrics.rate_limited.inc(api="x")
+    logger.warning("レート制限に達しました (HTTP 429)")
+    try:
+        error_payload = res.json()
+        if "errors" in error_payload:
+            for error in error_payload["errors"]:
+                error_code = error.get("code")
+                error_message = error.get("message")
+                detail = f"コード: {error_code}, メッセージ: {error_message}"
+                logger.warning(f"エラー詳細 - {detail}")
+    except Exception as parse_error:
+        logger.warning(f"エラーレスポンスの解析に失敗: {parse_error}")
+
+    reset_at = get_rate_limit_reset(res)
+    logger.info(f"待機せずに終了します。再開可能時刻: {reset_at}")
+    raise RateLimitError(reset_at)
+
+
+def _acquire_quota():
+    """
+    呼び出し枠・読み取り予算を確認して1回分使う
+
+    Raises:
+        RateLimitError: 呼び出し枠が残っていない場合（429 を受ける前に止める）
+        BudgetExhaustedError: 月間の読み取り予算を使い切った場合
+    """
+    throttled = get_manager().acquire()
+    if throttled is None:
+        return
+    reason, reset_at = throttled
+    metrics.quota_throttled.inc(reason=reason)
+    if reason == REASON_BUDGET:
+        logger.warning(f"月間の読み取り予算を使い切ったため X API を呼び出しません。再開可能時刻: {reset_at}")
+        raise BudgetExhaustedError(reset_at)
+    logger.warning(f"呼び出し枠が残っていないため X API を呼び出しません。再開可能時刻: {reset_at}")
+    raise RateLimitError(reset_at)
+
+
+def get_rate_limit_reset(res):
+    """x-rate-limit-reset ヘッダーから再開可能時刻（UNIX秒）を取得する"""
+    try:
+        return int(res.headers["x-rate-limit-reset"])
+    except (KeyError, TypeError, ValueError):
+        return int(time.time()) + DEFAULT_RATE_LIMIT_WINDOW
+
+
+def _header_int(res, name):
+    try:
+        return int(res.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _record_rate_limit(res):
+    """レート制限ヘッダーを記録し、呼び出し枠の残り回数を合わせる（ヘッダーがないレスポンスは記録しない）"""
+    global _rate_limit_status  # noqa: PLW0603
+
+    remaining = _header_int(res, "x-rate-limit-remaining")
+    if remaining is None:
+        return
+    reset_at = _header_int(res, "x-rate-limit-reset")
+    _rate_limit_status = RateLimitStatus(limit=_header_int(res, "x-rate-limit-limit"), remaining=remaining, reset_at=reset_at)
+    get_manager().record_response(remaining, reset_at)
+
+
+def get_rate_limit_status():
+    """直近に記録したレート制限の状態（まだ記録がない場合は None）"""
+    return _rate_limit_status
+
 
 def log_rate_limit_info(res):
     """レート制限情報をログ出力する"""
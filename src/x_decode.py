@@ -0,0 +1,128 @@
+"""
+X API のレスポンスの JSON デコード
+
+- デコーダー: orjson / msgspec がインストールされていればそれを使い、なければ標準ライブラリの json を使う
+  （X_JSON_DECODER で指定。auto の場合は orjson → msgspec → stdlib の順に選ぶ）
+- decode_page: 1ページ分のレスポンスをデコードし、includes のユーザー・メディアをIDで引ける索引と一緒に返す。
+  レスポンスの dict をそのまま型つきのレコードとして使うため、ツイート・ユーザーをコピーしない
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import NotRequired, TypedDict
+
+from config import X_JSON_DECODER
+
+logger = logging.getLogger(__name__)
+
+# 使用できるデコーダー（名前 -> bytes / str を受け取るデコード関数）。auto の場合は先頭から選ぶ
+DECODERS = {}
+try:
+    import orjson
+
+    DECODERS["orjson"] = orjson.loads
+except ImportError:  # pragma: no cover
+    pass
+try:
+    import msgspec
+
+    DECODERS["msgspec"] = msgspec.json.decode
+except ImportError:  # pragma: no cover
+    pass
+DECODERS["stdlib"] = json.loads
+
+
+class Tweet(TypedDict):
+    """ツイート（id・text は常に返る。ほかはフィールドのプロファイルで要求した場合のみ）"""
+
+    id: str
+    text: str
+    author_id: NotRequired[str]
+    created_at: NotRequired[str]
+    lang: NotRequired[str]
+    public_metrics: NotRequired[dict]
+    attachments: NotRequired[dict]
+
+
+class User(TypedDict):
+    """includes.users のユーザー"""
+
+    id: str
+    username: str
+    name: NotRequired[str]
+    profile_image_url: NotRequired[str]
+
+
+class Media(TypedDict):
+    """includes.media の添付メディア"""
+
+    media_key: str
+    type: str
+    url: NotRequired[str]
+    preview_image_url: NotRequired[str]
+
+
+@dataclass(slots=True)
+class Page:
+    """1ページ分の検索結果"""
+
+    tweets: list[Tweet] = field(default_factory=list)
+    # ユーザーID -> ユーザー
+    users: dict[str, User] = field(default_factory=dict)
+    # media_key -> メディア
+    media: dict[str, Media] = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)
+    # 取得上限により、このページより古いツイートを取得しなかったかどうか
+    truncated: bool = False
+
+
+def select_decoder(name="auto"):
+    """
+    デコーダーを選ぶ（指定したデコーダーがインストールされていない場合は auto で選ぶ）
+
+    Returns:
+        tuple: (デコーダー名, デコード関数)
+    """
+    if name in DECODERS:
+        return name, DECODERS[name]
+    if name != "auto":
+        logger.warning(f"X_JSON_DECODER のデコーダーが使えないため自動で選びます: {name}")
+    name = next(iter(DECODERS))
+    return name, DECODERS[name]
+
+
+DECODER_NAME, _decode = select_decoder(X_JSON_DECODER)
+
+
+def loads(content):
+    """JSON（bytes / str）をデコードする"""
+    return _decode(content)
+
+
+def index_page(payload):
+    """
+    デコード済みのレスポンスから Page を作る
+
+    includes のユーザー・メディアを1回ずつ辿って索引にする（レコードはレスポンスの dict をそのまま使う）。
+    フィルタードストリームのイベント（data が1件のツイート）も1件の Page にする。
+    """
+    includes = payload.get("includes") or {}
+    tweets = payload.get("data") or []
+    return Page(
+        tweets=[tweets] if isinstance(tweets, dict) else tweets,
+        users={user["id"]: user for user in includes.get("users", ())},
+        media={media["media_key"]: media for media in includes.get("media", ())},
+        meta=payload.get("meta") or {},
+    )
+
+
+def decode_page(content, decode=None):
+    """
+    1ページ分のレスポンス（bytes / str）をデコードして Page を返す
+
+    Args:
+        content: レスポンスの本文
+        decode: デコード関数（省略時は X_JSON_DECODER で選んだデコーダー）
+    """
+    return index_page((decode or _decode)(content))
@@ -0,0 +1,258 @@
+"""
+X API のフィルタードストリーム（tweets/search/stream）
+
+search/recent を定期的に呼ぶ代わりに接続を保持し続け、ルールに一致したツイートを数秒以内に受け取る。
+ルールは監視クエリから作り、タグにクエリ名を付けて、受け取ったツイートの転送先を判別する。
+
+切断された場合は X API のガイドラインに沿った間隔で再接続する。
+- ネットワークエラー・無通信: 250ミリ秒ずつ延ばす（上限16秒）
+- HTTPエラー: 5秒から倍々に延ばす（上限320秒）
+- レート制限（429）: 1分から倍々に延ばす（x-rate-limit-reset の方が遅ければその時刻まで）
+"""
+
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+
+import metrics
+import transport
+from config import (
+    STREAM_RULES_URL,
+    STREAM_STALL_TIMEOUT,
+    STREAM_URL,
+    X_API_TIMEOUT,
+    get_x_api_headers,
+    get_x_api_params,
+)
+from logging_config import PER_ITEM
+from quota import get_manager
+from x_api_client import RateLimitError, get_rate_limit_reset, log_rate_limit_info
+from x_decode import loads
+
+logger = logging.getLogger(__name__)
+
+# 再接続の待機時間（秒）
+NETWORK_BACKOFF_STEP = 0.25
+NETWORK_BACKOFF_MAX = 16
+HTTP_BACKOFF_INITIAL = 5
+HTTP_BACKOFF_MAX = 320
+RATE_LIMIT_BACKOFF_INITIAL = 60
+RATE_LIMIT_BACKOFF_MAX = 960
+
+# ストリームでは使わない検索APIのパラメータ
+SEARCH_ONLY_PARAMS = ("query", "max_results")
+
+
+class StreamRuleError(Exception):
+    """ストリームのルールの追加・削除が拒否されたことを表す例外"""
+
+    def __init__(self, errors):
+        super().__init__(f"ストリームのルールの更新に失敗しました: {errors}")
+        self.errors = errors
+
+
+class Backoff:
+    """再接続までの待機時間（接続に成功したら reset する）"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """連続失敗の回数を戻す"""
+        self._network = 0
+        self._http = 0
+        self._rate_limit = 0
+
+    def network_error(self):
+        """ネットワークエラー・無通信の後の待機時間（線形）"""
+        self._network += 1
+        return min(NETWORK_BACKOFF_STEP * self._network, NETWORK_BACKOFF_MAX)
+
+    def http_error(self):
+        """HTTPエラーの後の待機時間（指数）"""
+        wait = min(HTTP_BACKOFF_INITIAL * 2**self._http, HTTP_BACKOFF_MAX)
+        self._http += 1
+        return wait
+
+    def rate_limited(self, reset_at=None):
+        """レート制限の後の待機時間（指数。再開可能時刻の方が遅ければその時刻まで）"""
+        wait = min(RATE_LIMIT_BACKOFF_INITIAL * 2**self._rate_limit, RATE_LIMIT_BACKOFF_MAX)
+        self._rate_limit += 1
+        if reset_at:
+            wait = max(wait, reset_at - time.time())
+        return wait
+
+
+def build_rules(specs):
+    """
+    監視クエリからストリームのルールを作る
+
+    X API は同じ内容のルールを重複して登録できないため、複数のクエリで同じ検索クエリを使っている場合は
+    最初のクエリのみに転送する。
+
+    Returns:
+        list[dict]: ルール（value: 検索クエリ / tag: クエリ名）
+    """
+    rules = []
+    seen = {}
+    for spec in specs:
+        for query in spec.queries:
+            if query in seen:
+                logger.warning(
+                    f"[{spec.name}] クエリ {seen[query]} と同じ検索クエリのため、ストリームでは転送しません: {query}"
+                )
+                continue
+            seen[query] = spec.name
+            rules.append({"value": query, "tag": spec.name})
+    return rules
+
+
+def get_rules():
+    """登録済みのストリームのルール（id / value / tag）"""
+    res = transport.request("GET", STREAM_RULES_URL, timeout=X_API_TIMEOUT, headers=get_x_api_headers())
+    res.raise_for_status()
+    return res.json().get("data", [])
+
+
+def _post_rules(body):
+    """ルールを追加・削除する"""
+    res = transport.request("POST", STREAM_RULES_URL, timeout=X_API_TIMEOUT, headers=get_x_api_headers(), json=body)
+    res.raise_for_status()
+    payload = res.json()
+    if payload.get("errors"):
+        raise StreamRuleError(payload["errors"])
+    return payload
+
+
+def sync_rules(rules):
+    """
+    ストリームのルールを rules と一致させる（差分のみ追加・削除）
+
+    ストリームのルールはアプリごとに1組のため、rules にないルールはこのボット以外のものでも削除する。
+
+    Returns:
+        tuple: (追加したルール数, 削除したルール数)
+
+    Raises:
+        StreamRuleError: X API がルールを拒否した場合
+    """
+    current = get_rules()
+    wanted = {(rule["value"], rule["tag"]) for rule in rules}
+    existing = {(rule["value"], rule.get("tag")) for rule in current}
+
+    stale = [rule["id"] for rule in current if (rule["value"], rule.get("tag")) not in wanted]
+    missing = [rule for rule in rules if (rule["value"], rule["tag"]) not in existing]
+    # 削除を先に行い、タグだけ変わったルール（同じ value）を追加できるようにする
+    if stale:
+        _post_rules({"delete": {"ids": stale}})
+    if missing:
+        _post_rules({"add": missing})
+    logger.info(f"ストリームのルールを同期しました（追加: {len(missing)}件 / 削除: {len(stale)}件）")
+    return len(missing), len(stale)
+
+
+def open_stream():
+    """
+    ストリームに接続する
+
+    Returns:
+        requests.Response: 接続済みのレスポンス（iter_events で読む）
+
+    Raises:
+        RateLimitError: レート制限に達した場合
+        requests.HTTPError: そのほかのHTTPエラー
+    """
+    params = {key: value for key, value in get_x_api_params().items() if key not in SEARCH_ONLY_PARAMS}
+    url = f"{STREAM_URL}?{urlencode(params, doseq=True)}"
+    logger.info(f"ストリームに接続中: {url}")
+
+    # 読み込みのタイムアウトを無通信の判定に使う
+    res = transport.request(
+        "GET", url, timeout=(X_API_TIMEOUT, STREAM_STALL_TIMEOUT), headers=get_x_api_headers(), stream=True
+    )
+    metrics.stream_connections.inc(status=res.status_code)
+    log_rate_limit_info(res)
+    if res.status_code == 429:
+        res.close()
+        metrics.rate_limited.inc(api="x")
+        raise RateLimitError(get_rate_limit_reset(res))
+    if res.status_code >= 400:
+        res.close()
+        res.raise_for_status()
+    logger.info("ストリームに接続しました")
+    return res
+
+
+def iter_events(res, stop_event=None):
+    """
+    ストリームのツイートを1件ずつ返すジェネレーター（キープアライブの空行は読み飛ばす）
+
+    Yields:
+        dict: 1件分のペイロード（data / includes / matching_rules）
+    """
+    for line in res.iter_lines():
+        if stop_event is not None and stop_event.is_set():
+            return
+        if not line:
+            continue
+        try:
+            event = loads(line)
+        except ValueError as e:
+            # 切断の直前に受け取った途中までの行など。読み飛ばし、切断されれば再接続する
+            logger.warning(f"ストリームの行を解析できないため読み飛ばします: {e}")
+            continue
+        if "data" in event:
+            metrics.stream_tweets.inc()
+            # ストリームで受け取ったツイートも月間の読み取り数に含まれる
+            get_manager().record_tweets(1)
+            logger.info("ストリームからツイートを受信: %s", event["data"].get("id"), extra=PER_ITEM)
+            yield event
+        for error in event.get("errors", []):
+            # 運用上の切断（operational-disconnect）などはこの後サーバーから切断される
+            logger.warning(f"ストリームのエラー: {error.get('title')} - {error.get('detail')}")
+
+
+def run_stream(on_event, stop_event=None, on_connect=None, backoff=None):
+    """
+    stop_event がセットされるまでストリームを読み続ける（切断時は待機して再接続する）
+
+    Args:
+        on_event: ツイート1件ごとに呼ぶ関数（読み込みを止めないよう、すぐに戻ること）
+        stop_event: 停止を指示する threading.Event
+        on_connect: 接続するたびに呼ぶ関数（切断中のツイートの取得などに使う）
+        backoff: 再接続の待機時間（省略時は Backoff）
+    """
+    stop_event = stop_event or threading.Event()
+    backoff = backoff or Backoff()
+    while not stop_event.is_set():
+        try:
+            with open_stream() as res:
+                backoff.reset()
+                if on_connect is not None:
+                    on_connect()
+                for event in iter_events(res, stop_event):
+                    on_event(event)
+            if stop_event.is_set():
+                break
+            wait = backoff.network_error()
+            logger.warning(f"ストリームが切断されました。{wait:.2f}秒後に再接続します")
+        except RateLimitError as e:
+            wait = backoff.rate_limited(e.reset_at)
+            logger.warning(f"ストリームのレート制限に達しました。{wait:.0f}秒後に再接続します")
+        except requests.HTTPError as e:
+            wait = backoff.http_error()
+            logger.warning(f"ストリームへの接続に失敗しました（{e}）。{wait:.0f}秒後に再接続します")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            metrics.stream_connections.inc(status="error")
+            wait = backoff.network_error()
+            logger.warning(f"ストリームの接続が途切れました（{e}）。{wait:.2f}秒後に再接続します")
+        except Exception:
+            # 想定していないエラーでもストリームを止めず、ネットワークエラーと同じく待機して再接続する
+            metrics.stream_connections.inc(status="error")
+            wait = backoff.network_error()
+            logger.exception(f"ストリームの読み込み中に予期しないエラーが発生しました。{wait:.2f}秒後に再接続します")
+        stop_event.wait(wait)
+    logger.info("ストリームを停止しました")
@@ -2,11 +2,14 @@ import os
 import sys
 from unittest.mock import patch
 
+import pytest
+
 # Add src to path before importing
 if "src" not in sys.path:
     sys.path.append("src")
 
 from src.config import (  # noqa: E402
+    get_field_profile,
     get_x_api_headers,
     get_x_api_params,
     validate_env_vars,
@@ -59,6 +62,16 @@ class TestConfig:
         ):
             assert validate_env_vars() is False
 
+    def test_validate_env_vars_with_queries(self):
+        """QUERIES設定時はQUERYとDISCORD_WEBHOOK_URLを必須としないテスト"""
+        with (
+            patch("src.config.X_BEARER_TOKEN", "test_token"),
+            patch("src.config.WEBHOOK_URL", None),
+            patch("src.config.QUERY", None),
+            patch("src.config.QUERIES", '[{"name": "a", "query": "q", "webhook_url": "https://discord.com/a"}]'),
+        ):
+            assert validate_env_vars() is True
+
     def test_get_x_api_headers(self):
         """X APIヘッダーの生成テスト"""
         with patch("src.config.X_BEARER_TOKEN", "test_token_123"):
@@ -66,15 +79,40 @@ class TestConfig:
             assert headers == {"Authorization": "Bearer test_token_123"}
 
     def test_get_x_api_params(self):
-        """X APIパラメータの生成テスト"""
-        with patch("src.config.QUERY", "test_query"):
+        """X APIパラメータの生成テスト（analytics プロファイルはすべてのフィールドを要求する）"""
+        with patch("src.config.QUERY", "test_query"), patch("src.config.X_FIELD_PROFILE", "analytics"):
             params = get_x_api_params()
             expected_params = {
                 "query": "test_query",
-                "max_results": 50,
+                "max_results": 100,
                 "tweet.fields": "created_at,lang,public_metrics,author_id",
                 "user.fields": "name,username,profile_image_url",
                 "media.fields": "url,preview_image_url,type",
                 "expansions": "author_id,attachments.media_keys",
             }
             assert params == expected_params
+
+    def test_get_x_api_params_minimal(self):
+        """minimal プロファイルはツイートURLに必要な author_id の展開のみ要求する"""
+        with patch("src.config.QUERY", "test_query"), patch("src.config.X_FIELD_PROFILE", "minimal"):
+            assert get_x_api_params() == {
+                "query": "test_query",
+                "max_results": 100,
+                "tweet.fields": "author_id",
+                "expansions": "author_id",
+            }
+
+    @pytest.mark.parametrize(
+        ("profile", "pack_mode", "expected"),
+        [
+            ("auto", "off", "minimal"),
+            ("auto", "content", "minimal"),
+            ("auto", "embeds", "embed"),
+            ("embed", "off", "embed"),
+            ("unknown", "off", "analytics"),
+        ],
+    )
+    def test_get_field_profile(self, profile, pack_mode, expected):
+        """auto は出力形式から、不正な値は analytics を選ぶ"""
+        with patch("src.config.X_FIELD_PROFILE", profile), patch("src.config.DISCORD_PACK_MODE", pack_mode):
+            assert get_field_profile() == expected
@@ -0,0 +1,58 @@
+import sys
+
+sys.path.append("src")
+
+from src.dedup import DeliveredIds
+
+
+class TestDeliveredIds:
+    """dedupモジュールのテスト"""
+
+    def test_contains(self):
+        """記憶したツイートIDを判定できるテスト"""
+        delivered = DeliveredIds(["1", "2"], max_size=10)
+        delivered.add(["3"])
+
+        assert "1" in delivered
+        assert "3" in delivered
+        assert "4" not in delivered
+        assert len(delivered) == 3
+
+    def test_evicts_oldest_over_limit(self):
+        """上限を超えると古いものから忘れるテスト"""
+        delivered = DeliveredIds(max_size=3)
+        delivered.add(["1", "2", "3", "4", "5"])
+
+        assert len(delivered) == 3
+        assert "2" not in delivered
+        assert delivered.to_list() == ["3", "4", "5"]
+
+    def test_add_duplicate_keeps_size(self):
+        """同じIDを追加しても件数が増えないテスト"""
+        delivered = DeliveredIds(["1"], max_size=3)
+        delivered.add(["1", "1"])
+
+        assert delivered.to_list() == ["1"]
+        assert not delivered.changed
+
+    def test_loaded_ids_are_truncated(self):
+        """保存済みの一覧が上限より多い場合は新しい方を残すテスト"""
+        delivered = DeliveredIds([str(i) for i in range(10)], max_size=4)
+
+        assert delivered.to_list() == ["6", "7", "8", "9"]
+        assert not delivered.changed
+
+    def test_changed(self):
+        """新しいIDを追加した場合のみ変更ありとなるテスト"""
+        delivered = DeliveredIds(["1"], max_size=3)
+        delivered.add(["2"])
+        assert delivered.changed
+
+    def test_disabled(self):
+        """上限が0の場合は何も記憶しないテスト"""
+        delivered = DeliveredIds(["1"], max_size=0)
+        delivered.add(["2"])
+
+        assert len(delivered) == 0
+        assert "1" not in delivered
+        assert not delivered.changed
@@ -0,0 +1,115 @@
+import sys
+import threading
+import time
+
+sys.path.append("src")
+
+from src.delivery import DeliveryItem, deliver
+from src.logging_config import run_context, run_id_var
+
+
+def _items(ids, webhook_url=None):
+    return [DeliveryItem(tweet_ids=[i], message={"content": i}, webhook_url=webhook_url) for i in ids]
+
+
+class TestDelivery:
+    """deliveryモジュールのテスト"""
+
+    def test_deliver_all_success(self):
+        """全件配信成功時に最後のIDがコミットされるテスト"""
+        posted = []
+
+        result = deliver(_items(["1", "2", "3"]), post=lambda **kw: posted.append(kw["content"]))
+
+        assert posted == ["1", "2", "3"]
+        assert result.delivered == 3
+        assert result.failed == 0
+        assert result.committed_id == "3"
+        assert result.error is None
+
+    def test_deliver_on_delivered(self):
+        """配信に成功した配信単位だけが on_delivered に渡されるテスト"""
+        delivered = []
+
+        def post(**kw):
+            if kw["content"] == "2":
+                raise RuntimeError("boom")
+
+        deliver(_items(["1", "2", "3"]), post=post, strict_order=False, on_delivered=delivered.append)
+
+        assert sorted(item.tweet_ids[0] for item in delivered) == ["1", "3"]
+
+    def test_deliver_keeps_log_context(self):
+        """配信レーンのスレッドにログの相関IDを引き継ぐテスト"""
+        run_ids = []
+
+        with run_context("run-1"):
+            deliver(_items(["1", "2"]), post=lambda **_kw: run_ids.append(run_id_var.get()), strict_order=False)
+
+        assert run_ids == ["run-1", "run-1"]
+
+    def test_deliver_empty(self):
+        """配信対象がない場合のテスト"""
+        result = deliver([], post=lambda **_kw: None)
+        assert result.committed_id is None
+        assert result.delivered == 0
+
+    def test_deliver_strict_order_stops_lane_on_failure(self):
+        """順序保証時は失敗以降の配信を保留し、失敗直前までをコミットするテスト"""
+        posted = []
+
+        def post(**kw):
+            if kw["content"] == "2":
+                raise RuntimeError("failed")
+            posted.append(kw["content"])
+
+        result = deliver(_items(["1", "2", "3"]), post=post, strict_order=True)
+
+        assert posted == ["1"]
+        assert result.committed_id == "1"
+        assert result.failed == 1
+        assert isinstance(result.error, RuntimeError)
+
+    def test_deliver_unordered_commits_contiguous_prefix(self):
+        """順序非保証時も途切れずに配信できた位置までしかコミットしないテスト"""
+
+        def post(**kw):
+            if kw["content"] == "2":
+                raise RuntimeError("failed")
+
+        result = deliver(_items(["1", "2", "3"]), post=post, strict_order=False)
+
+        assert result.delivered == 2
+        assert result.committed_id == "1"
+
+    def test_deliver_first_item_failure(self):
+        """先頭が失敗した場合は何もコミットしないテスト"""
+
+        def post(**_kw):
+            raise RuntimeError("failed")
+
+        result = deliver(_items(["1", "2"]), post=post)
+
+        assert result.committed_id is None
+
+    def test_deliver_lanes_run_concurrently(self):
+        """異なるWebhookへの配信が並行に実行されるテスト"""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def post(**_kw):
+            barrier.wait()
+
+        items = _items(["1"], webhook_url="https://discord.com/a") + _items(["2"], webhook_url="https://discord.com/b")
+        start = time.monotonic()
+        result = deliver(items, post=post, max_workers=2)
+
+        assert result.delivered == 2
+        assert time.monotonic() - start < 5
+
+    def test_deliver_passes_webhook_url(self):
+        """配信先のWebhook URLが送信関数に渡されるテスト"""
+        received = []
+
+        deliver(_items(["1"], webhook_url="https://discord.com/a"), post=lambda **kw: received.append(kw["webhook_url"]))
+
+        assert received == ["https://discord.com/a"]
@@ -1,5 +1,6 @@
 import json
 import sys
+import time
 from unittest.mock import patch
 
 import pytest
@@ -8,7 +9,16 @@ import responses
 
 sys.path.append("src")
 
-from src.discord_client import discord_post, get_tweet_url
+from src.discord_client import (
+    DISCORD_CONTENT_LIMIT,
+    EMBED_COLOR,
+    RateLimiter,
+    build_rich_embed,
+    discord_post,
+    get_tweet_url,
+    metrics,
+    pack_messages,
+)
 
 
 class TestDiscordClient:
@@ -117,6 +127,184 @@ class TestDiscordClient:
             with pytest.raises(ConnectionError):
                 discord_post(content="Test message")
 
+    @responses.activate
+    def test_discord_post_retries_on_rate_limit(self):
+        """429レスポンス時にretry_after秒待機してリトライするテスト"""
+        responses.add(
+            responses.POST,
+            "https://discord.com/webhook",
+            json={"retry_after": 0.25, "global": False},
+            status=429,
+        )
+        responses.add(responses.POST, "https://discord.com/webhook", status=204)
+
+        rate_limited = metrics.rate_limited.value(api="discord")
+        posts = metrics.discord_posts.value(status=204)
+        with (
+            patch("src.discord_client.WEBHOOK_URL", "https://discord.com/webhook"),
+            patch("src.discord_client.time.sleep") as mock_sleep,
+        ):
+            r = discord_post(content="Test message")
+
+        assert r.status_code == 204
+        assert len(responses.calls) == 2
+        mock_sleep.assert_called_once_with(0.25)
+        assert metrics.rate_limited.value(api="discord") == rate_limited + 1
+        assert metrics.discord_posts.value(status=204) == posts + 1
+
+    @responses.activate
+    def test_discord_post_with_webhook_url(self):
+        """配信先Webhook URLを指定した投稿テスト"""
+        responses.add(responses.POST, "https://discord.com/other", status=204)
+
+        with patch("src.discord_client.WEBHOOK_URL", "https://discord.com/webhook"):
+            discord_post(content="Test message", webhook_url="https://discord.com/other")
+
+        assert responses.calls[0].request.url == "https://discord.com/other"
+
+    def test_rate_limiter_waits_when_bucket_exhausted(self):
+        """バケットの残りが0の場合にリセットまで待機するテスト"""
+        limiter = RateLimiter()
+        limiter.update(
+            "https://discord.com/webhook",
+            {"X-RateLimit-Bucket": "abc", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.05"},
+        )
+
+        with patch("src.discord_client.time.sleep", wraps=time.sleep) as mock_sleep:
+            limiter.acquire("https://discord.com/webhook")
+
+        mock_sleep.assert_called_once()
+        assert 0 < mock_sleep.call_args[0][0] <= 0.05
+
+    def test_rate_limiter_shares_bucket_between_routes(self):
+        """同じバケットに属するルートで残り枠を共有するテスト"""
+        limiter = RateLimiter()
+        headers = {"X-RateLimit-Bucket": "abc", "X-RateLimit-Remaining": "1", "X-RateLimit-Reset-After": "60"}
+        limiter.update("https://discord.com/a", headers)
+        limiter.update("https://discord.com/b", headers)
+
+        with patch("src.discord_client.time.sleep", side_effect=RuntimeError("would wait")):
+            limiter.acquire("https://discord.com/a")
+            with pytest.raises(RuntimeError):
+                limiter.acquire("https://discord.com/b")
+
+    def test_rate_limiter_no_headers(self):
+        """レート制限ヘッダーがない場合は待機しないテスト"""
+        limiter = RateLimiter()
+        limiter.update("https://discord.com/webhook", {})
+
+        with patch("src.discord_client.time.sleep") as mock_sleep:
+            limiter.acquire("https://discord.com/webhook")
+
+        mock_sleep.assert_not_called()
+
+    @responses.activate
+    def test_discord_post_with_embeds(self):
+        """複数embedでのDiscord投稿テスト"""
+        responses.add(responses.POST, "https://discord.com/webhook", status=204)
+        embeds = [{"title": "a"}, {"title": "b"}]
+
+        with patch("src.discord_client.WEBHOOK_URL", "https://discord.com/webhook"):
+            discord_post(embeds=embeds)
+
+        assert self._request_json() == {"embeds": embeds}
+
+    def test_pack_messages_off(self):
+        """まとめない場合は1件ずつ返すテスト"""
+        messages = [("1", {"content": "a"}), ("2", {"content": "b"})]
+        assert pack_messages(messages, mode="off") == [(["1"], {"content": "a"}), (["2"], {"content": "b"})]
+
+    def test_pack_messages_content(self):
+        """contentを改行区切りでまとめるテスト"""
+        messages = [("1", {"content": "a"}), ("2", {"content": "b"}), ("3", {"content": "c"})]
+        assert pack_messages(messages, mode="content") == [(["1", "2", "3"], {"content": "a\nb\nc"})]
+
+    def test_pack_messages_content_limit(self):
+        """2000文字を超えないように分割するテスト"""
+        url = "https://x.com/user/status/" + "1" * 74  # 100文字
+        messages = [(str(i), {"content": url}) for i in range(30)]
+
+        packed = pack_messages(messages, mode="content")
+
+        assert all(len(message["content"]) <= DISCORD_CONTENT_LIMIT for _ids, message in packed)
+        assert [len(ids) for ids, _message in packed] == [19, 11]
+        assert [i for ids, _message in packed for i in ids] == [str(i) for i in range(30)]
+
+    def test_pack_messages_embeds(self):
+        """embedを最大10件ずつまとめるテスト"""
+        messages = [(str(i), {"embed": {"title": str(i)}}) for i in range(23)]
+
+        packed = pack_messages(messages, mode="embeds")
+
+        assert [len(message["embeds"]) for _ids, message in packed] == [10, 10, 3]
+        assert packed[0][0] == [str(i) for i in range(10)]
+
+    def test_pack_messages_unpackable_message(self):
+        """まとめられないメッセージは順序を保って単独で送るテスト"""
+        messages = [("1", {"content": "a"}), ("2", {"embed": {"title": "b"}}), ("3", {"content": "c"})]
+
+        packed = pack_messages(messages, mode="content")
+
+        assert packed == [
+            (["1"], {"content": "a"}),
+            (["2"], {"embed": {"title": "b"}}),
+            (["3"], {"content": "c"}),
+        ]
+
+    def test_build_rich_embed(self):
+        """includes の投稿者・メディア・エンゲージメント数から embed を組み立てるテスト"""
+        tweet = {
+            "id": "123",
+            "author_id": "user1",
+            "text": "動画です",
+            "created_at": "2024-01-01T00:00:00.000Z",
+            "public_metrics": {"reply_count": 1, "retweet_count": 2, "like_count": 3, "quote_count": 0},
+            "attachments": {"media_keys": ["7_1", "3_1"]},
+        }
+        users_idx = {
+            "user1": {"id": "user1", "username": "testuser", "name": "Test User", "profile_image_url": "https://pbs/icon.jpg"}
+        }
+        media_idx = {
+            "7_1": {"media_key": "7_1", "type": "video", "preview_image_url": "https://pbs/preview.jpg"},
+            "3_1": {"media_key": "3_1", "type": "photo", "url": "https://pbs/photo.jpg"},
+        }
+
+        assert build_rich_embed(tweet, users_idx, media_idx) == {
+            "author": {
+                "name": "Test User (@testuser)",
+                "url": "https://x.com/testuser/status/123",
+                "icon_url": "https://pbs/icon.jpg",
+            },
+            "url": "https://x.com/testuser/status/123",
+            "description": "動画です",
+            "color": EMBED_COLOR,
+            "timestamp": "2024-01-01T00:00:00.000Z",
+            "fields": [
+                {"name": "返信", "value": "1", "inline": True},
+                {"name": "リポスト", "value": "2", "inline": True},
+                {"name": "いいね", "value": "3", "inline": True},
+            ],
+            # 動画は最初のメディアのサムネイルを表示する
+            "image": {"url": "https://pbs/preview.jpg"},
+        }
+
+    def test_build_rich_embed_minimal_fields(self):
+        """要求していないフィールドは省略し、長い本文は上限で切り詰めるテスト"""
+        tweet = {"id": "123", "author_id": "user1", "text": "あ" * 5000}
+        embed = build_rich_embed(tweet, {"user1": {"username": "testuser"}}, {})
+
+        assert embed["author"] == {"name": "@testuser", "url": "https://x.com/testuser/status/123"}
+        assert len(embed["description"]) == 4096
+        assert embed["description"].endswith("…")
+        assert not {"timestamp", "fields", "image"} & set(embed)
+
+    def test_build_rich_embed_unescapes_text(self):
+        """X API が文字参照で返す本文の & < > を元の文字に戻すテスト"""
+        tweet = {"id": "123", "author_id": "user1", "text": "Q&amp;A &lt;告知&gt; &amp;amp;"}
+        embed = build_rich_embed(tweet, {"user1": {"username": "testuser"}}, {})
+
+        assert embed["description"] == "Q&A <告知> &amp;"
+
     def test_get_tweet_url_basic(self):
         """基本的なツイートURLの生成テスト"""
         tweet = {
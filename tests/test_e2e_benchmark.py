@@ -0,0 +1,35 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestE2EBenchmark:
+    """エンドツーエンドのベンチマークのテスト"""
+
+    def test_benchmark_delivers_every_tweet_once(self, tmp_path):
+        """代替サーバーに対して全ツイートを1回ずつ配信し、結果を保存するテスト"""
+        output = tmp_path / "e2e.jsonl"
+        args = ["--bursts", "5", "30", "--x-page-size", "10", "--x-latency", "0", "--discord-latency", "0"]
+        for _ in range(2):
+            subprocess.run(  # noqa: S603
+                [sys.executable, str(ROOT / "benchmarks" / "e2e.py"), *args, "--output", str(output)],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+
+        records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+        assert len(records) == 2
+        results = records[-1]["results"]
+        assert [r["tweets"] for r in results] == [5, 30]
+        for r in results:
+            assert r["delivered"] == r["tweets"]
+            assert r["duplicates"] == 0
+            assert r["webhook_calls"] == r["tweets"]
+            assert r["latency_p50_ms"] <= r["latency_p99_ms"] <= r["wall_ms"]
+        # 30件は10件ずつ3ページで取得する
+        assert results[1]["x_requests"] == 3
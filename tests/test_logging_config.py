@@ -0,0 +1,96 @@
+import json
+import logging
+import queue
+import sys
+
+sys.path.append("src")
+
+from src.logging_config import (
+    PER_ITEM,
+    ContextFilter,
+    ItemSamplingFilter,
+    JsonFormatter,
+    LazyQueueHandler,
+    query_context,
+    run_context,
+)
+
+
+def _record(msg="message %s", args=("arg",), level=logging.INFO, extra=None):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    for key, value in (extra or {}).items():
+        setattr(record, key, value)
+    return record
+
+
+class TestLoggingConfig:
+    """logging_configモジュールのテスト"""
+
+    def test_context_filter(self):
+        """相関ID・クエリ名をレコードに付けるテスト"""
+        with run_context("run-1"), query_context("asai"):
+            record = _record()
+            ContextFilter().filter(record)
+        assert (record.run_id, record.query) == ("run-1", "asai")
+
+        record = _record()
+        ContextFilter().filter(record)
+        assert (record.run_id, record.query) == (None, None)
+
+    def test_run_context_generates_id(self):
+        """相関IDを指定しない場合は実行ごとに新しいIDを作るテスト"""
+        with run_context() as first, run_context() as second:
+            assert first
+            assert first != second
+
+    def test_json_formatter(self):
+        """Cloud Logging 形式の1行のJSONに変換するテスト"""
+        record = _record(extra={"run_id": "run-1", "query": None})
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert entry["severity"] == "INFO"
+        assert entry["message"] == "message arg"
+        assert entry["run_id"] == "run-1"
+        assert "query" not in entry
+        assert entry["time"].endswith("+00:00")
+
+    def test_json_formatter_exception(self):
+        """例外のスタックトレースをメッセージに含めるテスト"""
+
+        def fail():
+            raise RuntimeError("boom")
+
+        try:
+            fail()
+        except RuntimeError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["severity"] == "ERROR"
+        assert entry["message"].startswith("failed\nTraceback")
+        assert "RuntimeError: boom" in entry["message"]
+
+    def test_item_sampling_filter(self):
+        """ツイートごとのログだけを一定の割合で通すテスト"""
+        sampling = ItemSamplingFilter(0.25)
+
+        passed = [sampling.filter(_record(extra=PER_ITEM)) for _ in range(8)]
+        assert passed.count(True) == 2
+        assert sampling.filter(_record())
+        assert sampling.filter(_record(level=logging.WARNING, extra=PER_ITEM))
+
+    def test_item_sampling_filter_disabled(self):
+        """割合が0の場合はツイートごとのログを出力しないテスト"""
+        sampling = ItemSamplingFilter(0)
+        assert not sampling.filter(_record(extra=PER_ITEM))
+        assert sampling.filter(_record())
+
+    def test_lazy_queue_handler_defers_formatting(self):
+        """キューに入れる時点ではメッセージを整形しないテスト"""
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        record = _record()
+        handler.emit(record)
+
+        queued = handler.queue.get_nowait()
+        assert queued.msg == "message %s"
+        assert queued.args == ("arg",)
@@ -1,27 +1,62 @@
 import sys
+import threading
 from unittest.mock import patch
 
 import pytest
 
 sys.path.append("src")
 
-from src.main import fetch_and_forward, main
+from src.main import (
+    DeliveryItem,
+    Outbox,
+    RateLimitError,
+    fetch_and_forward,
+    forward_query,
+    get_manager,
+    main,
+    metrics,
+    run_bot,
+    stream_and_forward,
+)
+from src.queries import QuerySpec
+from src.x_decode import index_page
+
+
+def _pages(payloads):
+    """iter_tweet_pages が返すページ（x_decode.Page）のイテレーター"""
+    return iter([index_page(payload) for payload in payloads])
 
 
 class TestMain:
     """mainモジュールのテスト"""
 
+    def setup_method(self):
+        self.patchers = [
+            patch("src.main.load_query_specs", return_value=[QuerySpec(name="default", queries=("test query",))]),
+            patch("src.main.load_deferred_until", return_value=None),
+            patch("src.main.OUTBOX_DIR", ""),
+            patch("src.main.load_delivered_ids", return_value=[]),
+            patch("src.main.save_delivered_ids"),
+            patch("src.main.load_quota_state", return_value={}),
+            patch("src.main.save_quota_state"),
+            patch("src.main.load_backfill", return_value=None),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def teardown_method(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
     @patch("src.main.save_since_id")
     @patch("src.main.discord_post")
     @patch("src.main.get_tweet_url")
-    @patch("src.main.build_index")
-    @patch("src.main.fetch_tweets")
+    @patch("src.main.iter_tweet_pages")
     @patch("src.main.load_since_id")
     def test_fetch_and_forward_success(
         self,
         mock_load_since_id,
-        mock_fetch_tweets,
-        mock_build_index,
+        mock_iter_tweet_pages,
         mock_get_tweet_url,
         mock_discord_post,
         mock_save_since_id,
@@ -29,70 +64,153 @@ class TestMain:
         """正常なツイート取得と転送のテスト"""
         # モックの設定
         mock_load_since_id.return_value = "123"
-        mock_fetch_tweets.return_value = {
-            "data": [
-                {"id": "125", "author_id": "user1", "text": "New tweet"},
-                {"id": "124", "author_id": "user2", "text": "Another tweet"},
-            ],
-            "includes": {
-                "users": [
-                    {"id": "user1", "username": "testuser1"},
-                    {"id": "user2", "username": "testuser2"},
-                ],
-            },
-        }
-        mock_build_index.return_value = {"user1": {"username": "testuser1"}, "user2": {"username": "testuser2"}}
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "125", "author_id": "user1", "text": "New tweet"},
+                        {"id": "124", "author_id": "user2", "text": "Another tweet"},
+                    ],
+                    "includes": {
+                        "users": [
+                            {"id": "user1", "username": "testuser1"},
+                            {"id": "user2", "username": "testuser2"},
+                        ],
+                    },
+                }
+            ]
+        )
         mock_get_tweet_url.return_value = "https://x.com/testuser/status/123"
 
+        runs = metrics.runs.value(status="success")
+        forwarded = metrics.tweets_forwarded.value(query="default")
+
         fetch_and_forward()
 
         # 各関数が適切に呼ばれることを確認
-        mock_load_since_id.assert_called_once()
-        mock_fetch_tweets.assert_called_once_with("123")
-        mock_build_index.assert_called_once()
+        mock_load_since_id.assert_called_once_with("default")
+        mock_iter_tweet_pages.assert_called_once_with("123", query="test query")
         assert mock_get_tweet_url.call_count == 2
         assert mock_discord_post.call_count == 2
-        mock_save_since_id.assert_called_once_with("125")
+        mock_save_since_id.assert_called_once_with("125", "default")
+        assert metrics.runs.value(status="success") == runs + 1
+        assert metrics.tweets_forwarded.value(query="default") == forwarded + 2
+
+    @patch("src.main.save_backfill")
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_records_truncated_range(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id, mock_save_backfill
+    ):
+        """取得上限で打ち切った場合は、取得しなかった範囲を保存して実行結果に含めるテスト"""
+        mock_load_since_id.return_value = "100"
+        page = index_page({"data": [{"id": "130", "author_id": "u"}, {"id": "120", "author_id": "u"}]})
+        page.truncated = True
+        mock_iter_tweet_pages.return_value = iter([page])
+        truncated = metrics.x_api_walks_truncated.value(query="default")
+
+        result = fetch_and_forward()
+
+        window = {"since_id": "100", "until_id": "120"}
+        mock_save_backfill.assert_called_once_with(window, "default")
+        mock_save_since_id.assert_called_once_with("130", "default")
+        assert result["queries"]["default"]["backfill"] == window
+        assert metrics.x_api_walks_truncated.value(query="default") == truncated + 1
+        assert mock_discord_post.call_count == 2
+
+    @patch("src.main.save_backfill")
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_fetches_truncated_range_first(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id, mock_save_backfill
+    ):
+        """取得しなかった範囲は since_id を進めずに先に取得し、取得し終えたら範囲を消すテスト"""
+        mock_load_since_id.return_value = "130"
+        mock_iter_tweet_pages.return_value = _pages([{"data": [{"id": "110", "author_id": "u"}]}])
+        window = {"since_id": "100", "until_id": "120"}
 
-    @patch("src.main.fetch_tweets")
+        with (
+            patch("src.main.load_backfill", return_value=window),
+            patch("src.main.is_since_id_valid", return_value=True),
+        ):
+            result = fetch_and_forward()
+
+        mock_iter_tweet_pages.assert_called_once_with("100", query="test query", until_id="120")
+        mock_save_since_id.assert_not_called()
+        mock_save_backfill.assert_called_once_with(None, "default")
+        assert result["queries"]["default"]["backfill"] is None
+        assert mock_discord_post.call_count == 1
+
+    @patch("src.main.save_quota_state")
+    @patch("src.main.iter_tweet_pages")
     @patch("src.main.load_since_id")
-    def test_fetch_and_forward_no_payload(self, mock_load_since_id, mock_fetch_tweets):
-        """fetch_tweetsがNoneを返す場合のテスト"""
+    def test_fetch_and_forward_saves_quota_only_when_used(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_save_quota_state
+    ):
+        """再開時刻・予算の読み取り数が変わらない実行では呼び出し枠・予算の状態を保存しないテスト"""
         mock_load_since_id.return_value = "123"
-        mock_fetch_tweets.return_value = None
+        mock_iter_tweet_pages.return_value = _pages([])
+        fetch_and_forward()
+        mock_save_quota_state.assert_not_called()
+
+        def pages(_since_id, **_kwargs):
+            get_manager().record_tweets(1)
+            yield index_page({"data": [{"id": "124", "author_id": "u"}], "includes": {}})
+
+        # 予算がない場合は読み取り数が変わっても保存しない
+        mock_iter_tweet_pages.side_effect = pages
+        with patch("src.main.discord_post"), patch("src.main.save_since_id"):
+            fetch_and_forward()
+        mock_save_quota_state.assert_not_called()
+
+        mock_iter_tweet_pages.side_effect = pages
+        with (
+            patch.object(get_manager(), "monthly_budget", 1_000_000),
+            patch("src.main.discord_post"),
+            patch("src.main.save_since_id"),
+        ):
+            fetch_and_forward()
+        mock_save_quota_state.assert_called_once()
+
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_no_payload(self, mock_load_since_id, mock_iter_tweet_pages):
+        """ページが1件も取得できない場合のテスト"""
+        mock_load_since_id.return_value = "123"
+        mock_iter_tweet_pages.return_value = _pages([])
 
         # 例外が発生しないことを確認
         fetch_and_forward()
 
-        mock_load_since_id.assert_called_once()
-        mock_fetch_tweets.assert_called_once_with("123")
+        mock_load_since_id.assert_called_once_with("default")
+        mock_iter_tweet_pages.assert_called_once_with("123", query="test query")
 
-    @patch("src.main.build_index")
-    @patch("src.main.fetch_tweets")
+    @patch("src.main.iter_tweet_pages")
     @patch("src.main.load_since_id")
-    def test_fetch_and_forward_no_tweets(self, mock_load_since_id, mock_fetch_tweets, mock_build_index):
+    def test_fetch_and_forward_no_tweets(self, mock_load_since_id, mock_iter_tweet_pages):
         """ツイートが空の場合のテスト"""
         mock_load_since_id.return_value = "123"
-        mock_fetch_tweets.return_value = {"data": [], "includes": {"users": [], "media": []}}
-        mock_build_index.return_value = {}
+        mock_iter_tweet_pages.return_value = _pages([{"data": [], "includes": {"users": [], "media": []}}])
 
         # 例外が発生しないことを確認
         fetch_and_forward()
 
-        mock_load_since_id.assert_called_once()
-        mock_fetch_tweets.assert_called_once_with("123")
+        mock_load_since_id.assert_called_once_with("default")
+        mock_iter_tweet_pages.assert_called_once_with("123", query="test query")
 
     @patch("src.main.save_since_id")
     @patch("src.main.discord_post")
     @patch("src.main.get_tweet_url")
-    @patch("src.main.build_index")
-    @patch("src.main.fetch_tweets")
+    @patch("src.main.iter_tweet_pages")
     @patch("src.main.load_since_id")
     def test_fetch_and_forward_tweet_sorting(
         self,
         mock_load_since_id,
-        mock_fetch_tweets,
-        mock_build_index,
+        mock_iter_tweet_pages,
         mock_get_tweet_url,
         mock_discord_post,
         mock_save_since_id,
@@ -100,38 +218,518 @@ class TestMain:
         """ツイートがID順でソートされることのテスト"""
         # IDが逆順のツイート
         mock_load_since_id.return_value = "120"
-        mock_fetch_tweets.return_value = {
-            "data": [
-                {"id": "125", "author_id": "user1", "text": "Latest tweet"},
-                {"id": "122", "author_id": "user2", "text": "Earlier tweet"},
-                {"id": "124", "author_id": "user3", "text": "Middle tweet"},
-            ],
-            "includes": {
-                "users": [
-                    {"id": "user1", "username": "testuser1"},
-                    {"id": "user2", "username": "testuser2"},
-                    {"id": "user3", "username": "testuser3"},
-                ],
-            },
-        }
-        mock_build_index.return_value = {
-            "user1": {"username": "testuser1"},
-            "user2": {"username": "testuser2"},
-            "user3": {"username": "testuser3"},
-        }
-        mock_get_tweet_url.return_value = "https://x.com/testuser/status/123"
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "125", "author_id": "user1", "text": "Latest tweet"},
+                        {"id": "122", "author_id": "user2", "text": "Earlier tweet"},
+                        {"id": "124", "author_id": "user3", "text": "Middle tweet"},
+                    ],
+                    "includes": {
+                        "users": [
+                            {"id": "user1", "username": "testuser1"},
+                            {"id": "user2", "username": "testuser2"},
+                            {"id": "user3", "username": "testuser3"},
+                        ],
+                    },
+                }
+            ]
+        )
+        mock_get_tweet_url.side_effect = lambda tw, _users_idx: f"https://x.com/testuser/status/{tw['id']}"
 
         fetch_and_forward()
 
-        # get_tweet_urlが呼ばれた順序を確認（ID順になっているはず）
-        calls = mock_get_tweet_url.call_args_list
+        # Discordに投稿された順序を確認（ID順になっているはず）
+        calls = mock_discord_post.call_args_list
         assert len(calls) == 3
-        assert calls[0][0][0]["id"] == "122"  # 最初に処理されるべき
-        assert calls[1][0][0]["id"] == "124"  # 2番目
-        assert calls[2][0][0]["id"] == "125"  # 最後
+        assert calls[0].kwargs["content"].endswith("/122")  # 最初に処理されるべき
+        assert calls[1].kwargs["content"].endswith("/124")  # 2番目
+        assert calls[2].kwargs["content"].endswith("/125")  # 最後
 
         # 最大IDで保存されることを確認
-        mock_save_since_id.assert_called_once_with("125")
+        mock_save_since_id.assert_called_once_with("125", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_multiple_pages(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """複数ページにまたがるツイートが古い順に転送されることのテスト"""
+        mock_load_since_id.return_value = "100"
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [{"id": "130", "author_id": "user1"}, {"id": "129", "author_id": "user1"}],
+                    "includes": {"users": [{"id": "user1", "username": "newer"}]},
+                    "meta": {"next_token": "token"},
+                },
+                {
+                    "data": [{"id": "128", "author_id": "user2"}],
+                    "includes": {"users": [{"id": "user2", "username": "older"}]},
+                },
+            ]
+        )
+
+        fetch_and_forward()
+
+        posted = [c.kwargs["content"] for c in mock_discord_post.call_args_list]
+        assert posted == [
+            "https://x.com/older/status/128",
+            "https://x.com/newer/status/129",
+            "https://x.com/newer/status/130",
+        ]
+        mock_save_since_id.assert_called_once_with("130", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_sorts_ids_numerically(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id
+    ):
+        """桁数が異なるIDも数値の古い順に転送するテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [{"id": "100", "author_id": "u"}, {"id": "99", "author_id": "u"}],
+                    "includes": {"users": [{"id": "u", "username": "user"}]},
+                }
+            ]
+        )
+
+        fetch_and_forward()
+
+        posted = [c.kwargs["content"] for c in mock_discord_post.call_args_list]
+        assert posted == ["https://x.com/user/status/99", "https://x.com/user/status/100"]
+        mock_save_since_id.assert_called_once_with("100", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_without_since_id_fetches_one_page(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id
+    ):
+        """since_id がない（初回・期限切れ）場合は最新の1ページのみ取得するテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages([{"data": [{"id": "100", "author_id": "u"}]}])
+
+        fetch_and_forward()
+
+        mock_iter_tweet_pages.assert_called_once_with(None, query="test query", max_pages=1)
+        mock_save_since_id.assert_called_once_with("100", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_partial_failure(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """配信途中で失敗した場合は配信済みの位置までsince_idを進めるテスト"""
+        mock_load_since_id.return_value = "100"
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "103", "author_id": "u"},
+                        {"id": "102", "author_id": "u"},
+                        {"id": "101", "author_id": "u"},
+                    ],
+                    "includes": {"users": [{"id": "u", "username": "user"}]},
+                }
+            ]
+        )
+        mock_discord_post.side_effect = [None, Exception("Discord error")]
+
+        with pytest.raises(Exception, match="Discord error"):
+            fetch_and_forward()
+
+        assert mock_discord_post.call_count == 2
+        mock_save_since_id.assert_called_once_with("101", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_pack_mode(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """まとめて投稿するモードで1回のWebhook呼び出しになるテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [{"id": "2", "author_id": "u"}, {"id": "1", "author_id": "u"}],
+                    "includes": {"users": [{"id": "u", "username": "user"}]},
+                }
+            ]
+        )
+
+        with patch("src.main.DISCORD_PACK_MODE", "content"):
+            fetch_and_forward()
+
+        mock_discord_post.assert_called_once()
+        assert mock_discord_post.call_args.kwargs["content"] == "https://x.com/user/status/1\nhttps://x.com/user/status/2"
+        mock_save_since_id.assert_called_once_with("2", "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_rich_embeds(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """embed モードでは includes の投稿者・メディアから組み立てた embed をまとめて投稿するテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "2", "author_id": "u", "text": "photo", "attachments": {"media_keys": ["3_2"]}},
+                        {"id": "1", "author_id": "u", "text": "text"},
+                    ],
+                    "includes": {
+                        "users": [{"id": "u", "username": "user", "name": "User"}],
+                        "media": [{"media_key": "3_2", "type": "photo", "url": "https://pbs.twimg.com/media/2.jpg"}],
+                    },
+                }
+            ]
+        )
+
+        with patch("src.main.DISCORD_PACK_MODE", "embeds"):
+            fetch_and_forward()
+
+        mock_discord_post.assert_called_once()
+        embeds = mock_discord_post.call_args.kwargs["embeds"]
+        assert [embed["url"] for embed in embeds] == ["https://x.com/user/status/1", "https://x.com/user/status/2"]
+        assert embeds[0]["author"]["name"] == "User (@user)"
+        assert "image" not in embeds[0]
+        assert embeds[1]["image"] == {"url": "https://pbs.twimg.com/media/2.jpg"}
+
+        # simple の場合は従来どおりユーザー名と本文のみ
+        mock_iter_tweet_pages.return_value = _pages([{"data": [{"id": "3", "author_id": "u", "text": "t"}], "includes": {}}])
+        with patch("src.main.DISCORD_PACK_MODE", "embeds"), patch("src.main.DISCORD_EMBED_STYLE", "simple"):
+            fetch_and_forward()
+        assert mock_discord_post.call_args.kwargs["embeds"] == [
+            {"title": "@unknown", "url": "https://x.com/unknown/status/3", "description": "t"}
+        ]
+
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    @patch("src.main.load_deferred_until")
+    def test_fetch_and_forward_skips_while_deferred(self, mock_load_deferred_until, mock_load_since_id, mock_iter_tweet_pages):
+        """レート制限の再開時刻前はX APIを呼ばずに延期結果を返すテスト"""
+        mock_load_deferred_until.return_value = 2000
+
+        with patch("src.main.time.time", return_value=1000):
+            result = fetch_and_forward()
+
+        assert result == {"status": "deferred", "forwarded": 0, "deferred_until": 2000}
+        mock_load_since_id.assert_not_called()
+        mock_iter_tweet_pages.assert_not_called()
+
+    @patch("src.main.discord_post")
+    @patch("src.main.save_deferred_until")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    @patch("src.main.load_deferred_until")
+    def test_fetch_and_forward_rate_limited(
+        self,
+        mock_load_deferred_until,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_save_deferred_until,
+        mock_discord_post,
+    ):
+        """レート制限時は再開時刻を保存し、取得済みのページも転送しないテスト"""
+        mock_load_deferred_until.return_value = 500
+        mock_load_since_id.return_value = "100"
+
+        def pages(_since_id, **_kwargs):
+            yield index_page({"data": [{"id": "101", "author_id": "u"}], "meta": {"next_token": "next"}})
+            raise RateLimitError(1640995200)
+
+        mock_iter_tweet_pages.side_effect = pages
+
+        with patch("src.main.time.time", return_value=1000):
+            result = fetch_and_forward()
+
+        assert result["status"] == "deferred"
+        assert result["deferred_until"] == 1640995200
+        mock_save_deferred_until.assert_called_once_with(1640995200)
+        mock_discord_post.assert_not_called()
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_multiple_queries(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """複数クエリをそれぞれのsince_idとWebhookで処理するテスト"""
+        specs = [
+            QuerySpec(name="a", queries=("query a",), webhook_url="https://discord.com/a"),
+            QuerySpec(name="b", queries=("query b",), webhook_url="https://discord.com/b"),
+        ]
+        mock_load_since_id.side_effect = lambda name: {"a": "10", "b": "20"}[name]
+
+        def pages(since_id, **_kwargs):
+            tweet_id = str(int(since_id) + 1)
+            yield index_page(
+                {"data": [{"id": tweet_id, "author_id": "u"}], "includes": {"users": [{"id": "u", "username": "user"}]}}
+            )
+
+        mock_iter_tweet_pages.side_effect = pages
+
+        with patch("src.main.load_query_specs", return_value=specs):
+            result = fetch_and_forward()
+
+        assert result["status"] == "success"
+        assert result["forwarded"] == 2
+        assert set(result["queries"]) == {"a", "b"}
+        posted = {c.kwargs["webhook_url"]: c.kwargs["content"] for c in mock_discord_post.call_args_list}
+        assert posted == {
+            "https://discord.com/a": "https://x.com/user/status/11",
+            "https://discord.com/b": "https://x.com/user/status/21",
+        }
+        assert sorted(c.args for c in mock_save_since_id.call_args_list) == [("11", "a"), ("21", "b")]
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_query_failure_does_not_block_others(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """1件のクエリが失敗しても他のクエリは処理され、最後に例外が送出されるテスト"""
+        specs = [QuerySpec(name="a", queries=("query a",)), QuerySpec(name="b", queries=("query b",))]
+        mock_load_since_id.return_value = "10"
+
+        def pages(_since_id, query=None):
+            if query == "query a":
+                raise RuntimeError("X API error")
+            yield index_page(
+                {"data": [{"id": "11", "author_id": "u"}], "includes": {"users": [{"id": "u", "username": "user"}]}}
+            )
+
+        mock_iter_tweet_pages.side_effect = pages
+
+        with patch("src.main.load_query_specs", return_value=specs):
+            with pytest.raises(RuntimeError, match="X API error"):
+                fetch_and_forward()
+
+        mock_save_since_id.assert_called_once_with("11", "b")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_resumes_from_outbox(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+        tmp_path,
+    ):
+        """配信途中で失敗した場合、次回は X API を呼ばずにアウトボックスの残りだけを配信するテスト"""
+        mock_load_since_id.return_value = "100"
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "103", "author_id": "u"},
+                        {"id": "102", "author_id": "u"},
+                        {"id": "101", "author_id": "u"},
+                    ],
+                    "includes": {"users": [{"id": "u", "username": "user"}]},
+                }
+            ]
+        )
+        mock_discord_post.side_effect = [None, Exception("Discord error")]
+
+        with patch("src.main.OUTBOX_DIR", str(tmp_path)), pytest.raises(Exception, match="Discord error"):
+            fetch_and_forward()
+
+        # アウトボックスに書き出した時点で since_id は最新まで進む
+        mock_save_since_id.assert_called_once_with("103", "default")
+
+        # 次回の実行: 新しいツイートはなく、未配信の 102, 103 だけを送る
+        mock_load_since_id.return_value = "103"
+        mock_iter_tweet_pages.return_value = _pages([{"meta": {"result_count": 0}}])
+        mock_discord_post.reset_mock(side_effect=True)
+
+        with patch("src.main.OUTBOX_DIR", str(tmp_path)):
+            result = fetch_and_forward()
+
+        posted = [c.kwargs["content"] for c in mock_discord_post.call_args_list]
+        assert posted == ["https://x.com/user/status/102", "https://x.com/user/status/103"]
+        assert result["forwarded"] == 2
+        assert not (tmp_path / "outbox-default.jsonl").exists()
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_skips_delivered_ids(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id
+    ):
+        """since_id が無効になって再取得した配信済みのツイートは送らないテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages(
+            [
+                {
+                    "data": [
+                        {"id": "103", "author_id": "u"},
+                        {"id": "102", "author_id": "u"},
+                        {"id": "101", "author_id": "u"},
+                    ],
+                    "includes": {"users": [{"id": "u", "username": "user"}]},
+                }
+            ]
+        )
+
+        with (
+            patch("src.main.load_delivered_ids", return_value=["101", "102"]),
+            patch("src.main.save_delivered_ids") as mock_save_delivered_ids,
+        ):
+            result = fetch_and_forward()
+
+        mock_discord_post.assert_called_once_with(webhook_url=None, content="https://x.com/user/status/103")
+        assert result["forwarded"] == 1
+        mock_save_since_id.assert_called_once_with("103", "default")
+        mock_save_delivered_ids.assert_called_once_with(["101", "102", "103"], "default")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_all_delivered_advances_since_id(
+        self, mock_load_since_id, mock_iter_tweet_pages, mock_discord_post, mock_save_since_id
+    ):
+        """取得したツイートがすべて配信済みの場合も since_id を進めるテスト"""
+        mock_load_since_id.return_value = None
+        mock_iter_tweet_pages.return_value = _pages(
+            [{"data": [{"id": "101", "author_id": "u"}, {"id": "99", "author_id": "u"}], "includes": {}}]
+        )
+
+        with (
+            patch("src.main.load_delivered_ids", return_value=["99", "101"]),
+            patch("src.main.save_delivered_ids") as mock_save_delivered_ids,
+        ):
+            result = fetch_and_forward()
+
+        mock_discord_post.assert_not_called()
+        mock_save_delivered_ids.assert_not_called()
+        mock_save_since_id.assert_called_once_with("101", "default")
+        assert result["forwarded"] == 0
+
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_deferred_until")
+    def test_fetch_and_forward_drains_outbox_while_deferred(
+        self, mock_load_deferred_until, mock_iter_tweet_pages, mock_discord_post, tmp_path
+    ):
+        """レート制限の待機中でもアウトボックスの残りは配信するテスト"""
+        Outbox("default", directory=str(tmp_path)).put(
+            [DeliveryItem(tweet_ids=["101"], message={"content": "https://x.com/user/status/101"})]
+        )
+        mock_load_deferred_until.return_value = 9999999999
+
+        with patch("src.main.OUTBOX_DIR", str(tmp_path)):
+            result = fetch_and_forward()
+
+        assert result["status"] == "deferred"
+        assert result["forwarded"] == 1
+        mock_iter_tweet_pages.assert_not_called()
+        mock_discord_post.assert_called_once_with(webhook_url=None, content="https://x.com/user/status/101")
+
+    @patch("src.main.save_since_id")
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.load_since_id")
+    def test_fetch_and_forward_merges_split_queries(
+        self,
+        mock_load_since_id,
+        mock_iter_tweet_pages,
+        mock_discord_post,
+        mock_save_since_id,
+    ):
+        """分割されたクエリの結果をまとめ、重複したツイートは1回だけ転送するテスト"""
+        mock_load_since_id.return_value = "10"
+        results = {
+            "query 1": [{"id": "12", "author_id": "u"}, {"id": "11", "author_id": "u"}],
+            "query 2": [{"id": "13", "author_id": "u"}, {"id": "12", "author_id": "u"}],
+        }
+        mock_iter_tweet_pages.side_effect = lambda _since_id, query=None: _pages(
+            [{"data": results[query], "includes": {"users": [{"id": "u", "username": "user"}]}}]
+        )
+
+        with patch("src.main.load_query_specs", return_value=[QuerySpec(name="a", queries=("query 1", "query 2"))]):
+            result = fetch_and_forward()
+
+        posted = [c.kwargs["content"] for c in mock_discord_post.call_args_list]
+        assert posted == [f"https://x.com/user/status/{i}" for i in (11, 12, 13)]
+        assert result["forwarded"] == 3
+        mock_save_since_id.assert_called_once_with("13", "a")
+
+    @patch("src.main.discord_post")
+    @patch("src.main.iter_tweet_pages")
+    @patch("src.main.count_recent_tweets", return_value=0)
+    @patch("src.main.load_since_id", return_value="123")
+    def test_fetch_and_forward_counts_precheck_skips_search(
+        self, mock_load_since_id, mock_count, mock_iter_tweet_pages, mock_discord_post
+    ):
+        """件数APIで新しいツイートが0件なら検索しないテスト"""
+        with patch("src.main.X_COUNTS_PRECHECK", True):
+            result = fetch_and_forward()
+
+        mock_load_since_id.assert_called_once_with("default")
+        mock_count.assert_called_once_with("test query", "123")
+        mock_iter_tweet_pages.assert_not_called()
+        mock_discord_post.assert_not_called()
+        assert result["forwarded"] == 0
+
+    @patch("src.main.iter_tweet_pages", return_value=iter([]))
+    @patch("src.main.count_recent_tweets", return_value=150)
+    @patch("src.main.load_since_id", return_value="123")
+    def test_fetch_and_forward_counts_precheck_plans_pages(self, mock_load_since_id, mock_count, mock_iter_tweet_pages):
+        """件数から取得するページ数を決めるテスト（確認後に増えた分の1ページを含む）"""
+        with patch("src.main.X_COUNTS_PRECHECK", True), patch("src.main.X_MAX_PAGES", 10):
+            fetch_and_forward()
+
+        mock_load_since_id.assert_called_once_with("default")
+        mock_count.assert_called_once_with("test query", "123")
+        mock_iter_tweet_pages.assert_called_once_with("123", query="test query", max_pages=3)
 
     @patch("src.main.fetch_and_forward")
     @patch("src.main.validate_env_vars")
@@ -168,3 +766,185 @@ class TestMain:
         assert exc_info.value.code == 1
         mock_validate_env_vars.assert_called_once()
         mock_fetch_and_forward.assert_called_once()
+
+    @patch("src.main.fetch_and_forward")
+    @patch("src.main.validate_env_vars")
+    def test_run_bot_success(self, mock_validate_env_vars, mock_fetch_and_forward):
+        """run_botが実行結果を返すテスト"""
+        mock_validate_env_vars.return_value = True
+        mock_fetch_and_forward.return_value = {"status": "success", "forwarded": 1}
+
+        assert run_bot() == {"status": "success", "forwarded": 1}
+
+    @patch("src.main.fetch_and_forward")
+    @patch("src.main.validate_env_vars")
+    def test_run_bot_env_validation_failure(self, mock_validate_env_vars, mock_fetch_and_forward):
+        """run_botは環境変数の検証失敗時にプロセスを終了せず例外を送出するテスト"""
+        mock_validate_env_vars.return_value = False
+
+        with pytest.raises(RuntimeError):
+            run_bot()
+
+        mock_fetch_and_forward.assert_not_called()
+
+
+def _stream_event(tweet_id, *tags):
+    return {
+        "data": {"id": tweet_id, "author_id": "1", "text": f"tweet {tweet_id}"},
+        "includes": {"users": [{"id": "1", "username": "user1"}]},
+        "matching_rules": [{"id": f"r-{tag}", "tag": tag} for tag in tags],
+    }
+
+
+class TestStreamAndForward:
+    """ストリームモードのテスト"""
+
+    def setup_method(self):
+        self.specs = [
+            QuerySpec(name="asai", queries=("#浅井恋乃未",), webhook_url="https://discord.test/asai"),
+            QuerySpec(name="official", queries=("from:sakurazaka46",), webhook_url="https://discord.test/official"),
+        ]
+        for patcher in (
+            patch("src.main.load_query_specs", return_value=self.specs),
+            patch("src.main.OUTBOX_DIR", ""),
+            patch("src.main.load_delivered_ids", return_value=[]),
+            patch("src.main.save_delivered_ids"),
+            patch("src.main.STREAM_BATCH_WAIT", 0),
+            patch("src.main.STREAM_CATCH_UP", False),
+        ):
+            patcher.start()
+        self.sync_rules = patch("src.main.sync_rules").start()
+        self.load_since_id = patch("src.main.load_since_id", return_value="100").start()
+        self.save_since_id = patch("src.main.save_since_id").start()
+        self.load_backfill = patch("src.main.load_backfill", return_value=None).start()
+        self.save_backfill = patch("src.main.save_backfill").start()
+
+    def teardown_method(self):
+        patch.stopall()
+
+    def _run(self, events, connects=0):
+        def fake_run_stream(on_event, _stop_event, on_connect=None):
+            for _ in range(connects):
+                on_connect()
+            for event in events:
+                on_event(event)
+
+        with patch("src.main.run_stream", side_effect=fake_run_stream):
+            stream_and_forward()
+
+    @patch("src.main.discord_post")
+    def test_routes_tweets_by_rule_tag(self, mock_discord_post):
+        """ルールのタグ（クエリ名）ごとの転送先に、古い順に配信する"""
+        self._run([_stream_event("102", "asai"), _stream_event("101", "asai", "official")])
+
+        self.sync_rules.assert_called_once_with(
+            [{"value": "#浅井恋乃未", "tag": "asai"}, {"value": "from:sakurazaka46", "tag": "official"}]
+        )
+        posts = {}
+        for call in mock_discord_post.call_args_list:
+            posts.setdefault(call.kwargs["webhook_url"], []).append(call.kwargs["content"])
+        assert posts == {
+            "https://discord.test/asai": ["https://x.com/user1/status/101", "https://x.com/user1/status/102"],
+            "https://discord.test/official": ["https://x.com/user1/status/101"],
+        }
+        # ポーリングに戻したときに再取得しないよう since_id を進める
+        self.save_since_id.assert_any_call("102", "asai")
+        self.save_since_id.assert_any_call("101", "official")
+
+    @patch("src.main.discord_post")
+    def test_skips_delivered_and_unknown_tags(self, mock_discord_post):
+        """配信済みのツイートと、監視クエリにないタグのツイートは転送しない"""
+        with patch("src.main.load_delivered_ids", return_value=["101"]):
+            self._run([_stream_event("101", "asai"), _stream_event("102", "removed")])
+
+        mock_discord_post.assert_not_called()
+
+    @patch("src.main.discord_post")
+    def test_delivery_failure_keeps_streaming(self, mock_discord_post):
+        """配信に失敗しても、後から受け取ったツイートは転送する"""
+        mock_discord_post.side_effect = [Exception("discord down"), None]
+        with patch("src.main.STREAM_BATCH_MAX", 1):
+            self._run([_stream_event("101", "asai"), _stream_event("102", "asai")])
+
+        assert mock_discord_post.call_count == 2
+        self.save_since_id.assert_called_once_with("102", "asai")
+
+    @patch("src.main.fetch_and_forward")
+    def test_catch_up_on_connect(self, mock_fetch_and_forward):
+        """接続するたびに、切断中のツイートを search/recent で取得する"""
+        with patch("src.main.STREAM_CATCH_UP", True):
+            self._run([], connects=2)
+
+        assert mock_fetch_and_forward.call_count == 2
+
+    @patch("src.main.discord_post")
+    def test_waits_for_polling_delivery(self, mock_discord_post):
+        """同じクエリのポーリング（POST・スケジューラー・キャッチアップ）の配信中は、ストリームの配信を待たせる"""
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def polling(_spec):
+            order.append("polling")
+            started.set()
+            release.wait(5)
+            order.append("polling done")
+            return {"status": "success", "forwarded": 0}
+
+        mock_discord_post.side_effect = lambda **_kwargs: order.append("stream")
+        with patch("src.main._forward_query", side_effect=polling):
+            poller = threading.Thread(target=forward_query, args=(self.specs[0],))
+            poller.start()
+            assert started.wait(5)
+            streamer = threading.Thread(target=self._run, args=([_stream_event("101", "asai")],))
+            streamer.start()
+            streamer.join(0.2)
+            assert streamer.is_alive()
+            release.set()
+            poller.join(5)
+            streamer.join(5)
+
+        assert order == ["polling", "polling done", "stream"]
+
+    @patch("src.main.discord_post")
+    def test_catch_up_success_advances_since_id(self, mock_discord_post):
+        """切断中のツイートを取得し終えていれば、ストリームのツイートで since_id を進める"""
+        queries = {spec.name: {"status": "success", "forwarded": 0} for spec in self.specs}
+        with (
+            patch("src.main.STREAM_CATCH_UP", True),
+            patch("src.main.fetch_and_forward", return_value={"status": "success", "queries": queries}),
+        ):
+            self._run([_stream_event("102", "asai")], connects=1)
+
+        self.save_since_id.assert_called_once_with("102", "asai")
+        self.save_backfill.assert_not_called()
+
+    @patch("src.main.discord_post")
+    def test_catch_up_failure_records_gap(self, mock_discord_post):
+        """切断中のツイートの取得に失敗した場合は、取得しなかった範囲を保存してから since_id を進める"""
+        with (
+            patch("src.main.STREAM_CATCH_UP", True),
+            patch("src.main.fetch_and_forward", side_effect=RuntimeError("X API error")),
+            patch("src.main.STREAM_BATCH_MAX", 1),
+        ):
+            self._run([_stream_event("105", "asai"), _stream_event("106", "asai")], connects=1)
+
+        self.save_backfill.assert_called_once_with({"since_id": "100", "until_id": "105"}, "asai")
+        assert [c.args for c in self.save_since_id.call_args_list] == [("105", "asai"), ("106", "asai")]
+
+    @patch("src.main.discord_post")
+    def test_catch_up_deferred_keeps_since_id(self, mock_discord_post):
+        """延期して取得していない場合に別の未取得の範囲があれば、since_id を進めない"""
+        result = {"status": "deferred", "forwarded": 0, "deferred_until": 2**40}
+        self.load_backfill.return_value = {"since_id": "50", "until_id": "60"}
+        with (
+            patch("src.main.STREAM_CATCH_UP", True),
+            patch("src.main.fetch_and_forward", return_value=result) as mock_fetch_and_forward,
+        ):
+            self._run([_stream_event("105", "asai")], connects=1)
+
+        mock_discord_post.assert_called_once()
+        self.save_since_id.assert_not_called()
+        self.save_backfill.assert_not_called()
+        # 再開時刻までは取得し直さない
+        mock_fetch_and_forward.assert_called_once()
@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import responses
+
+sys.path.append("src")
+
+from src.discord_client import discord_post
+from src.media_cache import UPLOADED_URL_TTL, MediaCache, attach, fetch, image_urls, metrics, record_uploads
+
+PHOTO_URL = "https://pbs.twimg.com/media/photo.jpg"
+WEBHOOK = "https://discord.com/api/webhooks/1/token"
+
+
+def _embed(url=PHOTO_URL):
+    return {"url": "https://x.com/user/status/1", "description": "photo", "image": {"url": url}}
+
+
+class TestMediaCache:
+    """MediaCacheのテスト"""
+
+    def test_store_is_content_addressed(self, tmp_path):
+        """同じ内容は別のURLでも1ファイルにまとめて保存する"""
+        cache = MediaCache(str(tmp_path), max_bytes=1000, max_age=3600)
+        first = cache.store(PHOTO_URL, b"image", "image/jpeg", now=100)
+        second = cache.store("https://pbs.twimg.com/media/repost.jpg", b"image", "image/jpeg", now=100)
+
+        assert first["file"] == second["file"]
+        assert first["file"].endswith(".jpg")
+        assert cache.size == 5
+        assert cache.lookup(PHOTO_URL, now=200)["file"] == first["file"]
+        assert cache.lookup("https://pbs.twimg.com/media/unknown.jpg") is None
+
+    def test_index_survives_restart(self, tmp_path):
+        """索引をディスクに保存し、次のプロセスでも使う"""
+        MediaCache(str(tmp_path)).store(PHOTO_URL, b"image", "image/jpeg")
+        assert MediaCache(str(tmp_path)).lookup(PHOTO_URL) is not None
+
+    def test_evict_expired_and_least_recently_used(self, tmp_path):
+        """古いファイルを削除し、上限を超えたら使われていない順に削除する"""
+        cache = MediaCache(str(tmp_path), max_bytes=10, max_age=1000)
+        cache.store("https://a", b"aaaa", "image/png", now=100)
+        cache.store("https://b", b"bbbb", "image/png", now=200)
+        # a を使ったので、次に削除されるのは b
+        assert cache.lookup("https://a", now=300) is not None
+        cache.store("https://c", b"cccc", "image/png", now=400)
+
+        assert cache.lookup("https://b", now=400) is None
+        assert cache.lookup("https://a", now=400) is not None
+        assert cache.size == 8
+
+        # 保持期間を過ぎたファイルは使わず、次の整理で削除する
+        assert cache.lookup("https://a", now=1500) is None
+        cache.evict(now=1500)
+        assert cache.size == 0
+        assert os.listdir(tmp_path) == ["index.json"]
+
+    def test_uploaded_url_shared_by_same_content(self, tmp_path):
+        """アップロードした URL は同じ内容のメディアで使い回し、期限が過ぎたら使わない"""
+        cache = MediaCache(str(tmp_path))
+        entry = cache.store(PHOTO_URL, b"image", "image/jpeg")
+        cache.store("https://pbs.twimg.com/media/repost.jpg", b"image", "image/jpeg")
+        cache.record_upload(entry["file"], "https://cdn.discordapp.com/attachments/1/2/x.jpg", now=100)
+
+        assert cache.uploaded_url("https://pbs.twimg.com/media/repost.jpg", now=200).startswith("https://cdn")
+        assert cache.uploaded_url(PHOTO_URL, now=100 + UPLOADED_URL_TTL) is None
+
+
+class TestMediaPipeline:
+    """メディアの取得・添付のテスト"""
+
+    @responses.activate
+    def test_fetch_downloads_once(self, tmp_path):
+        """同じURLは1回だけダウンロードし、以降はキャッシュから返す"""
+        responses.add(responses.GET, PHOTO_URL, body=b"image", content_type="image/jpeg")
+        cache = MediaCache(str(tmp_path))
+
+        entries = [fetch(PHOTO_URL, cache).result() for _ in range(3)]
+
+        assert len(responses.calls) == 1
+        assert {entry["file"] for entry in entries} == {entries[0]["file"]}
+
+    @responses.activate
+    def test_fetch_failure_keeps_remote_url(self, tmp_path):
+        """取得できない・大きすぎるメディアは添付せずに元のURLのままにする"""
+        responses.add(responses.GET, PHOTO_URL, status=404)
+        responses.add(responses.GET, "https://pbs.twimg.com/media/large.jpg", body=b"x" * 20)
+        cache = MediaCache(str(tmp_path))
+        errors = metrics.media_fetches.value(result="error")
+        embeds = [_embed(), _embed("https://pbs.twimg.com/media/large.jpg")]
+
+        with patch("src.media_cache.MEDIA_MAX_BYTES", 10):
+            assert attach(embeds, cache) == []
+
+        assert [embed["image"]["url"] for embed in embeds] == [PHOTO_URL, "https://pbs.twimg.com/media/large.jpg"]
+        assert metrics.media_fetches.value(result="error") == errors + 1
+
+    @responses.activate
+    def test_attach_deduplicates_files(self, tmp_path):
+        """同じ画像の embed は1ファイルの添付を参照し、アップロード済みの画像は Discord のURLを使う"""
+        responses.add(responses.GET, PHOTO_URL, body=b"image", content_type="image/jpeg")
+        cache = MediaCache(str(tmp_path))
+        embeds = [_embed(), _embed()]
+
+        files = attach(embeds, cache)
+
+        assert len(files) == 1
+        filename, content, content_type = files[0]
+        assert (content, content_type) == (b"image", "image/jpeg")
+        assert [embed["image"]["url"] for embed in embeds] == [f"attachment://{filename}"] * 2
+
+        record_uploads({"attachments": [{"filename": filename, "url": "https://cdn.discordapp.com/x.jpg"}]}, cache)
+        embeds = [_embed()]
+        assert attach(embeds, cache) == []
+        assert embeds[0]["image"]["url"] == "https://cdn.discordapp.com/x.jpg"
+
+    def test_image_urls(self):
+        """discord_post の引数から embed の画像URLを取り出す"""
+        assert image_urls({"embed": _embed()}) == [PHOTO_URL]
+        assert image_urls({"embeds": [_embed(), {"url": "u"}]}) == [PHOTO_URL]
+        assert image_urls({"content": "https://x.com/user/status/1"}) == []
+
+    @responses.activate
+    def test_discord_post_uploads_then_reuses(self, tmp_path):
+        """画像を multipart で添付して投稿し、同じ画像の次の投稿は Discord のURLを参照する"""
+        responses.add(responses.GET, PHOTO_URL, body=b"image", content_type="image/jpeg")
+        cache = MediaCache(str(tmp_path))
+        filename = fetch(PHOTO_URL, cache).result()["file"]
+        responses.add(
+            responses.POST,
+            f"{WEBHOOK}?wait=true",
+            json={"id": "m1", "attachments": [{"filename": filename, "url": "https://cdn.discordapp.com/x.jpg"}]},
+        )
+        responses.add(responses.POST, WEBHOOK, status=204)
+        responses.calls.reset()
+        embed = _embed()
+
+        with patch("src.discord_client.media_cache.get_cache", return_value=cache):
+            discord_post(embed=embed, webhook_url=WEBHOOK)
+            discord_post(embed=embed, webhook_url=WEBHOOK)
+
+        first, second = responses.calls
+        assert first.request.url == f"{WEBHOOK}?wait=true"
+        body = first.request.body
+        assert b'name="files[0]"' in body
+        assert f'"url": "attachment://{filename}"'.encode() in body
+        assert f'"attachments": [{{"id": 0, "filename": "{filename}"}}]'.encode() in body
+        # 呼び出し元の embed（アウトボックスに残る）は元のURLのまま
+        assert embed["image"]["url"] == PHOTO_URL
+
+        assert second.request.url == WEBHOOK
+        assert json.loads(second.request.body)["embeds"][0]["image"]["url"] == "https://cdn.discordapp.com/x.jpg"
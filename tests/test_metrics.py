@@ -0,0 +1,86 @@
+import sys
+
+import pytest
+
+sys.path.append("src")
+
+from src.metrics import Counter, Histogram, _registry, track
+
+
+@pytest.fixture(autouse=True)
+def _isolated_registry():
+    """テストで作ったメトリクスをレジストリに残さない"""
+    registered = list(_registry)
+    yield
+    _registry[:] = registered
+
+
+class TestMetrics:
+    """metricsモジュールのテスト"""
+
+    def test_counter(self):
+        """ラベルごとに加算し、テキスト形式で出力するテスト"""
+        counter = Counter("test_requests_total", "テスト用", ["status"])
+        counter.inc(status=200)
+        counter.inc(2, status=200)
+        counter.inc(status=429)
+
+        assert counter.value(status=200) == 3
+        assert counter.value(status=500) == 0
+        assert counter.render().splitlines() == [
+            "# HELP asai_x_bot_test_requests_total テスト用",
+            "# TYPE asai_x_bot_test_requests_total counter",
+            'asai_x_bot_test_requests_total{status="200"} 3',
+            'asai_x_bot_test_requests_total{status="429"} 1',
+        ]
+
+    def test_counter_invalid_labels(self):
+        """定義と異なるラベルを指定した場合に例外が発生するテスト"""
+        counter = Counter("test_labels_total", "テスト用", ["status"])
+        with pytest.raises(ValueError, match="ラベル"):
+            counter.inc(code=200)
+
+    def test_label_escape(self):
+        """ラベル値の特殊文字をエスケープするテスト"""
+        counter = Counter("test_escape_total", "テスト用", ["query"])
+        counter.inc(query='a"b\\c')
+        assert 'asai_x_bot_test_escape_total{query="a\\"b\\\\c"} 1' in counter.render()
+
+    def test_histogram(self):
+        """累積バケット・合計・件数を出力するテスト"""
+        histogram = Histogram("test_seconds", "テスト用", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(3)
+
+        assert histogram.count() == 3
+        assert histogram.render().splitlines()[2:] == [
+            'asai_x_bot_test_seconds_bucket{le="0.1"} 1',
+            'asai_x_bot_test_seconds_bucket{le="1"} 2',
+            'asai_x_bot_test_seconds_bucket{le="+Inf"} 3',
+            "asai_x_bot_test_seconds_sum 3.55",
+            "asai_x_bot_test_seconds_count 3",
+        ]
+
+    def test_histogram_time(self):
+        """ブロックの所要時間を記録するテスト（例外時も記録）"""
+        histogram = Histogram("test_time_seconds", "テスト用", ["operation"])
+        with histogram.time(operation="read"):
+            pass
+        with pytest.raises(RuntimeError), histogram.time(operation="read"):
+            raise RuntimeError("failed")
+
+        assert histogram.count(operation="read") == 2
+
+    def test_track(self):
+        """所要時間と結果（ok / error）を記録するテスト"""
+        counter = Counter("test_track_total", "テスト用", ["operation", "result"])
+        histogram = Histogram("test_track_seconds", "テスト用", ["operation"])
+        with track(counter, histogram, operation="write"):
+            pass
+        with pytest.raises(RuntimeError), track(counter, histogram, operation="write"):
+            raise RuntimeError("failed")
+
+        assert counter.value(operation="write", result="ok") == 1
+        assert counter.value(operation="write", result="error") == 1
+        assert histogram.count(operation="write") == 2
@@ -0,0 +1,62 @@
+import sys
+
+sys.path.append("src")
+
+from src.outbox import DeliveryItem, Outbox
+
+
+def _items(ids):
+    return [DeliveryItem(tweet_ids=[i], message={"content": f"url/{i}"}, label=f"@user{i}") for i in ids]
+
+
+class TestOutbox:
+    """outboxモジュールのテスト"""
+
+    def test_pending_empty(self, tmp_path):
+        """ログがない場合は未配信分がないテスト"""
+        assert Outbox("default", directory=str(tmp_path)).pending() == []
+
+    def test_put_and_pending(self, tmp_path):
+        """書き出した配信単位を古い順に復元するテスト"""
+        outbox = Outbox("default", directory=str(tmp_path))
+        outbox.put(_items(["1", "2"]))
+
+        # 別のインスタンス（次回の実行）からも同じ内容が読める
+        assert Outbox("default", directory=str(tmp_path)).pending() == _items(["1", "2"])
+
+    def test_ack_removes_delivered(self, tmp_path):
+        """配信完了を記録した配信単位は未配信分に含まれないテスト"""
+        outbox = Outbox("default", directory=str(tmp_path))
+        items = _items(["1", "2", "3"])
+        outbox.put(items)
+        outbox.ack(items[0])
+        outbox.ack(items[2])
+
+        assert outbox.pending() == _items(["2"])
+
+    def test_clear(self, tmp_path):
+        """すべて配信済みになったログを削除するテスト"""
+        outbox = Outbox("default", directory=str(tmp_path))
+        outbox.put(_items(["1"]))
+        outbox.clear()
+        outbox.clear()
+
+        assert not (tmp_path / "outbox-default.jsonl").exists()
+        assert outbox.pending() == []
+
+    def test_pending_ignores_torn_line(self, tmp_path):
+        """書き込み途中で壊れた行を無視して書き直すテスト"""
+        outbox = Outbox("default", directory=str(tmp_path))
+        outbox.put(_items(["1", "2"]))
+        with open(outbox.path, "a", encoding="utf-8") as f:
+            f.write('{"op":"ack","id"')
+
+        assert outbox.pending() == _items(["1", "2"])
+        # 書き直した後は追記しても正しく読める
+        outbox.ack(_items(["1"])[0])
+        assert outbox.pending() == _items(["2"])
+
+    def test_outboxes_are_per_query(self, tmp_path):
+        """クエリごとに別のログを使うテスト"""
+        Outbox("a", directory=str(tmp_path)).put(_items(["1"]))
+        assert Outbox("b", directory=str(tmp_path)).pending() == []
@@ -0,0 +1,94 @@
+import json
+import sys
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append("src")
+
+from src.queries import QuerySpec, load_query_specs
+
+
+class TestQueries:
+    """queriesモジュールのテスト"""
+
+    def test_load_query_specs_default(self):
+        """QUERIES未設定時はQUERYの1件のみを返すテスト"""
+        with (
+            patch("src.queries.QUERIES", None),
+            patch("src.queries.QUERIES_FILE", None),
+            patch("src.queries.QUERY", "#test"),
+            patch("src.queries.WEBHOOK_URL", "https://discord.com/webhook"),
+        ):
+            specs = load_query_specs()
+
+        assert specs == [QuerySpec(name="default", queries=("#test",), webhook_url="https://discord.com/webhook")]
+
+    def test_load_query_specs_from_json(self):
+        """QUERIESのJSONから複数クエリを読み込み、webhook_url省略時は既定値を使うテスト"""
+        queries = [
+            {"name": "asai", "query": "#浅井恋乃未", "webhook_url": "https://discord.com/a"},
+            {"name": "official", "query": "from:sakurazaka46"},
+        ]
+        with (
+            patch("src.queries.QUERIES", json.dumps(queries)),
+            patch("src.queries.WEBHOOK_URL", "https://discord.com/default"),
+        ):
+            specs = load_query_specs()
+
+        assert specs == [
+            QuerySpec(name="asai", queries=("#浅井恋乃未",), webhook_url="https://discord.com/a"),
+            QuerySpec(name="official", queries=("from:sakurazaka46",), webhook_url="https://discord.com/default"),
+        ]
+
+    def test_load_query_specs_structured(self):
+        """構造化されたクエリ設定からクエリを組み立てるテスト"""
+        queries = [{"name": "asai", "hashtags": ["浅井恋乃未"], "accounts": ["sakurazaka46", "anan_mag"]}]
+        with (
+            patch("src.queries.QUERIES", json.dumps(queries)),
+            patch("src.queries.WEBHOOK_URL", "https://discord.com/default"),
+        ):
+            specs = load_query_specs()
+
+        assert specs[0].queries == ("#浅井恋乃未 (from:sakurazaka46 OR from:anan_mag)",)
+
+    def test_load_query_specs_from_file(self, tmp_path):
+        """QUERIES_FILEからクエリを読み込むテスト"""
+        path = tmp_path / "queries.json"
+        path.write_text(json.dumps([{"name": "a", "query": "q", "webhook_url": "https://discord.com/a"}]))
+
+        with (
+            patch("src.queries.QUERIES", None),
+            patch("src.queries.QUERIES_FILE", str(path)),
+        ):
+            specs = load_query_specs()
+
+        assert [spec.name for spec in specs] == ["a"]
+
+    @pytest.mark.parametrize(
+        "queries",
+        [
+            [],
+            {"name": "a", "query": "q"},
+            [{"name": "bad name", "query": "q"}],
+            [{"name": "a", "query": "q"}, {"name": "a", "query": "q2"}],
+            [{"name": "a"}],
+        ],
+    )
+    def test_load_query_specs_invalid(self, queries):
+        """不正なクエリ設定で例外が発生するテスト"""
+        with (
+            patch("src.queries.QUERIES", json.dumps(queries)),
+            patch("src.queries.WEBHOOK_URL", "https://discord.com/default"),
+        ):
+            with pytest.raises(ValueError, match="QUERIES|クエリ"):
+                load_query_specs()
+
+    def test_load_query_specs_missing_webhook(self):
+        """webhook_urlも既定値もない場合に例外が発生するテスト"""
+        with (
+            patch("src.queries.QUERIES", json.dumps([{"name": "a", "query": "q"}])),
+            patch("src.queries.WEBHOOK_URL", None),
+        ):
+            with pytest.raises(ValueError, match="QUERIES|クエリ"):
+                load_query_specs()
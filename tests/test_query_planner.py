@@ -0,0 +1,71 @@
+import sys
+
+import pytest
+
+sys.path.append("src")
+
+from src.query_planner import plan_queries
+
+ACCOUNTS = ["sakurazaka46", "sakura_joqr", "anan_mag", "Lemino_official", "BLTTV", "shonen_sunday"]
+
+
+class TestQueryPlanner:
+    """query_plannerモジュールのテスト"""
+
+    def test_plan_single_query(self):
+        """上限に収まる場合は1件のクエリを組み立てるテスト"""
+        queries = plan_queries(hashtags=["浅井恋乃未"], accounts=["@sakurazaka46", "sakura_joqr"], max_length=512)
+        assert queries == ["#浅井恋乃未 (from:sakurazaka46 OR from:sakura_joqr)"]
+
+    def test_plan_keywords_and_filters(self):
+        """キーワードとフィルタを含むクエリを組み立てるテスト"""
+        queries = plan_queries(keywords=["浅井 恋乃未", "このみん"], filters=["-is:retweet"], max_length=512)
+        assert queries == ['("浅井 恋乃未" OR このみん) -is:retweet']
+
+    def test_plan_deduplicates_terms(self):
+        """重複した条件を1つにまとめるテスト"""
+        assert plan_queries(accounts=["a", "@a", "b"], max_length=512) == ["(from:a OR from:b)"]
+
+    def test_plan_splits_under_limit(self):
+        """上限を超える場合はすべてのクエリが上限内に収まるように分割するテスト"""
+        queries = plan_queries(hashtags=["浅井恋乃未"], accounts=ACCOUNTS, filters=["-is:retweet"], max_length=80)
+
+        assert len(queries) > 1
+        assert all(len(q) <= 80 for q in queries)
+        assert all(q.startswith("#浅井恋乃未 ") and q.endswith(" -is:retweet") for q in queries)
+        planned_accounts = sorted(term.strip("()") for q in queries for term in q.split() if "from:" in term)
+        assert planned_accounts == sorted(f"from:{a}" for a in ACCOUNTS)
+
+    def test_plan_uses_minimum_number_of_queries(self):
+        """同じ長さの条件を必要最小限のクエリ数に詰めるテスト"""
+        accounts = [f"user{i:02d}" for i in range(20)]  # "from:userNN" は11文字
+        # 1クエリに5件: "(" + 11*5 + " OR "*4 + ")" = 73文字
+        queries = plan_queries(accounts=accounts, max_length=73)
+
+        assert len(queries) == 4
+        assert all(len(q) <= 73 for q in queries)
+
+    def test_plan_splits_several_categories(self):
+        """残りのカテゴリだけで上限に近い場合は複数のカテゴリを分割し、すべての組み合わせをクエリにするテスト"""
+        hashtags = ["a" * 49, "b" * 49]  # "(#aaa... OR #bbb...)" は106文字
+        accounts = ["c" * 45, "d" * 45]  # "(from:ccc... OR from:ddd...)" も106文字
+        queries = plan_queries(hashtags=hashtags, accounts=accounts, max_length=120)
+
+        assert len(queries) == 4
+        assert all(len(q) <= 120 for q in queries)
+        assert sorted(queries) == sorted(f"#{h} from:{a}" for h in hashtags for a in accounts)
+
+    def test_plan_requires_terms(self):
+        """条件が空の場合に例外が発生するテスト"""
+        with pytest.raises(ValueError, match="いずれか"):
+            plan_queries()
+
+    def test_plan_term_too_long(self):
+        """1件の条件だけで上限を超える場合に例外が発生するテスト"""
+        with pytest.raises(ValueError, match="上限"):
+            plan_queries(accounts=["a" * 50, "b"], max_length=20)
+
+    def test_plan_combination_too_long(self):
+        """各カテゴリの最も長い条件の組み合わせが上限を超える場合は、その組み合わせを示して例外が発生するテスト"""
+        with pytest.raises(ValueError, match=f"#{'a' * 49} from:{'c' * 45} だけで"):
+            plan_queries(hashtags=["a" * 49, "b"], accounts=["c" * 45, "d"], max_length=90)
@@ -0,0 +1,147 @@
+import datetime
+import sys
+
+sys.path.append("src")
+
+from src.quota import REASON_BUDGET, REASON_RATE_LIMIT, QuotaManager, TokenBucket, month_of, next_month_start
+
+# 2026-10-18 00:00:00 UTC
+NOW = datetime.datetime(2026, 10, 18, tzinfo=datetime.UTC).timestamp()
+
+
+def _manager(**kwargs):
+    options = {"rate_limit": 10, "window": 100, "monthly_budget": 0, "low_watermark": 0.1, "now": NOW}
+    options.update(kwargs)
+    return QuotaManager(**options)
+
+
+class TestTokenBucket:
+    """TokenBucketのテスト"""
+
+    def test_acquire_and_refill(self):
+        """トークンを使い切ると補充されるまでの秒数を返し、時間の経過で補充される"""
+        bucket = TokenBucket(capacity=2, refill_per_sec=0.5, updated_at=0)
+        assert bucket.try_acquire(0) == 0
+        assert bucket.try_acquire(0) == 0
+        assert bucket.try_acquire(0) == 2
+        assert bucket.try_acquire(2) == 0
+
+    def test_refill_is_capped(self):
+        """容量を超えて補充しない"""
+        bucket = TokenBucket(capacity=2, refill_per_sec=1, tokens=0, updated_at=0)
+        bucket.refill(100)
+        assert bucket.tokens == 2
+
+
+class TestMonth:
+    """月の計算のテスト"""
+
+    def test_month_of(self):
+        assert month_of(NOW) == "2026-10"
+
+    def test_next_month_start(self):
+        """翌月（12月の場合は翌年1月）の1日 0時"""
+        assert next_month_start(NOW) == datetime.datetime(2026, 11, 1, tzinfo=datetime.UTC).timestamp()
+        december = datetime.datetime(2026, 12, 31, 23, tzinfo=datetime.UTC).timestamp()
+        assert next_month_start(december) == datetime.datetime(2027, 1, 1, tzinfo=datetime.UTC).timestamp()
+
+
+class TestQuotaManager:
+    """QuotaManagerのテスト"""
+
+    def test_token_bucket_gates_calls(self):
+        """呼び出し枠を使い切ると、補充される時刻まで呼び出せない"""
+        manager = _manager(rate_limit=2, window=100)
+        assert manager.acquire(now=NOW) is None
+        assert manager.acquire(now=NOW) is None
+        reason, reset_at = manager.acquire(now=NOW)
+        assert reason == REASON_RATE_LIMIT
+        assert reset_at == int(NOW + 50) + 1
+        assert manager.acquire(now=NOW + 50) is None
+
+    def test_server_remaining_zero_blocks_until_reset(self):
+        """サーバーの残り回数が0ならリセット時刻まで止め、リセット後は満タンに戻す"""
+        manager = _manager()
+        manager.record_response(remaining=0, reset_at=NOW + 600, now=NOW)
+        assert manager.acquire(now=NOW + 1) == (REASON_RATE_LIMIT, int(NOW + 600) + 1)
+        assert manager.acquire(now=NOW + 600) is None
+        assert manager.bucket.tokens == 9
+
+    def test_server_remaining_lowers_tokens(self):
+        """サーバーの残り回数がバケットより少なければ合わせる"""
+        manager = _manager()
+        manager.record_response(remaining=3, reset_at=NOW + 600, now=NOW)
+        assert manager.bucket.tokens == 3
+        manager.record_response(remaining=None, reset_at=None, now=NOW)
+        assert manager.bucket.tokens == 3
+
+    def test_monthly_budget(self):
+        """予算を使い切ると翌月まで呼び出せず、月が変わると戻る"""
+        manager = _manager(monthly_budget=100)
+        manager.record_tweets(100, now=NOW)
+        assert manager.tweet_allowance(now=NOW) == 0
+        assert manager.acquire(now=NOW) == (REASON_BUDGET, next_month_start(NOW))
+
+        next_month = next_month_start(NOW) + 1
+        assert manager.tweet_allowance(now=next_month) == 100
+        assert manager.acquire(now=next_month) is None
+
+    def test_unlimited_budget(self):
+        """予算が0の場合は無制限"""
+        manager = _manager(monthly_budget=0)
+        manager.record_tweets(10**9, now=NOW)
+        assert manager.tweet_allowance(now=NOW) is None
+        assert manager.page_limit(10, now=NOW) == 10
+
+    def test_page_limit_near_exhaustion(self):
+        """予算の残りが low_watermark を下回ると1ページに抑える"""
+        manager = _manager(monthly_budget=1000)
+        manager.record_tweets(850, now=NOW)
+        assert manager.page_limit(10, now=NOW) == 10
+        manager.record_tweets(60, now=NOW)
+        assert manager.page_limit(10, now=NOW) == 1
+
+    def test_restore_takes_the_more_conservative_state(self):
+        """保存された状態とプロセス内の状態のうち、残りが少ない方に合わせる"""
+        manager = _manager(monthly_budget=1000)
+        manager.record_tweets(10, now=NOW)
+        other = _manager(monthly_budget=1000)
+        other.record_tweets(500, now=NOW)
+        for _ in range(8):
+            other.acquire(now=NOW)
+        other.record_response(remaining=0, reset_at=NOW + 300, now=NOW)
+
+        manager.restore(other.to_dict(), now=NOW)
+        assert manager.tweet_allowance(now=NOW) == 500
+        assert manager.bucket.tokens == 0
+        assert manager.blocked_until == NOW + 300
+
+        # 自分の方が使っている場合は自分の状態を保つ
+        manager.restore(_manager(monthly_budget=1000).to_dict(), now=NOW)
+        assert manager.tweet_allowance(now=NOW) == 500
+
+    def test_restore_ignores_previous_month(self):
+        """前の月の読み取り数は引き継がない"""
+        manager = _manager(monthly_budget=1000)
+        manager.restore({"month": "2026-09", "tweets_read": 900, "tokens": 10, "updated_at": NOW}, now=NOW)
+        assert manager.tweet_allowance(now=NOW) == 1000
+        manager.restore({}, now=NOW)
+        assert manager.tweet_allowance(now=NOW) == 1000
+
+    def test_changes_count_only_persistent_state(self):
+        """再開時刻・月・予算がある場合の読み取り数の変化のみ数える（呼び出し枠の消費・補充・取り込みは数えない）"""
+        manager = _manager()
+        manager.restore({"tokens": 5, "updated_at": NOW - 100, "month": month_of(NOW)}, now=NOW + 10)
+        manager.acquire(now=NOW + 10)
+        manager.record_tweets(3, now=NOW + 10)
+        manager.record_response(remaining=3, reset_at=NOW + 100, now=NOW + 10)
+        assert manager.changes == 0
+
+        manager.record_response(remaining=0, reset_at=NOW + 100, now=NOW + 10)
+        manager.acquire(now=NOW + 200)
+        assert manager.changes == 2
+
+        budgeted = _manager(monthly_budget=1000)
+        budgeted.record_tweets(3, now=NOW)
+        budgeted.tweet_allowance(now=NOW + 40 * 86400)
+        assert budgeted.changes == 2
@@ -0,0 +1,118 @@
+import sys
+import threading
+
+sys.path.append("src")
+
+from src.scheduler import AdaptiveScheduler, run_scheduler
+from src.x_api_client import RateLimitStatus
+
+
+def _scheduler(**kwargs):
+    options = {"min_interval": 60, "max_interval": 3600, "target_tweets": 5, "rate_limit_reserve": 0}
+    options.update(kwargs)
+    return AdaptiveScheduler(**options)
+
+
+def _success(forwarded):
+    return {"status": "success", "forwarded": forwarded}
+
+
+class TestAdaptiveScheduler:
+    """AdaptiveSchedulerのテスト"""
+
+    def test_first_run_uses_min_interval(self):
+        """最初の実行は到着ペースが分からないため下限の間隔で再実行する"""
+        scheduler = _scheduler()
+        assert scheduler.next_interval(_success(100), started=0, now=10) == 60
+        assert scheduler.rate is None
+
+    def test_fast_arrival_shortens_interval(self):
+        """到着ペースが速いと、1回あたり target_tweets 件になる間隔にする"""
+        scheduler = _scheduler(min_interval=10)
+        scheduler.next_interval(_success(0), started=0, now=1)
+        # 100秒で50件 → 0.5件/秒 → 5件なら10秒
+        assert scheduler.next_interval(_success(50), started=100, now=101) == 10
+        assert scheduler.rate == 0.5
+
+    def test_quiet_backs_off_to_max(self):
+        """ツイートがない間は間隔が延び、上限で止まる"""
+        scheduler = _scheduler()
+        scheduler.next_interval(_success(0), started=0, now=0)
+        scheduler.next_interval(_success(5), started=60, now=60)
+        intervals = []
+        started = 60
+        for _ in range(10):
+            started += intervals[-1] if intervals else 60
+            intervals.append(scheduler.next_interval(_success(0), started=started, now=started))
+
+        assert intervals == sorted(intervals)
+        assert intervals[0] > 60
+        assert intervals[-1] == 3600
+
+    def test_no_tweets_ever_uses_max(self):
+        """到着ペースが0の場合は上限の間隔"""
+        scheduler = _scheduler()
+        scheduler.next_interval(_success(0), started=0, now=0)
+        assert scheduler.next_interval(_success(0), started=60, now=60) == 3600
+
+    def test_rate_limit_spreads_remaining_calls(self):
+        """残り回数をリセット時刻までに使い切らない間隔より短くしない"""
+        scheduler = _scheduler(min_interval=1, rate_limit_reserve=2)
+        scheduler.next_interval(_success(0), started=0, now=0, rate_limit=RateLimitStatus(450, 12, 900))
+        # 1回の実行で2回呼び出し（12 → 10）、残り8回（予備2回を除く）で800秒 → 4回分 → 200秒
+        interval = scheduler.next_interval(_success(1000), started=100, now=100, rate_limit=RateLimitStatus(450, 10, 900))
+        assert scheduler.calls_per_run == 2
+        assert interval == 200
+
+    def test_rate_limit_exhausted_waits_until_reset(self):
+        """残り回数がなければリセット時刻まで待つ（上限を超えてもよい）"""
+        scheduler = _scheduler(max_interval=100)
+        interval = scheduler.next_interval(_success(0), started=0, now=0, rate_limit=RateLimitStatus(450, 0, 900))
+        assert interval == 900
+
+    def test_deferred_waits_until_resume(self):
+        """レート制限で延期された場合は再開時刻まで待つ"""
+        scheduler = _scheduler()
+        result = {"status": "deferred", "forwarded": 0, "deferred_until": 1000}
+        assert scheduler.next_interval(result, started=0, now=200) == 800
+
+    def test_failure_doubles_interval(self):
+        """失敗した場合は間隔を倍にしていく"""
+        scheduler = _scheduler()
+        assert scheduler.next_interval(None) == 120
+        assert scheduler.next_interval(None) == 240
+
+
+class TestRunScheduler:
+    """run_schedulerのテスト"""
+
+    def test_runs_until_stopped(self):
+        """停止するまで繰り返し実行し、失敗しても続ける"""
+        stop_event = threading.Event()
+        calls = []
+
+        def run_once():
+            calls.append(True)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            if len(calls) == 3:
+                stop_event.set()
+            return _success(1)
+
+        run_scheduler(run_once, stop_event, scheduler=_scheduler(min_interval=0, max_interval=0))
+        assert len(calls) == 3
+
+    def test_passes_rate_limit_status(self):
+        """直近のレート制限の状態を間隔の計算に使う"""
+        stop_event = threading.Event()
+        status = RateLimitStatus(450, 0, 0)
+        seen = []
+
+        class RecordingScheduler(AdaptiveScheduler):
+            def next_interval(self, result=None, started=None, rate_limit=None, now=None):
+                seen.append(rate_limit)
+                stop_event.set()
+                return 0
+
+        run_scheduler(lambda: _success(0), stop_event, scheduler=RecordingScheduler(), get_rate_limit=lambda: status)
+        assert seen == [status]
@@ -0,0 +1,162 @@
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append("src")
+
+from src.server import BotHandler, SingleFlight, metrics, start_stream
+
+
+@pytest.fixture
+def server_url():
+    """テスト用にHTTPサーバーをバックグラウンドで起動"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BotHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _request(url, method="GET"):
+    req = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)  # noqa: S310
+    try:
+        with urllib.request.urlopen(req, timeout=5) as res:  # noqa: S310
+            return res.status, res.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+class TestSingleFlight:
+    """SingleFlightのテスト"""
+
+    def test_run_returns_result(self):
+        """処理結果が返されるテスト"""
+        assert SingleFlight().run(lambda: {"status": "success"}) == (True, {"status": "success"}, False)
+
+    def test_run_propagates_error(self):
+        """処理の例外が呼び出し元に伝播するテスト"""
+
+        def fail():
+            raise RuntimeError("failed")
+
+        single_flight = SingleFlight()
+        with pytest.raises(RuntimeError):
+            single_flight.run(fail)
+        assert not single_flight.running
+
+    def test_concurrent_calls_are_coalesced(self):
+        """実行中の呼び出しは同じ実行に合流し、処理は1回だけ実行されるテスト"""
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "done"
+
+        leader_result = []
+        leader = threading.Thread(target=lambda: leader_result.append(single_flight.run(work)))
+        leader.start()
+        started.wait(5)
+
+        # 待機しない場合は即座に未完了を返す
+        assert single_flight.run(work, join_timeout=0) == (False, None, True)
+
+        joiner_result = []
+        joiner = threading.Thread(target=lambda: joiner_result.append(single_flight.run(work, join_timeout=5)))
+        joiner.start()
+        release.set()
+        leader.join(5)
+        joiner.join(5)
+
+        assert calls == [1]
+        assert leader_result == [(True, "done", False)]
+        assert joiner_result == [(True, "done", True)]
+
+
+class TestBotHandler:
+    """BotHandlerのテスト"""
+
+    def test_get(self, server_url):
+        """GETリクエストのテスト"""
+        assert _request(server_url) == (200, "ASAI X Bot is running")
+
+    def test_get_metrics(self, server_url):
+        """GET /metrics でPrometheus形式のメトリクスを返すテスト"""
+        status, body = _request(f"{server_url}/metrics")
+
+        assert status == 200
+        assert "# TYPE asai_x_bot_x_api_requests_total counter" in body
+        assert "# TYPE asai_x_bot_run_seconds histogram" in body
+
+    def test_post_success(self, server_url):
+        """POSTリクエストで実行結果を返すテスト"""
+        with patch("src.server.run_bot", return_value={"status": "success", "forwarded": 2}):
+            status, body = _request(server_url, "POST")
+
+        assert status == 200
+        assert json.loads(body) == {"status": "success", "forwarded": 2}
+
+    def test_post_error(self, server_url):
+        """実行失敗時に500を返すテスト"""
+        with patch("src.server.run_bot", side_effect=RuntimeError('bad "value"')):
+            status, body = _request(server_url, "POST")
+
+        assert status == 500
+        assert json.loads(body) == {"status": "error", "message": 'bad "value"'}
+
+    def test_get_and_post_while_running(self, server_url):
+        """実行中でもGETは即座に応答し、重複したPOSTには202を返すテスト"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def run_bot():
+            started.set()
+            release.wait(5)
+            return {"status": "success", "forwarded": 0}
+
+        with patch("src.server.run_bot", side_effect=run_bot) as mock_run_bot:
+            results = []
+            first = threading.Thread(target=lambda: results.append(_request(server_url, "POST")))
+            first.start()
+            assert started.wait(5)
+
+            assert _request(server_url) == (200, "ASAI X Bot is running")
+            status, body = _request(server_url, "POST")
+            assert status == 202
+            assert json.loads(body) == {"status": "running"}
+
+            release.set()
+            first.join(5)
+
+        assert results[0][0] == 200
+        mock_run_bot.assert_called_once()
+
+
+class TestStartStream:
+    """ストリームモードのスレッドのテスト"""
+
+    def test_restarts_after_crash(self):
+        """ストリームモードが異常終了した場合は再開し、停止を指示されたら終了するテスト"""
+        stop_event = threading.Event()
+        restarts = metrics.stream_restarts.value()
+
+        with (
+            patch("src.server.STREAM_RESTART_WAIT", 0),
+            patch("src.server.stream_and_forward", side_effect=[RuntimeError("boom"), None]) as mock_stream,
+        ):
+            start_stream(stop_event).join(5)
+
+        assert mock_stream.call_count == 2
+        assert metrics.stream_restarts.value() == restarts + 1
@@ -0,0 +1,70 @@
+import datetime
+import sys
+
+import pytest
+
+sys.path.append("src")
+
+from src.snowflake import (
+    TWITTER_EPOCH_MS,
+    compare,
+    id_for_time,
+    max_id,
+    sort_ids,
+    sort_key,
+    timestamp_ms,
+    timestamps_ms,
+    to_datetime,
+)
+
+# 2022-01-01 00:00:00 UTC 頃のツイートID
+TWEET_ID = "1477086455216119808"
+
+
+class TestSnowflake:
+    """snowflakeモジュールのテスト"""
+
+    def test_sort_ids_numeric(self):
+        """桁数が異なるIDを数値の順に並べ替えるテスト"""
+        assert sort_ids(["100", "99", "1000"]) == ["99", "100", "1000"]
+        assert sort_ids(["100", "99", "1000"], reverse=True) == ["1000", "100", "99"]
+
+    def test_max_id(self):
+        """最も新しいIDを数値で求めるテスト"""
+        assert max_id(["99", "100"]) == "100"
+        assert max_id([]) is None
+
+    def test_compare(self):
+        """IDの比較テスト"""
+        assert compare("99", "100") < 0
+        assert compare("100", "100") == 0
+        assert compare("1000", "100") > 0
+        assert sort_key("0100") == 100
+
+    def test_timestamp(self):
+        """IDから生成時刻を取り出すテスト"""
+        assert timestamp_ms("0") == TWITTER_EPOCH_MS
+        assert to_datetime(TWEET_ID).date() == datetime.date(2022, 1, 1)
+
+    def test_timestamps_batch(self):
+        """複数のIDの生成時刻をまとめて取り出すテスト"""
+        ids = [TWEET_ID, "0"]
+        assert timestamps_ms(ids) == [timestamp_ms(i) for i in ids]
+
+    def test_id_for_time_roundtrip(self):
+        """指定時刻のIDを作り、同じ時刻に戻せるテスト"""
+        when = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.UTC)
+        tweet_id = id_for_time(when)
+
+        assert to_datetime(tweet_id) == when
+        assert id_for_time(when.timestamp()) == tweet_id
+        assert id_for_time(when.replace(tzinfo=None)) == tweet_id
+
+    def test_id_for_time_orders_with_tweets(self):
+        """指定時刻のIDはその時刻のツイートID以下になるテスト"""
+        assert compare(id_for_time(to_datetime(TWEET_ID)), TWEET_ID) <= 0
+
+    def test_id_for_time_before_epoch(self):
+        """Twitter epoch より前の時刻は例外となるテスト"""
+        with pytest.raises(ValueError, match="epoch"):
+            id_for_time(0)
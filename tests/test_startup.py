@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET = json.loads((ROOT / "benchmarks" / "import_budget.json").read_text(encoding="utf-8"))
+
+
+class TestStartup:
+    """起動時のインポートのテスト"""
+
+    @pytest.mark.parametrize("entrypoint", sorted(BUDGET["entrypoints"]))
+    def test_entrypoint_does_not_import_forbidden_modules(self, entrypoint):
+        """エントリーポイントのインポート時に重い依存関係を読み込まないテスト"""
+        code = f"import json, sys; import {entrypoint}; print(json.dumps(sorted(sys.modules)))"
+        proc = subprocess.run(  # noqa: S603
+            [sys.executable, "-c", code],
+            cwd=ROOT / "src",
+            env={**os.environ, "K_SERVICE": "test-service"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        for prefix in BUDGET["forbidden_modules"]:
+            assert not [name for name in loaded if name == prefix or name.startswith(f"{prefix}.")]
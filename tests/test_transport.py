@@ -0,0 +1,54 @@
+import sys
+
+import responses
+
+sys.path.append("src")
+
+from src import transport
+
+
+class TestTransport:
+    """transportモジュールのテスト"""
+
+    def setup_method(self):
+        transport.close_sessions()
+
+    def teardown_method(self):
+        transport.close_sessions()
+
+    def test_get_session_reused_per_host(self):
+        """同じホストには同じセッションが返されるテスト"""
+        first = transport.get_session("https://api.x.com/2/tweets/search/recent?query=a")
+        second = transport.get_session("https://api.x.com/2/tweets/search/recent?query=b")
+        assert first is second
+
+    def test_get_session_separate_per_host(self):
+        """異なるホストには別のセッションが返されるテスト"""
+        x_session = transport.get_session("https://api.x.com/2/tweets/search/recent")
+        discord_session = transport.get_session("https://discord.com/api/webhooks/1/a")
+        assert x_session is not discord_session
+
+    def test_session_adapter_configuration(self):
+        """接続プールと再試行設定がアダプターに反映されるテスト"""
+        session = transport.get_session("https://api.x.com/")
+        adapter = session.get_adapter("https://api.x.com/")
+
+        assert adapter._pool_maxsize == transport.HTTP_POOL_SIZE
+        assert adapter.max_retries.total == transport.HTTP_MAX_RETRIES
+        assert "POST" not in adapter.max_retries.allowed_methods
+
+    @responses.activate
+    def test_request_passes_timeout(self):
+        """リクエストにタイムアウトが渡されるテスト"""
+        responses.add(responses.GET, "https://api.x.com/ping", status=200)
+
+        res = transport.request("GET", "https://api.x.com/ping", timeout=5)
+
+        assert res.status_code == 200
+        assert responses.calls[0].request.req_kwargs["timeout"] == 5
+
+    def test_close_sessions(self):
+        """close_sessionsでセッションが破棄されるテスト"""
+        first = transport.get_session("https://discord.com/")
+        transport.close_sessions()
+        assert transport.get_session("https://discord.com/") is not first
@@ -1,3 +1,4 @@
+import datetime
 import os
 import sys
 import tempfile
@@ -7,20 +8,41 @@ from unittest.mock import MagicMock, patch
 if "src" not in sys.path:
     sys.path.append("src")
 
+from src.snowflake import id_for_time  # noqa: E402
 from src.utils import (  # noqa: E402
     _load_since_id_from_file,
     _load_since_id_from_secret_manager,
     _save_since_id_to_file,
     _save_since_id_to_secret_manager,
     build_index,
+    compact_secret_versions,
+    is_since_id_valid,
+    load_backfill,
+    load_deferred_until,
+    load_delivered_ids,
+    load_quota_state,
     load_since_id,
+    load_state,
+    reset_secret_manager_cache,
+    save_backfill,
+    save_deferred_until,
+    save_delivered_ids,
+    save_quota_state,
     save_since_id,
+    save_state,
+    schedule_secret_compaction,
 )
 
 
 class TestUtils:
     """utilsモジュールのテスト"""
 
+    def setup_method(self):
+        reset_secret_manager_cache()
+
+    def teardown_method(self):
+        reset_secret_manager_cache()
+
     def test_build_index_with_default_key(self):
         """デフォルトキーでのインデックス構築テスト"""
         data = [{"id": "1", "name": "item1"}, {"id": "2", "name": "item2"}]
@@ -101,7 +123,17 @@ class TestUtils:
         finally:
             os.unlink(tmp_path)
 
-    @patch("src.utils.secretmanager.SecretManagerServiceClient")
+    def test_save_and_load_quota_state(self, tmp_path):
+        """呼び出し枠・読み取り予算の状態の保存・読み込みテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_quota_state() == {}
+            save_quota_state({"tokens": 10, "month": "2026-10", "tweets_read": 5})
+            assert load_quota_state() == {"tokens": 10, "month": "2026-10", "tweets_read": 5}
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
     def test_load_since_id_from_secret_manager_success(self, mock_client_class):
         """Secret Managerからの正常な読み込みテスト"""
         mock_client = MagicMock()
@@ -118,7 +150,7 @@ class TestUtils:
             result = _load_since_id_from_secret_manager()
             assert result == "secret_id_123"
 
-    @patch("src.utils.secretmanager.SecretManagerServiceClient")
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
     def test_load_since_id_from_secret_manager_exception(self, mock_client_class):
         """Secret Managerからの読み込み失敗テスト"""
         mock_client = MagicMock()
@@ -132,7 +164,7 @@ class TestUtils:
             result = _load_since_id_from_secret_manager()
             assert result is None
 
-    @patch("src.utils.secretmanager.SecretManagerServiceClient")
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
     def test_save_since_id_to_secret_manager_new_secret(self, mock_client_class):
         """新しいシークレット作成時の保存テスト"""
         mock_client = MagicMock()
@@ -191,7 +223,7 @@ class TestUtils:
             patch("src.utils._save_since_id_to_file") as mock_file_save,
         ):
             save_since_id("test_id")
-            mock_secret_save.assert_called_once_with("test_id")
+            mock_secret_save.assert_called_once_with("test_id", None)
             mock_file_save.assert_not_called()
 
     def test_save_since_id_local_environment(self):
@@ -201,7 +233,7 @@ class TestUtils:
             patch("src.utils._save_since_id_to_file") as mock_file_save,
         ):
             save_since_id("test_id")
-            mock_file_save.assert_called_once_with("test_id")
+            mock_file_save.assert_called_once_with("test_id", None)
 
     def test_load_since_id_invalid_cloud_run(self):
         """Cloud Run環境で無効なsince_idの場合のテスト"""
@@ -226,3 +258,261 @@ class TestUtils:
         ):
             result = load_since_id()
             assert result is None
+
+    def test_save_and_load_state_file(self, tmp_path):
+        """ローカル環境での状態の保存・読み込みテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            save_state("test", {"value": 1})
+            assert load_state("test") == {"value": 1}
+            assert (tmp_path / "test.json").exists()
+
+    def test_load_state_missing_returns_default(self, tmp_path):
+        """状態が存在しない場合にデフォルト値を返すテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_state("missing", {}) == {}
+
+    def test_load_state_invalid_json(self, tmp_path):
+        """状態ファイルが壊れている場合にデフォルト値を返すテスト"""
+        (tmp_path / "broken.json").write_text("{not json")
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_state("broken") is None
+
+    def test_state_cloud_run_environment(self):
+        """Cloud Run環境では状態をSecret Managerに保存・読み込みするテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch.dict(os.environ, {"K_SERVICE": "test-service"}),
+            patch("src.utils._add_secret_version") as mock_add,
+            patch("src.utils._access_secret", return_value='{"value":2}') as mock_access,
+        ):
+            save_state("test", {"value": 2})
+            assert load_state("test") == {"value": 2}
+
+        mock_add.assert_called_once_with('{"value":2}', "asai-x-bot-state-test")
+        mock_access.assert_called_once_with("asai-x-bot-state-test")
+
+    def test_save_and_load_deferred_until(self, tmp_path):
+        """レート制限の再開時刻の保存・読み込みテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_deferred_until() is None
+            save_deferred_until(1640995200)
+            assert load_deferred_until() == 1640995200
+
+    def test_is_since_id_valid(self):
+        """since_id が7日以内かどうかの判定テスト"""
+        now = datetime.datetime.now(datetime.UTC)
+        assert is_since_id_valid(id_for_time(now - datetime.timedelta(days=1)))
+        assert not is_since_id_valid(id_for_time(now - datetime.timedelta(days=8)))
+        assert not is_since_id_valid("")
+        assert not is_since_id_valid("invalid")
+
+    def test_save_and_load_delivered_ids(self, tmp_path):
+        """配信済みツイートIDのクエリごとの保存・読み込みテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_delivered_ids() == []
+            save_delivered_ids(["1", "2"])
+            save_delivered_ids(["3"], "official")
+            assert load_delivered_ids("default") == ["1", "2"]
+            assert load_delivered_ids("official") == ["3"]
+            assert (tmp_path / "delivered-official.json").exists()
+
+    def test_save_and_load_backfill(self, tmp_path):
+        """取得しなかった範囲のクエリごとの保存・読み込みテスト（None で取得済み）"""
+        window = {"since_id": "100", "until_id": "120"}
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_backfill() is None
+            save_backfill(window, "official")
+            assert load_backfill("official") == window
+            save_backfill(None, "official")
+            assert load_backfill("official") is None
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_secret_manager_client_is_reused(self, mock_client_class):
+        """Secret Manager クライアントが使い回されるテスト"""
+        mock_client = mock_client_class.return_value
+        mock_client.add_secret_version.return_value.name = "versions/1"
+
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch("src.utils.SECRET_CACHE_ENABLED", False),
+        ):
+            _load_since_id_from_secret_manager()
+            _save_since_id_to_secret_manager("1")
+            _load_since_id_from_secret_manager()
+
+        mock_client_class.assert_called_once()
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_secret_manager_rpcs_per_run(self, mock_client_class):
+        """1回の実行あたり読み込み1回・書き込み1回で済み、ウォームインスタンスでは読み込みも省略するテスト"""
+        mock_client = mock_client_class.return_value
+        mock_client.access_secret_version.return_value.payload.data.decode.return_value = "100"
+        mock_client.add_secret_version.return_value.name = "versions/2"
+
+        with patch("src.utils.PROJECT_ID", "test-project"):
+            # 1回目の実行（コールドスタート）
+            assert _load_since_id_from_secret_manager() == "100"
+            _save_since_id_to_secret_manager("200")
+            # 2回目の実行（ウォームインスタンス）
+            assert _load_since_id_from_secret_manager() == "200"
+            _save_since_id_to_secret_manager("300")
+
+        assert mock_client.access_secret_version.call_count == 1
+        mock_client.get_secret.assert_not_called()
+        assert mock_client.add_secret_version.call_count == 2
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_missing_state_secret_cached(self, mock_client_class, tmp_path):
+        """存在しない状態のシークレットは1回だけ読み込みを試し、以降はRPCを行わないテスト"""
+        from google.api_core import exceptions as gcp_exceptions
+
+        mock_client = mock_client_class.return_value
+        mock_client.access_secret_version.side_effect = gcp_exceptions.NotFound("missing")
+
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch.dict(os.environ, {"K_SERVICE": "test-service"}),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+        ):
+            assert load_state("quota", {}) == {}
+            assert load_state("quota", {}) == {}
+
+        mock_client.access_secret_version.assert_called_once()
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_secret_exists_checked_once(self, mock_client_class):
+        """シークレットの存在確認は初回のみ行われるテスト"""
+        mock_client = mock_client_class.return_value
+        mock_client.add_secret_version.return_value.name = "versions/1"
+
+        with patch("src.utils.PROJECT_ID", "test-project"):
+            _save_since_id_to_secret_manager("1")
+            _save_since_id_to_secret_manager("2")
+
+        mock_client.get_secret.assert_called_once()
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_secret_cache_disabled(self, mock_client_class):
+        """キャッシュ無効時は毎回Secret Managerから読み込むテスト"""
+        mock_client = mock_client_class.return_value
+        mock_client.access_secret_version.return_value.payload.data.decode.return_value = "100"
+
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch("src.utils.SECRET_CACHE_ENABLED", False),
+        ):
+            _load_since_id_from_secret_manager()
+            _load_since_id_from_secret_manager()
+
+        assert mock_client.access_secret_version.call_count == 2
+
+    @patch("google.cloud.secretmanager.SecretManagerServiceClient")
+    def test_save_skipped_when_unchanged(self, mock_client_class):
+        """値に変更がない場合はバージョンを追加しないテスト"""
+        mock_client = mock_client_class.return_value
+        mock_client.access_secret_version.return_value.payload.data.decode.return_value = "100"
+
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch("src.utils.schedule_secret_compaction"),
+        ):
+            _load_since_id_from_secret_manager()
+            _save_since_id_to_secret_manager("100")
+
+        mock_client.add_secret_version.assert_not_called()
+
+    def test_compact_secret_versions_destroy(self):
+        """保持数を超えた古いバージョンを破棄するテスト"""
+        mock_client = MagicMock()
+        versions = [MagicMock() for _ in range(5)]
+        for i, version in zip([3, 5, 1, 4, 2], versions, strict=True):
+            version.name = f"projects/p/secrets/s/versions/{i}"
+        mock_client.list_secret_versions.return_value = versions
+
+        with (
+            patch("src.utils._get_secret_manager_client", return_value=mock_client),
+            patch("src.utils.PROJECT_ID", "p"),
+        ):
+            pruned = compact_secret_versions("s", retention=2, action="destroy")
+
+        assert pruned == 3
+        destroyed = [c.kwargs["request"]["name"] for c in mock_client.destroy_secret_version.call_args_list]
+        assert destroyed == [f"projects/p/secrets/s/versions/{i}" for i in (3, 2, 1)]
+        assert mock_client.list_secret_versions.call_args.kwargs["request"]["filter"] == "NOT state:DESTROYED"
+
+    def test_compact_secret_versions_disable(self):
+        """disable指定時は古いバージョンを無効化するテスト"""
+        mock_client = MagicMock()
+        version = MagicMock()
+        version.name = "projects/p/secrets/s/versions/1"
+        newer = MagicMock()
+        newer.name = "projects/p/secrets/s/versions/2"
+        mock_client.list_secret_versions.return_value = [newer, version]
+
+        with patch("src.utils._get_secret_manager_client", return_value=mock_client):
+            assert compact_secret_versions("s", retention=1, action="disable") == 1
+
+        mock_client.disable_secret_version.assert_called_once_with(request={"name": "projects/p/secrets/s/versions/1"})
+        mock_client.destroy_secret_version.assert_not_called()
+
+    def test_schedule_secret_compaction_throttled(self):
+        """古いバージョンの整理はバックグラウンドで実行され、間隔内は再実行されないテスト"""
+        with patch("src.utils.compact_secret_versions") as mock_compact:
+            thread = schedule_secret_compaction("s")
+            assert thread is not None
+            thread.join(5)
+            assert schedule_secret_compaction("s") is None
+
+        mock_compact.assert_called_once_with("s")
+
+    def test_schedule_secret_compaction_disabled(self):
+        """保持数が0の場合は整理しないテスト"""
+        with patch("src.utils.SECRET_VERSION_RETENTION", 0):
+            assert schedule_secret_compaction("s") is None
+
+    def test_since_id_per_query_file(self, tmp_path):
+        """クエリごとに別のファイルへsince_idを保存するテスト"""
+        default_file = tmp_path / "since_id.txt"
+        with (
+            patch("src.utils.PROJECT_ID", None),
+            patch("src.utils.STATE_FILE", str(default_file)),
+            patch("src.utils.STATE_DIR", str(tmp_path)),
+            patch("src.utils.is_since_id_valid", return_value=True),
+        ):
+            save_since_id("100")
+            save_since_id("200", "members")
+
+            assert load_since_id() == "100"
+            assert load_since_id("default") == "100"
+            assert load_since_id("members") == "200"
+
+        assert (tmp_path / "since_id-members.txt").read_text() == "200"
+
+    def test_since_id_per_query_secret_manager(self):
+        """クエリごとに別のシークレットへsince_idを保存するテスト"""
+        with (
+            patch("src.utils.PROJECT_ID", "test-project"),
+            patch.dict(os.environ, {"K_SERVICE": "test-service"}),
+            patch("src.utils._save_since_id_to_secret_manager") as mock_secret_save,
+        ):
+            save_since_id("200", "members")
+
+        mock_secret_save.assert_called_once_with("200", "asai-x-bot-since-id-members")
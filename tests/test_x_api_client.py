@@ -7,12 +7,29 @@ import responses
 
 sys.path.append("src")
 
+from src.quota import QuotaManager
 from src.x_api_client import (
+    BudgetExhaustedError,
+    RateLimitError,
+    RateLimitStatus,
+    count_recent_tweets,
     fetch_tweets,
+    get_rate_limit_reset,
+    get_rate_limit_status,
+    iter_tweet_pages,
     log_rate_limit_info,
+    metrics,
 )
 
 
+@pytest.fixture(autouse=True)
+def quota():
+    """テストごとに呼び出し枠・読み取り予算を初期化する"""
+    manager = QuotaManager(rate_limit=450, window=900, monthly_budget=0)
+    with patch("src.x_api_client.get_manager", return_value=manager):
+        yield manager
+
+
 class TestXApiClient:
     """x_api_clientモジュールのテスト"""
 
@@ -129,7 +146,37 @@ class TestXApiClient:
         ):
             result = fetch_tweets()
             assert result is None
-            mock_sleep.assert_called_once_with(900)
+            mock_sleep.assert_not_called()
+
+    @responses.activate
+    def test_iter_tweet_pages_rate_limit_raises_with_reset(self):
+        """レート制限時に再開可能時刻付きの例外を即座に送出するテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={"title": "Too Many Requests"},
+            status=429,
+            headers={"x-rate-limit-reset": "1640995200"},
+        )
+
+        rate_limited = metrics.rate_limited.value(api="x")
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            with pytest.raises(RateLimitError) as exc_info:
+                list(iter_tweet_pages())
+
+        assert exc_info.value.reset_at == 1640995200
+        assert metrics.rate_limited.value(api="x") == rate_limited + 1
+
+    def test_get_rate_limit_reset_missing_header(self):
+        """x-rate-limit-resetヘッダーがない場合は既定のウィンドウ後を返すテスト"""
+        mock_response = MagicMock()
+        mock_response.headers = {}
+
+        with patch("src.x_api_client.time.time", return_value=1000.0):
+            assert get_rate_limit_reset(mock_response) == 1900
 
     @responses.activate
     def test_fetch_tweets_http_error(self):
@@ -182,6 +229,154 @@ class TestXApiClient:
             with pytest.raises(ConnectionError):
                 fetch_tweets()
 
+    @responses.activate
+    def test_iter_tweet_pages_follows_next_token(self):
+        """next_tokenを辿って全ページを取得するテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={
+                "data": [{"id": "3", "author_id": "user1"}],
+                "includes": {"users": [{"id": "user1", "username": "first"}]},
+                "meta": {"next_token": "page2"},
+            },
+            status=200,
+        )
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={
+                "data": [{"id": "1", "author_id": "user2"}],
+                "includes": {"users": [{"id": "user2", "username": "second"}]},
+                "meta": {},
+            },
+            status=200,
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            pages = list(iter_tweet_pages(since_id="0"))
+
+        assert [p.tweets[0]["id"] for p in pages] == ["3", "1"]
+        assert "next_token=page2" in responses.calls[1].request.url
+
+    @responses.activate
+    def test_iter_tweet_pages_logs_payload_size(self):
+        """ページごと・合計のレスポンスサイズとフィールドのプロファイルをログ出力するテスト"""
+        body = '{"data": [{"id": "1"}, {"id": "2"}], "meta": {}}'
+        responses.add(responses.GET, "https://api.x.com/2/tweets/search/recent", body=body, status=200)
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+            patch("src.x_api_client.get_field_profile", return_value="minimal"),
+            patch("src.x_api_client.logger") as mock_logger,
+        ):
+            list(iter_tweet_pages())
+
+        messages = [call.args[0] for call in mock_logger.info.call_args_list]
+        size = len(body.encode())
+        assert f"X APIからのレスポンス取得成功: {size}バイト（2件、1件あたり {size // 2}バイト）" in messages
+        assert f"X APIのレスポンス合計: {size}バイト（1ページ / 2件、プロファイル: minimal）" in messages
+
+    @responses.activate
+    def test_fetch_tweets_merges_pages(self):
+        """複数ページのdataとincludesがまとめられるテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={
+                "data": [{"id": "3", "author_id": "user1"}],
+                "includes": {"users": [{"id": "user1", "username": "first"}]},
+                "meta": {"next_token": "page2"},
+            },
+            status=200,
+        )
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={
+                "data": [{"id": "1", "author_id": "user2"}],
+                "includes": {"users": [{"id": "user2", "username": "second"}]},
+            },
+            status=200,
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            result = fetch_tweets()
+
+        assert [t["id"] for t in result["data"]] == ["3", "1"]
+        assert [u["username"] for u in result["includes"]["users"]] == ["first", "second"]
+
+    @responses.activate
+    def test_iter_tweet_pages_max_pages(self):
+        """ページ数上限で取得を打ち切るテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={"data": [{"id": "3", "author_id": "user1"}], "meta": {"next_token": "more"}},
+            status=200,
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            pages = list(iter_tweet_pages(max_pages=2, until_id="100"))
+
+        assert len(pages) == 2
+        assert len(responses.calls) == 2
+        assert "until_id=100" in responses.calls[0].request.url
+        # 打ち切った最後のページのみ、より古いツイートが未取得であることを示す
+        assert [p.truncated for p in pages] == [False, True]
+
+    @responses.activate
+    def test_iter_tweet_pages_max_tweets(self):
+        """ツイート数上限でページを切り詰めて打ち切るテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={
+                "data": [{"id": str(i), "author_id": "user1"} for i in range(10, 0, -1)],
+                "meta": {"next_token": "more"},
+            },
+            status=200,
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            pages = list(iter_tweet_pages(max_pages=10, max_tweets=15))
+
+        assert [len(p.tweets) for p in pages] == [10, 5]
+        assert len(responses.calls) == 2
+        assert [p.truncated for p in pages] == [False, True]
+
+    @responses.activate
+    def test_rate_limit_status_recorded(self):
+        """直近のレスポンスのレート制限ヘッダーを記録するテスト"""
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={"data": []},
+            status=200,
+            headers={"x-rate-limit-limit": "450", "x-rate-limit-remaining": "449", "x-rate-limit-reset": "1700000000"},
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test"}),
+        ):
+            list(iter_tweet_pages())
+
+        assert get_rate_limit_status() == RateLimitStatus(limit=450, remaining=449, reset_at=1700000000)
+
     def test_log_rate_limit_info_all_headers(self):
         """すべてのレート制限ヘッダーが存在する場合のテスト"""
         mock_response = MagicMock()
@@ -212,3 +407,64 @@ class TestXApiClient:
         with patch("src.x_api_client.logger") as mock_logger:
             log_rate_limit_info(mock_response)
             assert mock_logger.info.call_count == 0
+
+    def test_quota_blocks_before_request(self, quota):
+        """呼び出し枠が残っていない場合は X API を呼ばずに RateLimitError を送出するテスト"""
+        quota.record_response(remaining=0, reset_at=4102444800)
+
+        with (
+            patch("src.x_api_client.transport.request") as mock_request,
+            pytest.raises(RateLimitError) as exc_info,
+        ):
+            list(iter_tweet_pages())
+
+        mock_request.assert_not_called()
+        assert exc_info.value.reset_at == 4102444801
+        assert metrics.quota_throttled.value(reason="rate_limit") >= 1
+
+    @responses.activate
+    def test_budget_limits_pages_and_page_size(self, quota):
+        """予算の残りが少ない場合は1ページ・残り件数分のみ取得し、読み取った件数を計上するテスト"""
+        quota.monthly_budget = 1000
+        quota.record_tweets(975)
+        responses.add(
+            responses.GET,
+            "https://api.x.com/2/tweets/search/recent",
+            json={"data": [{"id": str(i), "author_id": "user1"} for i in range(25)], "meta": {"next_token": "more"}},
+            status=200,
+        )
+
+        with (
+            patch("src.x_api_client.get_x_api_headers", return_value={}),
+            patch("src.x_api_client.get_x_api_params", return_value={"query": "test", "max_results": 100}),
+        ):
+            pages = list(iter_tweet_pages(max_pages=10, max_tweets=500))
+
+        assert len(pages) == 1
+        assert "max_results=25" in responses.calls[0].request.url
+        assert quota.tweet_allowance() == 0
+
+        with pytest.raises(BudgetExhaustedError):
+            list(iter_tweet_pages())
+
+    @responses.activate
+    def test_count_recent_tweets(self):
+        """件数APIのページをたどって since_id 以降のツイート数を合計するテスト"""
+        url = "https://api.x.com/2/tweets/counts/recent"
+        responses.add(responses.GET, url, json={"meta": {"total_tweet_count": 3, "next_token": "next"}}, status=200)
+        responses.add(responses.GET, url, json={"meta": {"total_tweet_count": 2}}, status=200)
+
+        with patch("src.x_api_client.get_x_api_headers", return_value={}):
+            assert count_recent_tweets("#浅井恋乃未", "123") == 5
+
+        assert "since_id=123" in responses.calls[0].request.url
+        assert "next_token=next" in responses.calls[1].request.url
+        assert metrics.count_prechecks.value(result="found") >= 1
+
+    @responses.activate
+    def test_count_recent_tweets_failure_returns_none(self):
+        """件数APIの取得に失敗した場合は None を返す（通常どおり検索する）テスト"""
+        responses.add(responses.GET, "https://api.x.com/2/tweets/counts/recent", json={}, status=429)
+
+        with patch("src.x_api_client.get_x_api_headers", return_value={}):
+            assert count_recent_tweets("#浅井恋乃未", "123") is None
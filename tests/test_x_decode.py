@@ -0,0 +1,70 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.append("src")
+
+from src.x_decode import DECODERS, Page, decode_page, index_page, loads, select_decoder
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PAYLOAD = {
+    "data": [
+        {"id": "2", "text": "photo", "author_id": "u1", "attachments": {"media_keys": ["3_1"]}},
+        {"id": "1", "text": "text", "author_id": "u2"},
+    ],
+    "includes": {
+        "users": [{"id": "u1", "username": "first"}, {"id": "u2", "username": "second"}],
+        "media": [{"media_key": "3_1", "type": "photo", "url": "https://pbs.twimg.com/media/1.jpg"}],
+    },
+    "meta": {"result_count": 2, "newest_id": "2"},
+}
+
+
+class TestXDecode:
+    """x_decodeモジュールのテスト"""
+
+    def test_decoders_always_include_stdlib(self):
+        """標準ライブラリのデコーダーは常に使え、auto は先頭の（最速の）デコーダーを選ぶ"""
+        assert "stdlib" in DECODERS
+        assert select_decoder("auto")[0] == next(iter(DECODERS))
+        assert select_decoder("stdlib") == ("stdlib", json.loads)
+
+    def test_select_unavailable_decoder_falls_back(self):
+        """インストールされていないデコーダーを指定した場合は自動で選ぶ"""
+        assert select_decoder("unknown")[0] == next(iter(DECODERS))
+
+    def test_every_decoder_gives_same_result(self):
+        """どのデコーダーでも bytes / str から同じ結果になる"""
+        content = json.dumps(PAYLOAD, ensure_ascii=False)
+        for decode in DECODERS.values():
+            assert decode(content.encode("utf-8")) == PAYLOAD
+            assert decode(content) == PAYLOAD
+        assert loads(content.encode("utf-8")) == PAYLOAD
+
+    def test_decode_page_indexes_includes(self):
+        """ツイート・ユーザー・メディアをIDで引ける Page にする"""
+        page = decode_page(json.dumps(PAYLOAD).encode("utf-8"))
+
+        assert [tweet["id"] for tweet in page.tweets] == ["2", "1"]
+        assert page.users["u2"]["username"] == "second"
+        assert page.media["3_1"]["type"] == "photo"
+        assert page.meta == {"result_count": 2, "newest_id": "2"}
+
+    def test_index_page_without_data(self):
+        """0件のレスポンス（data・includes なし）は空の Page になる"""
+        assert index_page({"meta": {"result_count": 0}}) == Page(meta={"result_count": 0})
+
+    def test_benchmark_runs(self):
+        """マイクロベンチマークがすべてのデコーダーを計測するテスト"""
+        proc = subprocess.run(  # noqa: S603
+            [sys.executable, str(ROOT / "benchmarks" / "json_decode.py"), "--iterations", "5"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert "stdlib + build_index" in proc.stdout
+        for name in DECODERS:
+            assert f"decode_page（{name}）" in proc.stdout
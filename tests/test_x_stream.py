@@ -0,0 +1,325 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append("src")
+
+from src.queries import QuerySpec
+from src.x_stream import (
+    HTTP_BACKOFF_MAX,
+    NETWORK_BACKOFF_MAX,
+    Backoff,
+    StreamRuleError,
+    build_rules,
+    iter_events,
+    open_stream,
+    run_stream,
+    sync_rules,
+)
+
+
+def _event(tweet_id, tag="default"):
+    return {
+        "data": {"id": tweet_id, "author_id": "1", "text": f"tweet {tweet_id}"},
+        "includes": {"users": [{"id": "1", "username": "user1"}]},
+        "matching_rules": [{"id": "r1", "tag": tag}],
+    }
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    """フィルタードストリームの代替（レスポンスを chunked で1行ずつ送る）"""
+
+    protocol_version = "HTTP/1.1"
+    fake: "FakeStreamServer"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.fake
+        if self.path.startswith("/stream/rules"):
+            self._send_json(200, {"data": fake.rules} if fake.rules else {"meta": {"result_count": 0}})
+            return
+
+        fake.paths.append(self.path)
+        response = fake.connections.pop(0) if fake.connections else (200, [])
+        status, lines = response[0], response[1]
+        if status != 200:
+            self._send_json(status, {"title": "error"}, response[2] if len(response) > 2 else None)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for line in lines:
+            # bytes はそのまま送る（切断の直前の途中までの行など）
+            data = (line if isinstance(line, bytes) else (json.dumps(line) if line else "").encode()) + b"\r\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        fake = self.fake
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        fake.posts.append(body)
+        if fake.rule_errors:
+            self._send_json(200, {"errors": fake.rule_errors})
+            return
+        if "delete" in body:
+            fake.rules = [rule for rule in fake.rules if rule["id"] not in body["delete"]["ids"]]
+        for rule in body.get("add", []):
+            fake.rules.append({"id": str(len(fake.posts) * 100 + len(fake.rules)), **rule})
+        self._send_json(200, {"meta": {"summary": {}}})
+
+
+class FakeStreamServer:
+    """
+    ローカルのフィルタードストリーム
+
+    connections: 接続ごとの応答 (ステータス, 送る行のリスト[, ヘッダー])。行が None の場合はキープアライブの空行、
+        bytes の場合はそのまま送る
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.rules = []
+        self.rule_errors = []
+        self.posts = []
+        self.paths = []
+        handler = type("Handler", (_StreamHandler,), {"fake": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/stream"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stream_server():
+    server = FakeStreamServer()
+    with (
+        patch("src.x_stream.STREAM_URL", server.url),
+        patch("src.x_stream.STREAM_RULES_URL", f"{server.url}/rules"),
+        patch("src.x_stream.STREAM_STALL_TIMEOUT", 5),
+        patch("src.x_stream.get_x_api_headers", return_value={"Authorization": "Bearer test"}),
+    ):
+        yield server
+    server.stop()
+
+
+class _RecordingBackoff(Backoff):
+    """待機せずに呼び出しを記録する Backoff"""
+
+    def __init__(self):
+        self.calls = []
+        super().__init__()
+
+    def reset(self):
+        self.calls.append("reset")
+
+    def network_error(self):
+        self.calls.append("network")
+        return 0
+
+    def http_error(self):
+        self.calls.append("http")
+        return 0
+
+    def rate_limited(self, reset_at=None):
+        self.calls.append(("rate_limited", reset_at))
+        return 0
+
+
+class TestBackoff:
+    """Backoffのテスト"""
+
+    def test_network_error_is_linear_and_capped(self):
+        """ネットワークエラーは250ミリ秒ずつ延び、上限で止まる"""
+        backoff = Backoff()
+        assert [backoff.network_error() for _ in range(3)] == [0.25, 0.5, 0.75]
+        for _ in range(100):
+            wait = backoff.network_error()
+        assert wait == NETWORK_BACKOFF_MAX
+
+    def test_http_error_is_exponential_and_capped(self):
+        """HTTPエラーは5秒から倍々に延び、上限で止まる"""
+        backoff = Backoff()
+        assert [backoff.http_error() for _ in range(4)] == [5, 10, 20, 40]
+        for _ in range(10):
+            wait = backoff.http_error()
+        assert wait == HTTP_BACKOFF_MAX
+
+    def test_rate_limited_waits_until_reset(self):
+        """レート制限は1分から倍々に延び、再開時刻の方が遅ければその時刻まで待つ"""
+        backoff = Backoff()
+        assert backoff.rate_limited() == 60
+        assert backoff.rate_limited() == 120
+        with patch("src.x_stream.time.time", return_value=1000):
+            assert backoff.rate_limited(reset_at=1500) == 500
+
+    def test_reset(self):
+        """接続に成功すると最初の待機時間に戻る"""
+        backoff = Backoff()
+        backoff.http_error()
+        backoff.network_error()
+        backoff.reset()
+        assert backoff.http_error() == 5
+        assert backoff.network_error() == 0.25
+
+
+class TestRules:
+    """ルールの作成・同期のテスト"""
+
+    def test_build_rules_tags_query_names(self):
+        """検索クエリごとにクエリ名をタグにしたルールを作り、重複した検索クエリは最初のクエリのみ"""
+        specs = [
+            QuerySpec(name="asai", queries=("#浅井恋乃未", "from:sakurazaka46")),
+            QuerySpec(name="official", queries=("from:sakurazaka46",)),
+        ]
+        assert build_rules(specs) == [
+            {"value": "#浅井恋乃未", "tag": "asai"},
+            {"value": "from:sakurazaka46", "tag": "asai"},
+        ]
+
+    def test_sync_rules_adds_and_deletes_difference(self, stream_server):
+        """不要なルールを削除してから、足りないルールのみ追加する"""
+        stream_server.rules = [
+            {"id": "1", "value": "old query", "tag": "default"},
+            {"id": "2", "value": "#浅井恋乃未", "tag": "default"},
+        ]
+        rules = [{"value": "#浅井恋乃未", "tag": "default"}, {"value": "from:sakurazaka46", "tag": "official"}]
+
+        assert sync_rules(rules) == (1, 1)
+        assert stream_server.posts == [
+            {"delete": {"ids": ["1"]}},
+            {"add": [{"value": "from:sakurazaka46", "tag": "official"}]},
+        ]
+        assert {(rule["value"], rule["tag"]) for rule in stream_server.rules} == {
+            ("#浅井恋乃未", "default"),
+            ("from:sakurazaka46", "official"),
+        }
+
+    def test_sync_rules_without_changes(self, stream_server):
+        """ルールが一致していれば更新しない"""
+        stream_server.rules = [{"id": "1", "value": "#浅井恋乃未", "tag": "default"}]
+        assert sync_rules([{"value": "#浅井恋乃未", "tag": "default"}]) == (0, 0)
+        assert stream_server.posts == []
+
+    def test_sync_rules_rejected(self, stream_server):
+        """X API がルールを拒否した場合は例外を送出"""
+        stream_server.rule_errors = [{"title": "Invalid Rule", "value": "bad("}]
+        with pytest.raises(StreamRuleError, match="Invalid Rule"):
+            sync_rules([{"value": "bad(", "tag": "default"}])
+
+
+class TestStream:
+    """ストリームの読み込み・再接続のテスト"""
+
+    def test_iter_events_skips_keep_alive(self, stream_server):
+        """キープアライブの空行を読み飛ばし、ツイートのみを返す"""
+        stream_server.connections = [(200, [None, _event("1"), None, None, _event("2"), {"errors": [{"title": "x"}]}])]
+        with open_stream() as res:
+            events = list(iter_events(res))
+
+        assert [event["data"]["id"] for event in events] == ["1", "2"]
+        # 検索APIのみのパラメータは送らない
+        assert "query=" not in stream_server.paths[0]
+        assert "max_results" not in stream_server.paths[0]
+        assert "tweet.fields" in stream_server.paths[0]
+
+    def test_run_stream_reconnects(self, stream_server):
+        """HTTPエラー・切断の後に再接続し、停止するまで読み続ける"""
+        stop_event = threading.Event()
+        stream_server.connections = [
+            (401, []),
+            (200, [_event("1"), None]),
+            (200, [None, _event("2")]),
+        ]
+        received = []
+        connects = []
+
+        def on_event(event):
+            received.append(event["data"]["id"])
+            if len(received) == 2:
+                stop_event.set()
+
+        backoff = _RecordingBackoff()
+        run_stream(on_event, stop_event, on_connect=lambda: connects.append(True), backoff=backoff)
+
+        assert received == ["1", "2"]
+        assert len(connects) == 2
+        assert backoff.calls == ["reset", "http", "reset", "network", "reset"]
+
+    def test_run_stream_rate_limited(self, stream_server):
+        """429 の場合は再開時刻を渡してレート制限の待機時間を使う"""
+        stop_event = threading.Event()
+        stream_server.connections = [
+            (429, [], {"x-rate-limit-reset": "1700000000"}),
+            (200, [_event("1")]),
+        ]
+        backoff = _RecordingBackoff()
+
+        run_stream(lambda _event: stop_event.set(), stop_event, backoff=backoff)
+
+        assert ("rate_limited", 1700000000) in backoff.calls
+
+    def test_run_stream_skips_partial_line(self, stream_server):
+        """切断の直前の途中までの行は読み飛ばして再接続する"""
+        stop_event = threading.Event()
+        stream_server.connections = [
+            (200, [_event("1"), b'{"data":{"id":"2","te']),
+            (200, [_event("3")]),
+        ]
+        received = []
+
+        def on_event(event):
+            received.append(event["data"]["id"])
+            if len(received) == 2:
+                stop_event.set()
+
+        backoff = _RecordingBackoff()
+        run_stream(on_event, stop_event, backoff=backoff)
+
+        assert received == ["1", "3"]
+        assert backoff.calls == ["reset", "reset", "network", "reset"]
+
+    def test_run_stream_reconnects_after_unexpected_error(self, stream_server):
+        """想定していないエラーでも停止せず、ネットワークエラーと同じく再接続する"""
+        stop_event = threading.Event()
+        stream_server.connections = [(200, [_event("1")]), (200, [_event("2")])]
+        received = []
+
+        def on_event(event):
+            if not received:
+                received.append("error")
+                raise RuntimeError("unexpected")
+            received.append(event["data"]["id"])
+            stop_event.set()
+
+        backoff = _RecordingBackoff()
+        run_stream(on_event, stop_event, backoff=backoff)
+
+        assert received == ["error", "2"]
+        assert backoff.calls == ["reset", "reset", "network", "reset"]